@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+This module saves output files safely: everything is written to a
+temporary file next to the output, which is only moved into place once
+it's complete, so a crash can never leave a half written sheet behind.
+If the new output is exactly the same as what's already there, the old
+file is left alone so its modification time doesn't change.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import stat
+import tempfile
+
+from swap_log import LOG
+
+# how much output to collect before writing it to the disk
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+# how much of two files to compare at a time
+COMPARE_BLOCK_SIZE = 1024 * 1024
+
+# when to make sure output has really been written to the disk (rather than
+# just handed to the operating system) before moving on
+FSYNC_NEVER  = "never"  # leave it up to the operating system
+FSYNC_FILE   = "file"   # sync each file before it's moved into place
+FSYNC_ALWAYS = "always" # also sync the directory after it's been moved
+FSYNC_POLICIES = [FSYNC_NEVER, FSYNC_FILE, FSYNC_ALWAYS]
+
+# the policy used when one isn't given, see set_fsync_policy
+_fsync_policy = FSYNC_NEVER
+
+# the permissions a new file would normally get (there's no way to read
+# the umask without setting it, so this is done once when we're loaded)
+_umask = os.umask(0)
+os.umask(_umask)
+NEW_FILE_MODE = 0o666 & ~_umask
+
+def set_fsync_policy (policy) :
+    """
+    set the fsync policy (one of FSYNC_POLICIES) used by
+    AtomicOutputFiles when they aren't given one
+    """
+
+    global _fsync_policy
+
+    if policy not in FSYNC_POLICIES :
+        raise ValueError("Unknown fsync policy " + str(policy) + ", expected one of: " + ", ".join(FSYNC_POLICIES))
+
+    _fsync_policy = policy
+
+def get_fsync_policy () :
+    """
+    get the fsync policy used by AtomicOutputFiles when they aren't given one
+    """
+
+    return _fsync_policy
+
+def same_file_contents (first_path, second_path) :
+    """
+    check whether the files at the two paths have exactly the same contents
+    (files of different sizes are never read)
+    """
+
+    try :
+        if os.path.getsize(first_path) != os.path.getsize(second_path) :
+            return False
+    except OSError :
+        return False
+
+    first_file  = open(first_path,  "rb")
+    second_file = open(second_path, "rb")
+    try :
+        while True :
+            first_block  = first_file.read(COMPARE_BLOCK_SIZE)
+            second_block = second_file.read(COMPARE_BLOCK_SIZE)
+            if first_block != second_block :
+                return False
+            if not first_block :
+                return True
+    finally :
+        first_file.close()
+        second_file.close()
+
+class AtomicOutputFile :
+    """
+    An output file that's written to a temporary file in the same directory
+    and moved into place when it's closed.
+
+    mode and any other keyword arguments are passed on to open, and writes
+    are buffered in blocks of buffer_size. When the file is closed, if
+    skip_unchanged is True and there's already a file at path with exactly
+    the same contents, the temporary file is removed instead. Calling
+    discard (or leaving a with block because of an exception) removes the
+    temporary file without touching path.
+
+    The file object for the temporary file is available as file, for
+    things that need a real file (like zipfile.ZipFile).
+    """
+
+    def __init__ (self, path, mode="w", fsync=None, buffer_size=OUTPUT_BUFFER_SIZE, skip_unchanged=True, **open_args) :
+
+        self.path           = path
+        self.fsync          = get_fsync_policy() if fsync is None else fsync
+        self.skip_unchanged = skip_unchanged
+        self.closed         = False
+
+        if self.fsync not in FSYNC_POLICIES :
+            raise ValueError("Unknown fsync policy " + str(self.fsync) + ", expected one of: " + ", ".join(FSYNC_POLICIES))
+
+        temp_fd, self.temp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp",
+                                                   dir=os.path.dirname(os.path.abspath(path)))
+        try :
+            self.file = os.fdopen(temp_fd, mode, buffering=buffer_size, **open_args)
+        except :
+            os.close(temp_fd)
+            os.remove(self.temp_path)
+            raise
+
+    def write (self, data) :
+
+        return self.file.write(data)
+
+    def close (self) :
+        """
+        move the finished output into place (unless it's the same as what's
+        already there)
+
+        returns True if the output was saved, or False if it was unchanged
+        """
+
+        if self.closed :
+            return False
+        self.closed = True
+
+        try :
+            self.file.flush()
+
+            if self.skip_unchanged and same_file_contents(self.temp_path, self.path) :
+                LOG.debug("Output is unchanged, leaving it alone: %s", self.path)
+                self.file.close()
+                os.remove(self.temp_path)
+                return False
+
+            if self.fsync != FSYNC_NEVER :
+                os.fsync(self.file.fileno())
+            self.file.close()
+
+            # give the new file the permissions the old one had, or that a new file would get
+            try :
+                mode = stat.S_IMODE(os.stat(self.path).st_mode)
+            except OSError :
+                mode = NEW_FILE_MODE
+            os.chmod(self.temp_path, mode)
+
+            os.replace(self.temp_path, self.path)
+        except :
+            self.file.close()
+            if os.path.exists(self.temp_path) :
+                os.remove(self.temp_path)
+            raise
+
+        if self.fsync == FSYNC_ALWAYS :
+            _fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+
+        return True
+
+    def discard (self) :
+        """
+        throw away the output without touching the file at path
+        """
+
+        if self.closed :
+            return
+        self.closed = True
+
+        self.file.close()
+        os.remove(self.temp_path)
+
+    def __enter__ (self) :
+
+        return self
+
+    def __exit__ (self, exception_type, exception, traceback) :
+
+        if exception_type is None :
+            self.close()
+        else :
+            self.discard()
+
+        return False
+
+def _fsync_directory (directory_path) :
+    """
+    make sure the changes to a directory's entries are on the disk (this
+    isn't possible everywhere, and it's skipped where it isn't)
+    """
+
+    try :
+        directory_fd = os.open(directory_path, os.O_RDONLY)
+    except OSError :
+        return
+
+    try :
+        os.fsync(directory_fd)
+    except OSError :
+        pass
+    finally :
+        os.close(directory_fd)
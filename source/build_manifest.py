@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+This module keeps track of what was built in an output directory so
+that the gender swap tool can skip sheets that don't need to be rebuilt.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+
+import atomic_output
+
+from swap_log import LOG
+
+MANIFEST_FILE_NAME = ".gender_swap_manifest.json"
+MANIFEST_VERSION   = 1
+
+def get_character_signature (gender_plan, character_number) :
+    """
+    get a summary of everything about a character that can change how
+    their gendered phrases are rendered, in a form that can be saved as json
+
+    Characters that aren't in the plan at all have a signature of None.
+    """
+
+    genderList = gender_plan.gender_list
+    position   = genderList.position(character_number)
+    if position < 0 :
+        return None
+
+    return [genderList.selected_indexes[position], genderList.option_counts[position]]
+
+class BuildManifest :
+    """
+    A record of the gendered sheets saved in one output directory.
+
+    For each output file this records the path and content hash of the
+    sheet it was built from and the signature (see get_character_signature)
+    of every character that sheet refers to, so the next build can tell
+    whether the output would change without gendering the sheet again.
+    """
+
+    def __init__ (self, output_path) :
+        """
+        load the manifest for the output_path directory, if there is one
+        """
+
+        self.output_path   = output_path
+        self.manifest_path = os.path.join(output_path, MANIFEST_FILE_NAME)
+
+        # output file name: {"source": path, "hash": hash, "characters": {number: signature}}
+        self.entries       = { }
+        # the output file names that were built or kept during this build
+        self.current_names = set( )
+
+        if os.path.exists(self.manifest_path) :
+            manifest_file = open(self.manifest_path, "r")
+            try :
+                manifest_data = json.load(manifest_file)
+            except ValueError :
+                LOG.warning("Unable to read build manifest, all sheets will be rebuilt: %s", self.manifest_path)
+                manifest_data = { }
+            manifest_file.close()
+
+            if manifest_data.get("version") == MANIFEST_VERSION :
+                self.entries = manifest_data.get("outputs", { })
+
+    def is_up_to_date (self, output_name, source_path, source_hash, gender_plan) :
+        """
+        check whether the output file output_name was built from the same
+        source contents and the same character genders we'd use now
+
+        if it was, it is marked as part of the current build
+        """
+
+        entry = self.entries.get(output_name)
+
+        if ( (entry is None) or
+             (entry["source"] != os.path.abspath(source_path)) or
+             (entry["hash"]   != source_hash) or
+             (not os.path.exists(os.path.join(self.output_path, output_name))) ) :
+            return False
+
+        for character_number, signature in entry["characters"].items() :
+            if get_character_signature(gender_plan, int(character_number)) != signature :
+                return False
+
+        self.current_names.add(output_name)
+
+        return True
+
+    def record (self, output_name, source_path, source_hash, character_numbers, gender_plan) :
+        """
+        record that output_name was built from the source with the given
+        hash, using the given set of character numbers
+        """
+
+        self.entries[output_name] = {
+                                        "source"     : os.path.abspath(source_path),
+                                        "hash"       : source_hash,
+                                        "characters" : dict([(str(number), get_character_signature(gender_plan, number))
+                                                             for number in character_numbers]),
+                                    }
+        self.current_names.add(output_name)
+
+    def remove_outputs_for_source (self, source_path, keep_name=None) :
+        """
+        delete any output files this manifest knows about that were built
+        from the sheet at source_path, other than the one named keep_name
+        (if it's given)
+
+        returns the list of output file names that were removed
+        """
+
+        source_path = os.path.abspath(source_path)
+        removed     = [ ]
+        for output_name in sorted(self.entries.keys()) :
+            if (self.entries[output_name]["source"] == source_path) and (output_name != keep_name) :
+                old_path = os.path.join(self.output_path, output_name)
+                if os.path.exists(old_path) :
+                    LOG.info("Removing output with no current source sheet: %s", old_path)
+                    os.remove(old_path)
+                del self.entries[output_name]
+                self.current_names.discard(output_name)
+                removed.append(output_name)
+
+        return removed
+
+    def remove_stale_outputs (self) :
+        """
+        delete any output files this manifest knows about that weren't
+        built or kept in the current build (because their source sheet is
+        gone, or because their gendered file name changed)
+
+        returns the list of output file names that were removed
+        """
+
+        removed = [ ]
+        for output_name in sorted(self.entries.keys()) :
+            if output_name not in self.current_names :
+                stale_path = os.path.join(self.output_path, output_name)
+                if os.path.exists(stale_path) :
+                    LOG.info("Removing output with no current source sheet: %s", stale_path)
+                    os.remove(stale_path)
+                del self.entries[output_name]
+                removed.append(output_name)
+
+        return removed
+
+    def save (self) :
+        """
+        save the manifest to the output directory
+        """
+
+        with atomic_output.AtomicOutputFile(self.manifest_path, "w") as manifest_file :
+            json.dump({ "version" : MANIFEST_VERSION, "outputs" : self.entries }, manifest_file,
+                      indent=1, sort_keys=True)
@@ -18,7 +18,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-# FUTURE some day all of these sets should be configured from an external file
+import os
 
 # constants for possible genders this program understands
 FEMALE_GENDER         = "female"
@@ -27,11 +27,12 @@ NEUTRAL_THEY_GENDER   = "neutral they"
 NEUTRAL_ZE_GENDER     = "neutral ze"
 
 # the expected pronoun sets for the genders this program understands
+# (more can be added, or these replaced, in a pronoun config file; see pronoun_sets)
 EXPECTED_FEMALE_WORDS = {"she",  "her",  "hers",            "herself"}
 EXPECTED_MALE_WORDS   = {"he",   "him",  "his",             "himself"}
 EXPECTED_N_THEY_WORDS = {"they", "them", "their", "theirs", "themself"}
 EXPECTED_N_ZE_WORDS   = {"ze", "zhe",
-                         "zir", "zem" "hir", "mer", "zhim",
+                         "zir", "zem", "hir", "mer", "zhim",
                          "zir", "zes", "hir", "zer", "zher",
                          "zirs", "zes", "hirs", "zers", "zhers",
                          "zirself", "hirself", "zemself", "zhimself"}
@@ -44,4 +45,17 @@ POSSIBLE_PRONOUN_SETS = {
                             NEUTRAL_ZE_GENDER   : EXPECTED_N_ZE_WORDS,
                         }
 
-POSSIBLE_FILE_TYPES = [".txt", ".rtf", ".html"]
+# other ways the selected gender might be written in a gender list
+# (the gender's name and its pronouns also work)
+POSSIBLE_GENDER_ALIASES = {
+                              FEMALE_GENDER       : {"f", "fem", "femme", "feminine", "woman"},
+                              MALE_GENDER         : {"m", "masc", "masculine", "man"},
+                              NEUTRAL_THEY_GENDER : {"they"},
+                              NEUTRAL_ZE_GENDER   : {"ze", "zhe", "zie"},
+                          }
+
+# where to look for a pronoun config file, if one isn't given on the command line
+PRONOUN_CONFIG_VARIABLE = "GENDER_SWAP_PRONOUNS"
+PRONOUN_CONFIG_PATH     = os.path.join(os.path.expanduser("~"), ".gender_swap_pronouns.json")
+
+POSSIBLE_FILE_TYPES = [".txt", ".rtf", ".html", ".docx", ".odt"]
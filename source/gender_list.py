@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""
+This module holds a compact, read only version of a parsed gender list
+that's quick to look characters up in and cheap to send to other processes.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+from array import array
+
+from swap_log import LOG
+
+# character numbers are looked up in a table with a slot for every number
+# up to the largest one, as long as they're no bigger than this and the table
+# isn't mostly empty (at most GENDER_LIST_MAX_SLOTS_PER_CHARACTER slots for each
+# character, or GENDER_LIST_MIN_DENSE_SLOTS slots for short lists); other
+# lists (including ones with negative numbers) are looked up in a dictionary
+GENDER_LIST_MAX_DENSE_NUMBER        = 99999
+GENDER_LIST_MAX_SLOTS_PER_CHARACTER = 8
+GENDER_LIST_MIN_DENSE_SLOTS         = 1024
+
+class GenderList :
+    """
+    The characters from a gender list, with their names, the gender
+    selected for each of them and the genders their options are for.
+
+    The information for each character is kept in tuples and arrays in
+    the same order as numbers (sorted by character number). positions
+    holds where each character is in the other tuples and arrays. For the
+    usual small character numbers it's an array with a slot for every number
+    up to the largest one (-1 if there's no character with that number), so
+    finding a character never needs more than an index into an array; if
+    the numbers are large, spread out or negative, it's a dictionary instead.
+
+    The gender names are interned, since the same few are used by every
+    character. A GenderList can't be changed once it's made; it pickles as
+    just its tuples, and the lookup tables are rebuilt when it's unpickled.
+
+    Use from_dicts and as_dicts to convert to and from the dictionaries
+    returned by swap_util.parse_genderlist_file.
+    """
+
+    __slots__ = ("numbers", "names", "genders", "orderings",
+                 "selected_indexes", "option_counts", "positions")
+
+    def __init__ (self, numbers, names, genders, orderings) :
+        """
+        make a gender list from matching sequences of the character numbers,
+        names, selected genders and possible genders (a sequence of gender
+        names in option order) for each character, in any order
+        """
+
+        entries = sorted(zip(numbers, names, genders, orderings), key=lambda entry : entry[0])
+
+        set_slot = object.__setattr__
+        set_slot(self, "numbers",   tuple([int(number) for number, _, _, _ in entries]))
+        set_slot(self, "names",     tuple([name for _, name, _, _ in entries]))
+        set_slot(self, "genders",   tuple([_intern(gender) for _, _, gender, _ in entries]))
+        set_slot(self, "orderings", tuple([tuple([_intern(option) for option in ordering])
+                                           for _, _, _, ordering in entries]))
+
+        set_slot(self, "selected_indexes", array("i", [_find_gender_index(gender, ordering)
+                                                       for gender, ordering in zip(self.genders, self.orderings)]))
+        set_slot(self, "option_counts",    array("i", [len(ordering) for ordering in self.orderings]))
+
+        # check the numbers fit in an array before making one
+        if _is_dense(self.numbers) :
+            positions = array("i", [-1]) * ((self.numbers[-1] + 1) if self.numbers else 0)
+        else :
+            positions = { }
+        for position, number in enumerate(self.numbers) :
+            if (number in positions) if isinstance(positions, dict) else (positions[number] >= 0) :
+                raise ValueError("The character number " + str(number) + " is in the gender list more than once.")
+            positions[number] = position
+        set_slot(self, "positions", positions)
+
+    @classmethod
+    def from_dicts (cls, genderDefinitions, genderOrdering) :
+        """
+        make a gender list from the dictionaries returned by
+        swap_util.parse_genderlist_file, warning about any character
+        whose selected gender isn't one of their possible genders
+        """
+
+        numbers   = sorted(genderDefinitions.keys())
+        orderings = [[genderOrdering[number][index].strip() for index in sorted(genderOrdering[number].keys())]
+                     for number in numbers]
+        gender_list = cls(numbers,
+                          [genderDefinitions[number][0] for number in numbers],
+                          [genderDefinitions[number][1] for number in numbers],
+                          orderings)
+
+        for position, number in enumerate(gender_list.numbers) :
+            if gender_list.selected_indexes[position] < 0 :
+                LOG.warning("WARNING: Unable to find selected gender for character %s"
+                            " in list of possible genders for this character.", gender_list.names[position])
+
+        return gender_list
+
+    def as_dicts (self) :
+        """
+        get the gender list in the form returned by swap_util.parse_genderlist_file:
+
+            ({ character number : ["character name", selected gender] },
+             { character number : { option index : gender } })
+
+        (new dictionaries are made every time, so they can be changed freely)
+        """
+
+        genderDefinitions = { }
+        genderOrdering    = { }
+        for number, name, gender, ordering in zip(self.numbers, self.names, self.genders, self.orderings) :
+            genderDefinitions[number] = [name, gender]
+            genderOrdering[number]    = dict(enumerate(ordering))
+
+        return genderDefinitions, genderOrdering
+
+    def position (self, number) :
+        """
+        where the character with the given number is in the tuples and
+        arrays of this list, or -1 if there's no character with that number
+        """
+
+        if isinstance(self.positions, dict) :
+            return self.positions.get(number, -1)
+        if 0 <= number < len(self.positions) :
+            return self.positions[number]
+
+        return -1
+
+    def selected_index (self, number) :
+        """
+        the index of the option for the selected gender of a character (-1 if
+        their gender isn't one of their options), or None if there's no
+        character with that number
+        """
+
+        position = self.position(number)
+
+        return None if position < 0 else self.selected_indexes[position]
+
+    def option_count (self, number) :
+        """
+        how many options the gendered phrases for a character should have
+        """
+
+        return self.option_counts[self._get_position(number)]
+
+    def option_genders (self, number) :
+        """
+        the genders of each of a character's options, in order
+        """
+
+        return self.orderings[self._get_position(number)]
+
+    def name (self, number) :
+        """
+        the name of a character
+        """
+
+        return self.names[self._get_position(number)]
+
+    def selected_gender (self, number) :
+        """
+        the gender selected for a character
+        """
+
+        return self.genders[self._get_position(number)]
+
+    def _get_position (self, number) :
+        """
+        where the character with the given number is, raising
+        a KeyError if there's no character with that number
+        """
+
+        position = self.position(number)
+        if position < 0 :
+            raise KeyError(number)
+
+        return position
+
+    def __len__ (self) :
+
+        return len(self.numbers)
+
+    def __iter__ (self) :
+
+        return iter(self.numbers)
+
+    def __contains__ (self, number) :
+
+        return self.position(number) >= 0
+
+    def __setattr__ (self, name, value) :
+
+        raise AttributeError("A GenderList can't be changed once it's made.")
+
+    def __delattr__ (self, name) :
+
+        raise AttributeError("A GenderList can't be changed once it's made.")
+
+    def __reduce__ (self) :
+
+        return (GenderList, (self.numbers, self.names, self.genders, self.orderings))
+
+    def __repr__ (self) :
+
+        return "GenderList(" + str(len(self.numbers)) + " characters)"
+
+def _is_dense (numbers) :
+    """
+    check whether the sorted character numbers are small and close enough
+    together to be looked up in an array (see GENDER_LIST_MAX_DENSE_NUMBER)
+    """
+
+    if not numbers :
+        return True
+
+    return ( (numbers[0] >= 0) and (numbers[-1] <= GENDER_LIST_MAX_DENSE_NUMBER) and
+             (numbers[-1] < max(GENDER_LIST_MIN_DENSE_SLOTS, GENDER_LIST_MAX_SLOTS_PER_CHARACTER * len(numbers))) )
+
+def _intern (gender) :
+    """
+    intern a gender name (the selected gender can be None if it couldn't be parsed)
+    """
+
+    return sys.intern(gender) if isinstance(gender, str) else gender
+
+def _find_gender_index (gender, ordering) :
+    """
+    find the index of the option for the selected gender, or -1 if it isn't
+    one of the options (if it's listed more than once, the last one is used,
+    the same as swap_util.get_gender_index)
+    """
+
+    for index in range(len(ordering) - 1, -1, -1) :
+        if ordering[index] == gender :
+            return index
+
+    return -1
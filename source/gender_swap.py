@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 """
 The purpose of this program is to gender swap LARP character sheets.
-The sheets are expected to be in .txt or .rtf formats and a gendersList.txt
+The sheets are expected to be in .txt, .rtf, .html, .docx or .odt formats and a gendersList.txt
 file defining the genders to select is expected.
 
 Copyright Eva Schiffer 2012 - 2015
@@ -21,10 +21,22 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import sys
+
+import logging
 
 from optparse import OptionParser
 
+import swap_log
 import swap_util
+import atomic_output
+import swap_lint
+import sheet_cache
+import swap_watch
+import swap_server
+import pronoun_sets
+import build_manifest
+from constants import *
 
 def main () :
     usage = """
@@ -33,6 +45,12 @@ run "%prog help" to list commands
 examples:
 
 python -m gender_swap swap -g genderList_201310run.txt -i ./character_sheets -o ./201310genderedSheets
+python -m gender_swap swap -j 4 -g genderList_201310run.txt -i ./character_sheets -o ./201310genderedSheets
+python -m gender_swap multiswap -i ./character_sheets -o ./genderedSheets genderList_201310run.txt genderList_201404run.txt
+python -m gender_swap lint -g genderList_201310run.txt -i ./character_sheets
+python -m gender_swap packets -p -g genderList_201310run.txt -i ./character_sheets -o ./201310packets
+python -m gender_swap watch -g genderList_201310run.txt -i ./character_sheets -o ./201310genderedSheets
+python -m gender_swap serve -i ./character_sheets genderList_201310run.txt genderList_201404run.txt
 python -m gender_swap gui
 
 """
@@ -49,6 +67,44 @@ python -m gender_swap gui
                       help="the directory where the revised character sheets will be placed")
     parser.add_option('-p', '--processFileName', dest='processName',
                       action="store_true", default=False, help="process the file name to gender it")
+    parser.add_option('-j', '--jobs', dest='jobs', type="int", default=1,
+                      help="the number of worker processes to use when processing sheets")
+    parser.add_option('-z', '--zip', dest='zipBundles', type="choice", choices=["casting", "character"], default=None,
+                      help="save the gendered sheets straight into zip files instead of a directory, "
+                           + "one for each gender list (casting) or one for each character (character); "
+                           + "with -j, the zip files are compressed with that many threads")
+    parser.add_option('-u', '--incremental', dest='incremental',
+                      action="store_true", default=False,
+                      help="only rebuild output sheets whose source sheet or characters' genders have changed")
+    parser.add_option('--poll', dest='poll',
+                      action="store_true", default=False,
+                      help="when watching for changes, check for them every so often instead of using inotify")
+    parser.add_option('--debounce', dest='debounce', type="float", default=swap_watch.DEFAULT_DEBOUNCE_SECONDS,
+                      help="when watching for changes, how many seconds to wait for more changes before rebuilding")
+    parser.add_option('--host', dest='host', default=swap_server.DEFAULT_SERVER_HOST,
+                      help="the address the serve command listens on")
+    parser.add_option('--port', dest='port', type="int", default=swap_server.DEFAULT_SERVER_PORT,
+                      help="the port the serve command listens on")
+    parser.add_option('-c', '--cacheDir', dest='cacheDirectory', default=None,
+                      help="a directory to cache the gendered text found in sheets in, to speed up later runs")
+    parser.add_option('--cacheSize', dest='cacheSize', type="int",
+                      default=sheet_cache.DEFAULT_MAX_CACHE_SIZE // (1024 * 1024),
+                      help="the maximum size of the sheet cache in megabytes (for serve, also the most sheets kept in memory)")
+    parser.add_option('--pronouns', dest='pronounConfig', default=None,
+                      help="a json file of pronoun sets and gender aliases to add to the genders this program understands "
+                           + "(by default $" + PRONOUN_CONFIG_VARIABLE + " or " + PRONOUN_CONFIG_PATH + " is used, if it exists)")
+    parser.add_option('--fsync', dest='fsync', type="choice", choices=atomic_output.FSYNC_POLICIES,
+                      default=atomic_output.FSYNC_NEVER,
+                      help="when to make sure outputs are on the disk before moving on: never (leave it up to the "
+                           + "operating system), file (before each output is moved into place) or always (also after "
+                           + "it's been moved)")
+    parser.add_option('-q', '--quiet', dest='quiet',
+                      action="store_true", default=False, help="only log errors and warnings")
+    parser.add_option('--verbose', dest='verbose',
+                      action="store_true", default=False,
+                      help="log details about every file and every problem found in a gendered phrase")
+    parser.add_option('--log-json', dest='logJson',
+                      action="store_true", default=False, help="log messages as one json object per line")
     parser.add_option('-v', '--version', dest='version',
                       action="store_true", default=False, help="view the program version")
     
@@ -58,6 +114,28 @@ python -m gender_swap gui
     if options.version :
         print ("gender_swap, version 0.6 \n") # because having a version history is cool
 
+    # set up logging at the level the user asked for
+    logLevel = logging.INFO
+    logLevel = logging.WARNING if options.quiet   else logLevel
+    logLevel = logging.DEBUG   if options.verbose else logLevel
+    swap_log.setup_logging(logLevel, json_output=options.logJson)
+    LOG = swap_log.LOG
+    
+    # load any extra genders the user has configured
+    try :
+        pronoun_sets.load_user_pronoun_sets(options.pronounConfig)
+    except (OSError, ValueError) as error :
+        LOG.error ("Unable to load pronoun config file: " + str(error))
+        return 1
+    
+    atomic_output.set_fsync_policy(options.fsync)
+    
+    # set up the sheet cache if we're using one
+    sheetCache = None
+    if options.cacheDirectory is not None :
+        sheetCache = sheet_cache.SheetCache(options.cacheDirectory,
+                                            max_size=options.cacheSize * 1024 * 1024)
+    
     # set up the commands dictionary
     commands = {}
     prior = None
@@ -74,43 +152,82 @@ python -m gender_swap gui
             2. load the files in the input directory and process genders
                in any sheets that have file types we know how to process
             3. save the resulting gendered documents to the output directory
+        
+        if the incremental option is set, a manifest in the output directory
+        is used to skip sheets whose output would not change and to remove
+        outputs whose source sheets have disappeared
+        
+        if the zip option is set, the gendered documents are saved straight
+        into one zip file in the output directory named after the gender
+        list, or one zip file for each character
         """
         
         # make sure we aren't going to overwrite our input files
         if options.outDirectory == options.inputDirectory :
-            print ("Input and output directories cannot be the same. "
-                   + "Please select a different output directory to avoid "
-                   + "destroying your original sheets.")
+            LOG.error ("Input and output directories cannot be the same. "
+                       + "Please select a different output directory to avoid "
+                       + "destroying your original sheets.")
             return 1
         
         # make sure we have a gender list to work with
         if options.genderList is None :
-            print ("Unable to process files without a gender list document "
-                   + "defining the character's genders.")
+            LOG.error ("Unable to process files without a gender list document "
+                       + "defining the character's genders.")
             return 1
         
-        print ("Opening and parsing gender list: " + options.genderList)
+        if options.incremental and (options.zipBundles is not None) :
+            LOG.error ("Zip files can't be built incrementally. Please use either -u or -z, not both.")
+            return 1
+        
+        LOG.info ("Opening and parsing gender list: " + options.genderList)
         genderListFile = open(options.genderList, "r")
         genderDefinitions, genderOrdering = swap_util.parse_genderlist_file(genderListFile.readlines())
         genderListFile.close()
+        genderPlan = swap_util.GenderPlan(genderDefinitions, genderOrdering)
         
         # create the output directory if needed
         if not os.path.exists(options.outDirectory):
-            print ("Making output directory: " + options.outDirectory)
+            LOG.info ("Making output directory: " + options.outDirectory)
             os.makedirs(options.outDirectory)
         
+        # if we're making zip files, stream every sheet straight into them
+        if options.zipBundles is not None :
+            bundlePath = options.outDirectory
+            if options.zipBundles == "casting" :
+                bundlePath = os.path.join(options.outDirectory,
+                                          os.path.splitext(os.path.basename(options.genderList))[0] + ".zip")
+            LOG.info ("Examining all input character sheets in: " + options.inputDirectory)
+            swap_util.bundle_sheets([os.path.join(options.inputDirectory, possibleSheet)
+                                     for possibleSheet in os.listdir(options.inputDirectory)
+                                     if os.path.splitext(possibleSheet)[1] in POSSIBLE_FILE_TYPES],
+                                    [(bundlePath, genderDefinitions, genderOrdering, genderPlan)],
+                                    per_character=(options.zipBundles == "character"),
+                                    process_file_names=options.processName,
+                                    sheet_cache=sheetCache,
+                                    compress_jobs=options.jobs)
+            swap_log.log_totals()
+            return 0
+        
+        # load the record of what was built before if we need it
+        manifest     = build_manifest.BuildManifest(options.outDirectory) if options.incremental else None
+        sheetHashes  = { }
+        # the output file name for each sheet, worked out once and reused when it's built
+        outputNames  = { }
+        skippedCount = 0
+        
         # get a list of files in the input directory
-        print ("Examining all input character sheets in: " + options.inputDirectory)
+        LOG.info ("Examining all input character sheets in: " + options.inputDirectory)
         possibleSheets = os.listdir(options.inputDirectory)
         
         # for each file in the input directory...
+        sheetsToProcess = [ ]
+        failures        = [ ]
         for possibleSheet in possibleSheets :
             
             processThisSheet = False
             
             # check to see if it looks like the kind of sheet we're expecting
-            print ("----------------------------------")
-            print ("Examining file: " + possibleSheet)
+            LOG.debug ("Examining file: " + possibleSheet)
             number      = possibleSheet.split('.')[0]
             _, fileType = os.path.splitext(possibleSheet)
             
@@ -120,22 +237,433 @@ python -m gender_swap gui
                 processThisSheet = True
             # double check that this is a type of file we can process
             processThisSheet = (processThisSheet and
-                                (fileType == ".txt" or fileType == ".rtf"))
+                                (fileType in POSSIBLE_FILE_TYPES))
             #print "fileType: " + fileType
             
+            # if we're building incrementally, check if this sheet's output is already up to date
+            sheetPath = os.path.join(options.inputDirectory, possibleSheet)
+            if processThisSheet and (manifest is not None) :
+                sheetHashes[sheetPath] = sheet_cache.hash_sheet_file(sheetPath)
+                outputNames[sheetPath] = os.path.basename(swap_util.get_output_sheet_path(sheetPath, options.outDirectory,
+                                                                                          genderDefinitions, genderOrdering,
+                                                                                          process_file_names=options.processName,
+                                                                                          gender_plan=genderPlan))
+                if manifest.is_up_to_date(outputNames[sheetPath], sheetPath, sheetHashes[sheetPath], genderPlan) :
+                    LOG.debug ("Output for " + possibleSheet + " is up to date. This file will not be processed.")
+                    skippedCount += 1
+                    continue
+            
             if processThisSheet :
                 
-                #process_one_file (file_path, output_path, gender_defs, process_file_names=False)
-                swap_util.process_one_file(os.path.join(options.inputDirectory, possibleSheet),
-                                           options.outDirectory,
-                                           genderDefinitions,
-                                           genderOrdering,
-                                           process_file_names=options.processName)
+                # save this to be processed below
+                sheetsToProcess.append(sheetPath)
+                
+            else :
+                LOG.debug ("File " + possibleSheet
+                           + " does not match character sheet name patterns. "
+                           + "This file will not be processed.")
+        
+        # if we're using one process, read and save sheets while others are being gendered
+        if (len(sheetsToProcess) > 0) and (options.jobs <= 1) :
+            
+            for sheetPath, characterNumbers in swap_util.process_files_in_pipeline(sheetsToProcess,
+                                                                                   options.outDirectory,
+                                                                                   genderDefinitions,
+                                                                                   genderOrdering,
+                                                                                   process_file_names=options.processName,
+                                                                                   gender_plan=genderPlan,
+                                                                                   sheet_cache=sheetCache,
+                                                                                   output_names=outputNames) :
+                if manifest is not None :
+                    manifest.record(outputNames[sheetPath], sheetPath, sheetHashes[sheetPath], characterNumbers, genderPlan)
+        
+        # if we're using multiple processes, process the sheets and summarize how that went
+        elif len(sheetsToProcess) > 0 :
+            
+            LOG.info ("Processing " + str(len(sheetsToProcess)) + " sheets using "
+                      + str(options.jobs) + " worker processes.")
+            results = swap_util.process_files_in_parallel(sheetsToProcess,
+                                                          options.outDirectory,
+                                                          genderDefinitions,
+                                                          genderOrdering,
+                                                          process_file_names=options.processName,
+                                                          gender_plan=genderPlan,
+                                                          jobs=options.jobs,
+                                                          sheet_cache=sheetCache,
+                                                          output_names=outputNames)
+            
+            for sheetPath, succeeded, logRecords, characterNumbers, diagnostics in results :
+                
+                # log what happened in the worker all together
+                for logRecord in logRecords :
+                    LOG.handle(logRecord)
+                
+                if not succeeded :
+                    failures.append(sheetPath)
+                    LOG.error ("FAILED: " + sheetPath)
+                    continue
+                
+                swap_log.add_to_totals(diagnostics)
+                if manifest is not None :
+                    manifest.record(outputNames[sheetPath], sheetPath, sheetHashes[sheetPath], characterNumbers, genderPlan)
+            
+            LOG.info ("Finished " + str(len(results)) + " sheets: "
+                      + str(len(results) - len(failures)) + " succeeded, "
+                      + str(len(failures)) + " failed.")
+        
+        # clean up after any sheets that went away and save the record of this build
+        if manifest is not None :
+            LOG.info ("Skipped " + str(skippedCount) + " sheets that were already up to date.")
+            # a failed sheet's old output doesn't count as stale
+            if len(failures) <= 0 :
+                manifest.remove_stale_outputs()
+            manifest.save()
+        
+        swap_log.log_totals()
+        
+        if len(failures) > 0 :
+            return 1
+        
+        return 0
+    
+    def multiswap (*genderLists) :
+        """swap in genders for several castings of a set of documents at once
+        
+        given the paths to one or more gender list documents and
+        information in the form of commandline options:
+        
+            1. load each of the gender list documents
+            2. load the files in the input directory and find the gendered
+               text in any sheets that have file types we know how to process
+            3. save a gendered version of the documents for each gender list
+               in a subdirectory of the output directory named after that
+               gender list
+        
+        each sheet is only read and searched for gendered text once,
+        no matter how many gender lists are given
+        
+        if the zip option is set, the gendered documents for each gender
+        list are saved straight into a zip file named after it, or into a
+        zip file for each character in its subdirectory
+        """
+        
+        # make sure we aren't going to overwrite our input files
+        if options.outDirectory == options.inputDirectory :
+            LOG.error ("Input and output directories cannot be the same. "
+                       + "Please select a different output directory to avoid "
+                       + "destroying your original sheets.")
+            return 1
+        
+        # make sure we have gender lists to work with
+        if len(genderLists) <= 0 :
+            LOG.error ("Unable to process files without at least one gender list document "
+                       + "defining the character's genders.")
+            return 1
+        
+        # load each of the gender lists and figure out where their output goes
+        castings = [ ]
+        for genderList in genderLists :
+            
+            LOG.info ("Opening and parsing gender list: " + genderList)
+            genderListFile = open(genderList, "r")
+            genderDefinitions, genderOrdering = swap_util.parse_genderlist_file(genderListFile.readlines())
+            genderListFile.close()
+            
+            castingName = os.path.splitext(os.path.basename(genderList))[0]
+            castingPath = os.path.join(options.outDirectory, castingName)
+            if castingPath in [casting[0] for casting in castings] :
+                LOG.error ("More than one gender list is named " + castingName + ". "
+                           + "Please rename one of them so their output directories don't collide.")
+                return 1
+            
+            # create the output directory if needed (a zip file for the whole
+            # casting goes in the main output directory instead)
+            outputDirectory = options.outDirectory if options.zipBundles == "casting" else castingPath
+            if not os.path.exists(outputDirectory):
+                LOG.info ("Making output directory: " + outputDirectory)
+                os.makedirs(outputDirectory)
+            
+            castings.append((castingPath, genderDefinitions, genderOrdering,
+                             swap_util.GenderPlan(genderDefinitions, genderOrdering)))
+        
+        # if we're making zip files, stream every sheet straight into them
+        if options.zipBundles is not None :
+            LOG.info ("Examining all input character sheets in: " + options.inputDirectory)
+            swap_util.bundle_sheets([os.path.join(options.inputDirectory, possibleSheet)
+                                     for possibleSheet in os.listdir(options.inputDirectory)
+                                     if os.path.splitext(possibleSheet)[1] in POSSIBLE_FILE_TYPES],
+                                    [((castingPath + ".zip") if options.zipBundles == "casting" else castingPath,
+                                      genderDefinitions, genderOrdering, genderPlan)
+                                     for castingPath, genderDefinitions, genderOrdering, genderPlan in castings],
+                                    per_character=(options.zipBundles == "character"),
+                                    process_file_names=options.processName,
+                                    sheet_cache=sheetCache,
+                                    compress_jobs=options.jobs)
+            swap_log.log_totals()
+            return 0
+        
+        # get a list of files in the input directory
+        LOG.info ("Examining all input character sheets in: " + options.inputDirectory)
+        possibleSheets = os.listdir(options.inputDirectory)
+        
+        # for each file in the input directory...
+        for possibleSheet in possibleSheets :
+            
+            # check to see if it looks like the kind of sheet we're expecting
+            LOG.debug ("Examining file: " + possibleSheet)
+            number      = possibleSheet.split('.')[0]
+            _, fileType = os.path.splitext(possibleSheet)
+            
+            # only the castings that include this character need this sheet
+            sheetCastings = [ ]
+            if number.isdigit() and (fileType in POSSIBLE_FILE_TYPES) :
+                sheetCastings = [casting for casting in castings if int(number) in casting[1]]
+            
+            if len(sheetCastings) > 0 :
+                
+                swap_util.process_one_file_for_castings(os.path.join(options.inputDirectory, possibleSheet),
+                                                        sheetCastings,
+                                                        process_file_names=options.processName,
+                                                        sheet_cache=sheetCache)
                 
             else :
-                print ("File " + possibleSheet
-                       + " does not match character sheet name patterns. "
-                       + "This file will not be processed.")
+                LOG.debug ("File " + possibleSheet
+                           + " does not match character sheet name patterns. "
+                           + "This file will not be processed.")
+        
+        swap_log.log_totals()
+        
+        return 0
+    
+    def lint ( ) :
+        """check the gender markup in a set of documents for problems
+        
+        given information in the form of commandline options:
+        
+            1. load a gender list document that will define the genders
+               of the characters to check against
+            2. check the gendered text in any sheets in the input directory
+               that have file types we know how to process for problems
+               like unknown character numbers, phrases with the wrong number
+               of options, and terms that don't seem to match their gender
+            3. report all the problems found
+        
+        none of these checks are done when sheets are gendered, so it's
+        a good idea to run this whenever the sheets have changed
+        """
+        
+        # make sure we have a gender list to work with
+        if options.genderList is None :
+            LOG.error ("Unable to check files without a gender list document "
+                       + "defining the character's genders.")
+            return 1
+        
+        LOG.info ("Opening and parsing gender list: " + options.genderList)
+        genderListFile = open(options.genderList, "r")
+        genderPlan     = swap_util.GenderPlan(swap_util.parse_genderlist(genderListFile.readlines()))
+        genderListFile.close()
+        
+        issues = swap_lint.lint_gender_plan(genderPlan)
+        
+        # check every sheet in the input directory (other than the gender list itself)
+        LOG.info ("Checking all input character sheets in: " + options.inputDirectory)
+        sheetCount = 0
+        for possibleSheet in sorted(os.listdir(options.inputDirectory)) :
+            sheetPath   = os.path.join(options.inputDirectory, possibleSheet)
+            _, fileType = os.path.splitext(possibleSheet)
+            if ( (fileType in POSSIBLE_FILE_TYPES) and os.path.isfile(sheetPath) and
+                 (os.path.abspath(sheetPath) != os.path.abspath(options.genderList)) ) :
+                LOG.debug ("Checking file: " + possibleSheet)
+                issues.extend(swap_lint.lint_file(sheetPath, genderPlan, sheet_cache=sheetCache))
+                sheetCount += 1
+        
+        # report everything we found at once
+        counts = { }
+        for issue in issues :
+            LOG.warning (str(issue), extra={ "diagnostics" : issue.as_dict() })
+            counts[issue.kind] = counts.get(issue.kind, 0) + 1
+        LOG.info ("Checked " + str(sheetCount) + " sheets: " + swap_log.summarize_counts(counts),
+                  extra={ "diagnostics" : { "warnings" : counts } })
+        
+        return 1 if len(issues) > 0 else 0
+    
+    def packets ( ) :
+        """make a printable pdf packet for each character
+        
+        given information in the form of commandline options:
+        
+            1. load a gender list document that will define the genders
+               of the characters for this run
+            2. collect the sheets in the input directory for each character
+               in the gender list (the sheets whose names start with that
+               character's number) that have file types we know how to process
+            3. save one pdf for each character in the output directory, with
+               the gendered text of all their sheets in file name order
+        
+        the gendered sheets go straight into the pdf without being saved
+        on their own, and only their text (not their formatting) is kept
+        """
+        
+        # make sure we have a gender list to work with
+        if options.genderList is None :
+            LOG.error ("Unable to make packets without a gender list document "
+                       + "defining the character's genders.")
+            return 1
+        
+        LOG.info ("Opening and parsing gender list: " + options.genderList)
+        genderListFile = open(options.genderList, "r")
+        genderDefinitions, genderOrdering = swap_util.parse_genderlist_file(genderListFile.readlines())
+        genderListFile.close()
+        genderPlan = swap_util.GenderPlan(genderDefinitions, genderOrdering)
+        
+        # create the output directory if needed
+        if not os.path.exists(options.outDirectory):
+            LOG.info ("Making output directory: " + options.outDirectory)
+            os.makedirs(options.outDirectory)
+        
+        # sort the sheets in the input directory into each character's packet
+        LOG.info ("Examining all input character sheets in: " + options.inputDirectory)
+        sheetPaths = [os.path.join(options.inputDirectory, possibleSheet)
+                      for possibleSheet in os.listdir(options.inputDirectory)
+                      if os.path.splitext(possibleSheet)[1] in POSSIBLE_FILE_TYPES]
+        packetSheets = swap_util.get_packet_sheets(sheetPaths, genderDefinitions)
+        
+        failures = [ ]
+        for number in sorted(packetSheets.keys()) :
+            
+            if len(packetSheets[number]) <= 0 :
+                LOG.warning ("No sheets found for character " + str(number) + " (" + genderDefinitions[number][0]
+                             + "). No packet will be made for them.")
+                continue
+            
+            packetPath = swap_util.get_packet_path(options.outDirectory, number, genderDefinitions)
+            LOG.info ("Making packet with " + str(len(packetSheets[number])) + " sheets: " + packetPath)
+            try :
+                swap_util.write_packet_pdf(packetSheets[number], packetPath,
+                                           genderDefinitions, genderOrdering,
+                                           process_file_names=options.processName,
+                                           gender_plan=genderPlan,
+                                           title=genderDefinitions[number][0])
+            except Exception :
+                failures.append(packetPath)
+                LOG.exception ("FAILED: " + packetPath)
+        
+        swap_log.log_totals()
+        
+        if len(failures) > 0 :
+            return 1
+        
+        return 0
+    
+    def watch ( ) :
+        """keep gendered sheets up to date as they're edited
+        
+        given information in the form of commandline options:
+        
+            1. load a gender list document that will define the genders
+               of the characters for this run
+            2. gender any sheets in the input directory whose output in
+               the output directory isn't already up to date (like swap -u)
+            3. watch the input directory and the gender list for changes,
+               and each time they're saved rebuild only the sheets that
+               changed, or if the gender list changed, only the sheets that
+               refer to characters whose genders changed
+        
+        changes are found with inotify if it's available, or by checking
+        the directories every so often if it isn't (or --poll is given);
+        press Control-C to stop watching
+        """
+        
+        # make sure we aren't going to overwrite our input files
+        if os.path.abspath(options.outDirectory) == os.path.abspath(options.inputDirectory) :
+            LOG.error ("Input and output directories cannot be the same. "
+                       + "Please select a different output directory to avoid "
+                       + "destroying your original sheets.")
+            return 1
+        
+        # make sure we have a gender list to work with
+        if options.genderList is None :
+            LOG.error ("Unable to process files without a gender list document "
+                       + "defining the character's genders.")
+            return 1
+        
+        # create the output directory if needed
+        if not os.path.exists(options.outDirectory):
+            LOG.info ("Making output directory: " + options.outDirectory)
+            os.makedirs(options.outDirectory)
+        
+        builder = swap_watch.WatchBuilder(options.genderList, options.inputDirectory, options.outDirectory,
+                                          process_file_names=options.processName,
+                                          sheet_cache=sheetCache)
+        watcher = swap_watch.make_watcher([options.inputDirectory, os.path.dirname(os.path.abspath(options.genderList))],
+                                          use_polling=options.poll)
+        
+        # catch up with anything that changed since the last build
+        LOG.info ("Bringing gendered sheets up to date in: " + options.outDirectory)
+        builder.build_all()
+        
+        LOG.info ("Watching for changes in " + options.inputDirectory + " and " + options.genderList
+                  + " (press Control-C to stop).")
+        try :
+            while True :
+                builder.handle_changes(swap_watch.collect_changes(watcher, debounce_seconds=options.debounce))
+        except KeyboardInterrupt :
+            LOG.info ("Stopped watching for changes.")
+        finally :
+            watcher.close()
+        
+        return 0
+    
+    def serve (*genderLists) :
+        """answer requests for gendered sheets from other programs
+        
+        given the paths to one or more gender list documents (or the -g
+        option) and information in the form of commandline options:
+        
+            1. load each of the gender list documents and find the gendered
+               text in the sheets in the input directory, keeping both in
+               memory
+            2. answer http requests on --host and --port (only from this
+               computer, by default) for gendered sheets or zip files of
+               them for any of the gender lists, named after their files
+               (see swap_server for the requests and swap_client for a
+               simple client)
+        
+        gender lists and sheets that change are loaded again the next time
+        they're asked for; press Control-C to stop the server
+        """
+        
+        genderLists = list(genderLists)
+        if (len(genderLists) <= 0) and (options.genderList is not None) :
+            genderLists = [options.genderList]
+        
+        # make sure we have gender lists to work with
+        if len(genderLists) <= 0 :
+            LOG.error ("Unable to serve files without at least one gender list document "
+                       + "defining the character's genders.")
+            return 1
+        
+        try :
+            service = swap_server.SwapService(options.inputDirectory, genderLists,
+                                              process_file_names=options.processName,
+                                              sheet_cache=sheetCache,
+                                              max_memory_size=options.cacheSize * 1024 * 1024)
+        except ValueError as error :
+            LOG.error (str(error) + " Please rename one of them so their sheets can be told apart.")
+            return 1
+        
+        LOG.info ("Loading gender lists and sheets from: " + options.inputDirectory)
+        service.warm_up()
+        
+        server = swap_server.make_server(service, host=options.host, port=options.port)
+        LOG.info ("Serving gendered sheets at http://" + options.host + ":" + str(server.server_address[1])
+                  + "/ (press Control-C to stop).")
+        try :
+            server.serve_forever()
+        except KeyboardInterrupt :
+            LOG.info ("Stopped serving.")
+        finally :
+            server.server_close()
         
         return 0
     
@@ -174,10 +702,12 @@ python -m gender_swap gui
             help()
             return 1
     else:
-        # call the function the user named, given the arguments from the command line  
-        locals()[args[0]](*args[1:])
+        # call the function the user named, given the arguments from the command line,
+        # and pass on its exit status (commands that don't return one succeeded)
+        status = commands[args[0]](*args[1:])
+        return 0 if status is None else status
 
     return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
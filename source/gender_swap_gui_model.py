@@ -22,6 +22,118 @@ import os
 
 import swap_util
 from constants import *
+from swap_log  import LOG
+
+# how many threads to use when searching directories for files to process
+DIRECTORY_SCAN_JOBS = 4
+
+# how much of a sheet to read before showing the first part of a preview
+PREVIEW_FIRST_CHUNK_SIZE = 8 * 1024
+
+class SheetPreview :
+    """
+    This class holds a gendered preview of one sheet.
+    
+    The sheet is kept as a list of tokens (see swap_util.iter_sheet_tokens)
+    along with the rendered text of each token and where it starts in
+    the preview, so when a character's gender changes only the phrases
+    for that character need to be rendered again.
+    """
+    
+    def __init__ (self, file_path, gender_plan) :
+        """
+        set up an empty preview; the sheet itself is read with iter_token_batches
+        """
+        
+        self.file_path     = file_path
+        self.gender_plan   = gender_plan
+        
+        self.tokens        = [ ]
+        self.rendered      = [ ]
+        self.token_starts  = [ ]
+        self.text_length   = 0
+        # character number (int): [indexes of the tokens that are phrases for that character]
+        self.phrase_tokens = { }
+    
+    def iter_token_batches (self, should_cancel_fn=None) :
+        """
+        read and tokenize the sheet, yielding lists of tokens as they're ready
+        
+        this doesn't change the preview, so it's safe to call from a thread
+        other than the gui's; hand each batch to add_tokens in the gui thread
+        
+        if should_cancel_fn is given and returns True, reading will stop
+        
+        only the visible text of formatted sheets is previewed (the preview
+        window shows plain text, so any formatting would show up as markup)
+        """
+        
+        for tokens in swap_util.iter_file_tokens(self.file_path, first_chunk_size=PREVIEW_FIRST_CHUNK_SIZE,
+                                                 text_only=True) :
+            if (should_cancel_fn is not None) and should_cancel_fn() :
+                return
+            yield tokens
+    
+    def add_tokens (self, tokens) :
+        """
+        add more tokens to the end of the preview and return their rendered text
+        """
+        
+        new_text = [ ]
+        for token in tokens :
+            
+            if isinstance(token, str) :
+                rendered = token
+            else :
+                rendered = self.gender_plan.render_phrase(token, printWarnings=False)
+                self.phrase_tokens.setdefault(token.character_number, [ ]).append(len(self.tokens))
+            
+            self.tokens.append(token)
+            self.rendered.append(rendered)
+            self.token_starts.append(self.text_length)
+            self.text_length += len(rendered)
+            new_text.append(rendered)
+        
+        return "".join(new_text)
+    
+    def change_gender_plan (self, gender_plan, character_numbers) :
+        """
+        switch to a new gender plan where only the characters in
+        character_numbers have changed
+        
+        returns a list of edits in the form (start, end, new text), ordered
+        from the end of the preview to the start so they can be applied
+        one after another without disturbing each other's positions
+        """
+        
+        self.gender_plan = gender_plan
+        
+        # re-render just the phrases for the changed characters
+        changed_indexes = sorted([index for number in character_numbers
+                                  for index in self.phrase_tokens.get(number, [ ])])
+        edits = [ ]
+        for index in changed_indexes :
+            rendered = gender_plan.render_phrase(self.tokens[index], printWarnings=False)
+            if rendered != self.rendered[index] :
+                start = self.token_starts[index]
+                edits.append((index, start, start + len(self.rendered[index]), rendered))
+        
+        if len(edits) <= 0 :
+            return [ ]
+        
+        # move the start of everything after each edit to match
+        edit_position = 0
+        shift         = 0
+        for index in range(edits[0][0], len(self.tokens)) :
+            self.token_starts[index] += shift
+            if (edit_position < len(edits)) and (edits[edit_position][0] == index) :
+                _, start, end, rendered = edits[edit_position]
+                shift += len(rendered) - (end - start)
+                self.rendered[index] = rendered
+                edit_position += 1
+        self.text_length += shift
+        
+        return [(start, end, rendered) for _, start, end, rendered in reversed(edits)]
 
 class GenderSwapGUIModel :
     """
@@ -38,7 +150,9 @@ class GenderSwapGUIModel :
         self.loaded_list_path      = None
         self.gender_defs           = None
         self.gender_orders         = None
+        self.gender_plan           = None
         self.were_genders_edited   = False
+        self.current_preview       = None
         
         self.output_path           = None
         self.files_to_process_list = set( )
@@ -72,6 +186,8 @@ class GenderSwapGUIModel :
             genderFile = open(file_path, 'r')
             self.loaded_list_path = file_path
             self.gender_defs, self.gender_orders = swap_util.parse_genderlist_file(genderFile.readlines())
+            genderFile.close()
+            self.gender_plan = swap_util.GenderPlan(self.gender_defs, self.gender_orders)
             
             # let the view know that the gender information changed
             self.gui_for_updates.recieveUpdate ( genderListFilePath=self.loaded_list_path,
@@ -118,44 +234,22 @@ class GenderSwapGUIModel :
     def add_more_files_to_process (self, list_of_file_paths) :
         """
         given more file paths, add them to the list
+        
+        any directories in the list are searched (including their
+        subdirectories) for files of types we know how to process
         """
         
         if self.files_to_process_list is None :
             self.files_to_process_list = set( )
         
-        # first deal with any directories in the list
-        clean_paths = set( )
-        for file_path in list_of_file_paths :
-            file_path = str(file_path)
-            
-            # if we found a directory, explode it
-            if os.path.isdir(file_path) :
-                
-                more_files = os.listdir(file_path)
-                for deeper_file in more_files :
-                    deeper_file = os.path.join(file_path, deeper_file)
-                    if not os.path.isdir(deeper_file) :
-                        clean_paths.update([deeper_file])
-                
-                print ("Searching directory for additional files: " + str(file_path))
-            else :
-                clean_paths.update([file_path])
+        found_files, directory_count, ignored_count = swap_util.find_sheet_files(list_of_file_paths,
+                                                                                 scan_jobs=DIRECTORY_SCAN_JOBS)
+        new_count = len(found_files - self.files_to_process_list)
+        self.files_to_process_list.update(found_files)
         
-        # now check to see if the paths are actually acceptable
-        for file_path in clean_paths :
-            
-            print ("Checking path for inclusion in processing: " + str(file_path))
-            
-            # look at the file extension to see if it's one we can process
-            _, file_type = os.path.splitext(file_path)
-            if (file_type in POSSIBLE_FILE_TYPES) :
-                self.files_to_process_list.update([file_path])
-                
-                print ("Path is of an acceptable type. Adding to it to processing list.")
-                
-            else :
-                
-                print ("File is not a type this program understands. Ignoring file.")
+        LOG.info("Added %d files to the processing list after searching %d directories. "
+                 "Ignored %d files that are not a type this program understands.",
+                 new_count, directory_count, ignored_count)
         
         self.gui_for_updates.recieveUpdate ( filesToProcessList=list(self.files_to_process_list))
     
@@ -193,9 +287,57 @@ class GenderSwapGUIModel :
         return swap_util.open_and_gender_sheet (file_path, 
                                                 self.gender_defs,
                                                 self.gender_orders,
-                                                reason=" to create gendered preview")
+                                                reason=" to create gendered preview",
+                                                gender_plan=self.gender_plan)
+    
+    def start_preview (self, file_path) :
+        """
+        Create an empty preview of the file using the current gender definitions.
+        
+        The preview is kept up to date as genders are changed; the caller is
+        responsible for reading the sheet into it (see SheetPreview).
+        """
+        
+        # check the minimum prerequisites for file processing
+        if self.check_processing_prereqs() is None:
+            return None
+        
+        if (file_path is None) or (not os.path.isfile(file_path)) :
+            print ("Unable to preview file path: " + str(file_path))
+            return None
+        
+        self.current_preview = SheetPreview(file_path, self.gender_plan)
+        
+        return self.current_preview
     
-    def process_files (self) :
+    def set_character_gender (self, character_number, gender) :
+        """
+        change the selected gender for one character and update
+        the current preview (if any) to match
+        """
+        
+        if (self.gender_defs is None) or (character_number not in self.gender_defs) :
+            print ("Unable to set gender for unknown character number: " + str(character_number))
+            return
+        
+        if gender not in self.gender_orders[character_number].values() :
+            print ("Unable to set gender (" + str(gender) + ") that isn't a possible gender for character "
+                   + str(character_number) + ".")
+            return
+        
+        if self.gender_defs[character_number][1] == gender :
+            return
+        
+        self.gender_defs[character_number] = [self.gender_defs[character_number][0], gender]
+        self.gender_plan                   = swap_util.GenderPlan(self.gender_defs, self.gender_orders)
+        self.were_genders_edited           = True
+        
+        # only the phrases for this character in the preview need to change
+        if self.current_preview is not None :
+            edits = self.current_preview.change_gender_plan(self.gender_plan, [character_number])
+            self.gui_for_updates.recieveUpdate ( previewEdits=edits )
+    
+    def process_files (self, progress_fn=None, should_cancel_fn=None) :
         """
         if possible given the current state of the model, process the files
         and save the resulting outputs to disk
@@ -208,6 +350,17 @@ class GenderSwapGUIModel :
                 the output directory must not be the same as the directory that
                 holds any of the files in the list for processing
         
+        if progress_fn is given, it will be called after each file is processed
+        with the number of files done so far, the total number of files, and
+        the path of the file that was just processed
+        
+        if should_cancel_fn is given, it will be called after each file is
+        processed and if it returns True processing will stop (the next few
+        files may already have been read, but their outputs won't be saved)
+        
+        this method doesn't talk to the view directly, so it is safe to call
+        from a thread other than the gui's
+        
         FUTURE, this method handles errors with printing, move to throwing
         an exception for the gui to handle.
         """
@@ -226,23 +379,39 @@ class GenderSwapGUIModel :
             print ("No output directory is selected.")
             return
         
+        # take a copy of the list so changes in the gui won't affect this run
+        files_to_process = sorted(self.files_to_process_list)
+        
         # check if the output directory contains any of the input files
         # if so, we don't want to process them!
-        for file_path in list(self.files_to_process_list) :
+        for file_path in files_to_process :
             file_directory = os.path.dirname(file_path)
             if os.stat(self.output_path) == os.stat(file_directory) :
             #if os.path.samefile(self.output_path, file_directory) :
                 print ("Unable to output to directory containing input files.")
                 return
         
-        # at this point we've minimally validated that we can process the files
-        for file_path in list(self.files_to_process_list) :
-            
-            swap_util.process_one_file(file_path,
-                                       str(self.output_path),
-                                       self.gender_defs,
-                                       self.gender_orders,
-                                       process_file_names=self.do_process_file_names)
+        # at this point we've minimally validated that we can process the files,
+        # reading and saving sheets while others are being gendered
+        results = swap_util.process_files_in_pipeline(files_to_process,
+                                                      str(self.output_path),
+                                                      self.gender_defs,
+                                                      self.gender_orders,
+                                                      process_file_names=self.do_process_file_names,
+                                                      gender_plan=self.gender_plan)
+        try :
+            for file_index, (file_path, _) in enumerate(results) :
+                
+                if progress_fn is not None :
+                    progress_fn(file_index + 1, len(files_to_process), file_path)
+                
+                if (should_cancel_fn is not None) and should_cancel_fn() and (file_index + 1 < len(files_to_process)) :
+                    print ("Processing canceled after " + str(file_index + 1) + " of "
+                           + str(len(files_to_process)) + " files.")
+                    return
+        finally :
+            # stop the pipeline if we're canceling
+            results.close()
     
     def check_processing_prereqs (self) :
         """
@@ -19,6 +19,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import sys
+import functools
 
 from PyQt4 import QtGui, QtCore
 
@@ -118,7 +119,10 @@ class GenderedGUI (QtGui.QWidget) :
         self.clearFilesButton
         self.filesToProcessDisplay
         self.processNamesToggle
+        self.previewButton
         self.processButton
+        self.processProgressBar
+        self.cancelButton
         """
         
         layoutObj = QtGui.QGridLayout()
@@ -157,15 +161,30 @@ class GenderedGUI (QtGui.QWidget) :
         self.processNamesToggle.clicked.connect(self.process_names_toggled)
         rowNum += 1
         
-        """
         self.previewButton = QtGui.QPushButton("Preview Sheet")
         self.previewButton.clicked.connect(self.preview_pressed)
         layoutObj.addWidget(self.previewButton, rowNum, 0, 1, 2)
-        """
         
         self.processButton = QtGui.QPushButton("Process")
         self.processButton.clicked.connect(self.process_pressed)
         layoutObj.addWidget(self.processButton, rowNum, 2, 1, 2)
+        rowNum += 1
+        
+        self.processProgressBar = QtGui.QProgressBar()
+        self.processProgressBar.setRange(0, 1)
+        self.processProgressBar.setValue(0)
+        layoutObj.addWidget(self.processProgressBar, rowNum, 0, 1, 3)
+        self.cancelButton = QtGui.QPushButton("Cancel")
+        self.cancelButton.setEnabled(False)
+        self.cancelButton.clicked.connect(self.cancel_pressed)
+        layoutObj.addWidget(self.cancelButton, rowNum, 3)
+        
+        # processing happens in this thread so the gui stays responsive
+        self.processingWorker = None
+        
+        # the current preview window and the thread loading it
+        self.previewWindow    = None
+        self.previewWorker    = None
         
         return layoutObj
     
@@ -242,42 +261,91 @@ class GenderedGUI (QtGui.QWidget) :
         the user pressed the button to preview one of the files
         """
         
-        """
         print ("User pressed preview button.")
         
         # get the currently selected file
         file_text = str(self.filesToProcessDisplay.currentItem().text()) if self.filesToProcessDisplay.currentItem() is not None else None
         
-        # get the gendered version of the file's contents for the preview
-        gendered_text = self.model.preview_file(file_text)
+        # set up an empty preview of the file
+        preview = self.model.start_preview(file_text)
+        if preview is None :
+            return
+        
+        # stop loading any earlier preview, we only show one at a time (and wait
+        # for it to stop, since Qt can't let go of a thread that's still running)
+        if self.previewWorker is not None :
+            self.previewWorker.cancel()
+            self.previewWorker.wait()
+        
+        if self.previewWindow is None :
+            self.previewWindow = PreviewWindow()
+        self.previewWindow.start_preview(file_text)
+        
+        # read the sheet in the background, showing each part as it's ready
+        self.previewWorker = PreviewWorker(preview)
+        self.previewWorker.tokensReady.connect(self.preview_tokens_ready)
+        self.previewWorker.start()
+    
+    def preview_tokens_ready (self, preview, tokens) :
+        """
+        the preview worker has read another part of the sheet
+        """
+        
+        # ignore anything from a preview we've since replaced
+        if preview is self.model.current_preview :
+            self.previewWindow.append_text(preview.add_tokens(tokens))
+    
+    def gender_selected (self, charNum, gender) :
+        """
+        the user picked a new gender for one of the characters
+        """
         
-        print ("successfully gendered preview text")
+        print ("User selected gender " + str(gender) + " for character " + str(charNum))
         
-        temp_window = QtGui.QWidget()
-        temp_layout = QtGui.QGridLayout()
+        self.model.set_character_gender(charNum, str(gender))
+    
+    def process_pressed (self) :
+        """
+        the user pressed the button to process the files
+        """
         
-        temp_text_edit = QtGui.QLabel()
-        temp_text_edit.textFormat = QtCore.Qt.RichText
-        temp_text_edit.setText(gendered_text)
+        print ("User pressed process button.")
         
-        temp_layout.addWidget(temp_text_edit, 0, 0)
-        temp_window.setLayout(temp_layout)
+        # only run one batch of processing at a time
+        if (self.processingWorker is not None) and self.processingWorker.isRunning() :
+            print ("Files are already being processed.")
+            return
         
-        temp_window.resize(500, 500)
-        temp_window.setWindowTitle('Preview of: ' + file_text)
-        temp_window.show()
+        self.processingWorker = ProcessingWorker(self.model)
+        self.processingWorker.progress.connect(self.processing_progressed)
+        self.processingWorker.finished.connect(self.processing_finished)
         
-        self.windows.append(temp_window)
+        self.recieveUpdate(isProcessing=True)
+        self.processingWorker.start()
+    
+    def cancel_pressed (self) :
+        """
+        the user pressed the button to cancel processing the files
         """
+        
+        print ("User pressed cancel button.")
+        
+        if self.processingWorker is not None :
+            self.processingWorker.cancel()
     
-    def process_pressed (self) :
+    def processing_progressed (self, filesDone, filesTotal, filePath) :
         """
-        the user pressed the button to process the files
+        the processing worker finished another file
         """
         
-        print ("User pressed process button.")
+        self.recieveUpdate(processingProgress=(filesDone, filesTotal, filePath))
+    
+    def processing_finished (self) :
+        """
+        the processing worker is done, whether it finished or was canceled
+        """
         
-        self.model.process_files()
+        self.recieveUpdate(isProcessing=False)
     
     def process_names_toggled (self) :
         """
@@ -297,12 +365,21 @@ class GenderedGUI (QtGui.QWidget) :
                        outputPath=None,
                        searchDirectories=None,
                        filesToProcessList=None,
-                       doProcessFileNames=None) :
+                       doProcessFileNames=None,
+                       isProcessing=None,
+                       processingProgress=None,
+                       previewEdits=None) :
         """
         update the gui with information sent from the model
         
         information that is left as None will not be set
         
+        processingProgress is expected to be a tuple in the form
+        (number of files done, total number of files, path of the last file done)
+        
+        previewEdits is expected to be a list of (start, end, new text) changes
+        to make to the current preview, in the order they should be made
+        
         genderDefinitions is expected to be a dictionary in the form
         {
             character number (int):   ["character name", pronoun_set_constant],
@@ -360,9 +437,12 @@ class GenderedGUI (QtGui.QWidget) :
                     tempWidget.setFlags(QtCore.Qt.ItemIsEnabled)
                     self.genderListDisplayTable.setItem(0,1, tempWidget)
                     
-                    tempWidget = QtGui.QTableWidgetItem( genderDefinitions[charNum][1] )
-                    tempWidget.setFlags(QtCore.Qt.ItemIsEnabled)
-                    self.genderListDisplayTable.setItem(0,2, tempWidget)
+                    tempWidget = QtGui.QComboBox()
+                    tempWidget.addItems(sorted(genderOrdering[charNum].values()))
+                    tempIndex = tempWidget.findText(genderDefinitions[charNum][1])
+                    tempWidget.setCurrentIndex(tempIndex)
+                    tempWidget.activated[str].connect(functools.partial(self.gender_selected, charNum))
+                    self.genderListDisplayTable.setCellWidget(0,2, tempWidget)
                 
         
         # if we got a new output path update that
@@ -391,6 +471,136 @@ class GenderedGUI (QtGui.QWidget) :
             
             toSet = QtCore.Qt.Checked if doProcessFileNames else QtCore.Qt.Unchecked
             self.processNamesToggle.setCheckState(toSet)
+        
+        # if we started or stopped processing, only allow the buttons that make sense
+        if isProcessing is not None :
+            print ("Updating processing state: " + str(isProcessing))
+            
+            self.processButton.setEnabled(not isProcessing)
+            self.cancelButton.setEnabled(isProcessing)
+            if isProcessing :
+                self.processProgressBar.setRange(0, max(len(self.model.files_to_process_list), 1))
+                self.processProgressBar.setValue(0)
+        
+        # if we got new processing progress, update that
+        if processingProgress is not None :
+            filesDone, filesTotal, filePath = processingProgress
+            print ("Processed " + str(filesDone) + " of " + str(filesTotal) + " files: " + str(filePath))
+            
+            self.processProgressBar.setRange(0, filesTotal)
+            self.processProgressBar.setValue(filesDone)
+        
+        # if parts of the preview changed, update just those parts
+        if (previewEdits is not None) and (self.previewWindow is not None) :
+            print ("Updating " + str(len(previewEdits)) + " phrases in the preview.")
+            
+            self.previewWindow.apply_edits(previewEdits)
+
+class PreviewWindow (QtGui.QWidget) :
+    """
+    This window shows a gendered preview of one sheet.
+    """
+    
+    def __init__ (self, parent=None) :
+        
+        super(PreviewWindow, self).__init__(parent)
+        
+        self.previewTextDisplay = QtGui.QPlainTextEdit()
+        self.previewTextDisplay.setReadOnly(True)
+        
+        temp_layout = QtGui.QGridLayout()
+        temp_layout.addWidget(self.previewTextDisplay, 0, 0)
+        self.setLayout(temp_layout)
+        
+        self.resize(500, 500)
+    
+    def start_preview (self, file_path) :
+        """
+        clear out the window for a new preview and show it
+        """
+        
+        self.setWindowTitle('Preview of: ' + str(file_path))
+        self.previewTextDisplay.clear()
+        self.show()
+        self.raise_()
+    
+    def append_text (self, text) :
+        """
+        add more text to the end of the preview
+        """
+        
+        tempCursor = QtGui.QTextCursor(self.previewTextDisplay.document())
+        tempCursor.movePosition(QtGui.QTextCursor.End)
+        tempCursor.insertText(text)
+    
+    def apply_edits (self, edits) :
+        """
+        replace parts of the preview, given a list of (start, end, new text)
+        """
+        
+        tempCursor = QtGui.QTextCursor(self.previewTextDisplay.document())
+        tempCursor.beginEditBlock()
+        for start, end, newText in edits :
+            tempCursor.setPosition(start)
+            tempCursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+            tempCursor.insertText(newText)
+        tempCursor.endEditBlock()
+
+class PreviewWorker (QtCore.QThread) :
+    """
+    This thread reads a sheet for a preview so the gui doesn't freeze while it works.
+    """
+    
+    # emitted with (the preview, a list of tokens) for each part of the sheet that's read
+    tokensReady = QtCore.pyqtSignal(object, object)
+    
+    def __init__ (self, preview, parent=None) :
+        
+        super(PreviewWorker, self).__init__(parent)
+        
+        self.preview          = preview
+        self.cancel_requested = False
+    
+    def cancel (self) :
+        """
+        ask the worker to stop reading
+        """
+        
+        self.cancel_requested = True
+    
+    def run (self) :
+        
+        for tokens in self.preview.iter_token_batches(should_cancel_fn=lambda : self.cancel_requested) :
+            self.tokensReady.emit(self.preview, tokens)
+
+class ProcessingWorker (QtCore.QThread) :
+    """
+    This thread processes the model's files so the gui doesn't freeze while it works.
+    """
+    
+    # emitted after each file with (files done, total files, path of the file)
+    progress = QtCore.pyqtSignal(int, int, str)
+    
+    def __init__ (self, model, parent=None) :
+        
+        super(ProcessingWorker, self).__init__(parent)
+        
+        self.model            = model
+        self.cancel_requested = False
+    
+    def cancel (self) :
+        """
+        ask the worker to stop before it starts on the next file
+        """
+        
+        self.cancel_requested = True
+    
+    def run (self) :
+        
+        # the model calls these from this thread; the signal is queued
+        # over to the gui thread so the view is only touched from there
+        self.model.process_files(progress_fn=self.progress.emit,
+                                 should_cancel_fn=lambda : self.cancel_requested)
 
 # this class exists to make sure the list of files to process
 # accepts drag and drop input
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+This module splits html documents into pieces so the gender swap tool can
+find gendered phrases in the text of the page, even when that text is
+broken up by tags or entities like: [01: <b>her</b> / his]
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+import html
+import html.parser
+
+# the text inside these elements isn't shown on the page
+HTML_HIDDEN_ELEMENTS = frozenset(["script", "style", "template"])
+# these elements start a new line on the page
+HTML_BLOCK_ELEMENTS  = frozenset(["p", "div", "br", "li", "tr", "table", "ul", "ol", "dl", "dt", "dd",
+                                  "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "hr",
+                                  "section", "article", "header", "footer", "title"])
+# whitespace in the page's text, which is shown as a single space outside of <pre>
+HTML_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+class HtmlLexer (html.parser.HTMLParser) :
+    """
+    Splits html text into (raw text, visible text) pieces.
+
+    The raw text of all the pieces joined together is exactly the text
+    that was given; the visible text is the text in the page's text nodes
+    for that piece, with entities replaced by the characters they stand for
+    (tags, comments and the contents of scripts and styles have no visible
+    text). Pieces with visible text longer than one character are always
+    text, where the raw and visible text are the same.
+
+    This is built on html.parser, so the document is parsed as it's fed
+    in a chunk at a time without ever building the whole document tree.
+
+    If text_only is True the pieces are only going to be read, never
+    written back out, so the visible text is laid out more like it would
+    be on the page: runs of whitespace become a single space (outside of
+    <pre>) and block elements like paragraphs end with a line break. The
+    visible text of a piece of text may then be different from its raw text.
+    """
+
+    def __init__ (self, text_only=False) :
+
+        html.parser.HTMLParser.__init__(self, convert_charrefs=False)
+
+        # the text fed in that hasn't been handed back as pieces yet
+        self.buffer         = ""
+        # where in the whole document the buffer starts, and where
+        # the last finished piece ends
+        self.buffer_start   = 0
+        self.finished_to    = 0
+        # where in the whole document the parser's unparsed text starts,
+        # and how far into that the parser has gotten
+        self.rawdata_start  = 0
+        self.parsed_to      = 0
+        # a piece that's been started but whose end we don't know yet,
+        # in the form (where it starts in the whole document, visible text)
+        self.pending        = None
+        # the pieces finished since the last call to feed or close
+        self.pieces         = [ ]
+        self.hidden_element = None
+        self.text_only      = text_only
+        self.pre_depth      = 0
+
+    def feed (self, text) :
+        """
+        split more of the document into pieces, returning a list of them
+        """
+
+        self.buffer       += text
+        self.rawdata_start = self.rawdata_start + self.parsed_to
+        self.parsed_to     = 0
+
+        html.parser.HTMLParser.feed(self, text)
+
+        return self._take_pieces()
+
+    def close (self) :
+        """
+        finish the document, returning a list of any pieces that were held back
+        """
+
+        self.rawdata_start = self.rawdata_start + self.parsed_to
+        self.parsed_to     = 0
+
+        html.parser.HTMLParser.close(self)
+        self._start_piece(self.buffer_start + len(self.buffer), None)
+
+        return self._take_pieces()
+
+    def kept_raw (self, raw) :
+        """
+        the raw text to use for a piece with no visible text when it's
+        kept as part of a gendered phrase that's been rewritten
+        """
+
+        return raw
+
+    def updatepos (self, i, j) :
+
+        # keep track of where each part of the document starts, since the
+        # parser only tells us what was found there and not where it was
+        self.parsed_to = j
+
+        return html.parser.HTMLParser.updatepos(self, i, j)
+
+    def _take_pieces (self) :
+        """
+        hand back the finished pieces, forgetting the text they came from
+        """
+
+        pieces      = self.pieces
+        self.pieces = [ ]
+
+        self.buffer       = self.buffer[self.finished_to - self.buffer_start:]
+        self.buffer_start = self.finished_to
+
+        return pieces
+
+    def _start_piece (self, start, visible) :
+        """
+        note that a new piece starts at start in the whole document, which
+        finishes the pending piece (if there is one); visible is the visible
+        text of the new piece, or None if no piece should be started
+        """
+
+        if start > self.finished_to :
+            raw = self.buffer[self.finished_to - self.buffer_start:start - self.buffer_start]
+            self.pieces.append((raw, "" if self.pending is None else self.pending[1]))
+            self.finished_to = start
+
+        self.pending = None if visible is None else (start, visible)
+
+    def _current_start (self) :
+        """
+        where in the whole document the part the parser is handling starts
+        """
+
+        return self.rawdata_start + self.parsed_to
+
+    def _line_break (self, tag) :
+        """
+        the visible text for the start or end of an element when we're
+        only reading the text, which is a line break for block elements
+        """
+
+        return "\n" if self.text_only and (tag in HTML_BLOCK_ELEMENTS) and (self.hidden_element is None) else ""
+
+    def handle_data (self, data) :
+
+        visible = "" if self.hidden_element is not None else data
+        if self.text_only and (self.pre_depth <= 0) :
+            visible = HTML_WHITESPACE_PATTERN.sub(" ", visible)
+
+        self._start_piece(self._current_start(), None)
+        self.pieces.append((data, visible))
+        self.finished_to += len(data)
+
+    def handle_starttag (self, tag, attrs) :
+
+        # elements like <br> that are never closed break the line where they start
+        self._start_piece(self._current_start(), self._line_break(tag) if tag in ("br", "hr") else "")
+        if (tag in HTML_HIDDEN_ELEMENTS) and (self.hidden_element is None) :
+            self.hidden_element = tag
+        if tag == "pre" :
+            self.pre_depth += 1
+
+    def handle_endtag (self, tag) :
+
+        self._start_piece(self._current_start(), self._line_break(tag))
+        if tag == self.hidden_element :
+            self.hidden_element = None
+        if (tag == "pre") and (self.pre_depth > 0) :
+            self.pre_depth -= 1
+
+    def handle_startendtag (self, tag, attrs) :
+
+        self._start_piece(self._current_start(), self._line_break(tag))
+
+    def handle_entityref (self, name) :
+
+        self._start_piece(self._current_start(), "" if self.hidden_element is not None else html.unescape("&" + name + ";"))
+
+    def handle_charref (self, name) :
+
+        self._start_piece(self._current_start(), "" if self.hidden_element is not None else html.unescape("&#" + name + ";"))
+
+    def handle_comment (self, data) :
+
+        self._start_piece(self._current_start(), "")
+
+    def handle_decl (self, decl) :
+
+        self._start_piece(self._current_start(), "")
+
+    def handle_pi (self, data) :
+
+        self._start_piece(self._current_start(), "")
+
+    def unknown_decl (self, data) :
+
+        self._start_piece(self._current_start(), "")
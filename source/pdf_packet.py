@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+"""
+This module writes the plain text of gendered sheets into a single
+paginated pdf, so a character's whole packet can be printed at once.
+
+The pdf is written as the text comes in, one page at a time; only the page
+being laid out is ever held in memory. It uses the standard Helvetica fonts
+that every pdf reader has, so nothing needs to be embedded.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import zlib
+
+# the page layout, in points (a US letter page with one inch margins)
+PDF_PAGE_WIDTH   = 612
+PDF_PAGE_HEIGHT  = 792
+PDF_PAGE_MARGIN  = 72
+PDF_TEXT_SIZE    = 11
+PDF_HEADING_SIZE = 14
+# the distance between lines, relative to the size of their text
+PDF_LINE_SPACING = 1.3
+# how many spaces a tab is shown as
+PDF_TAB_SPACES   = 4
+
+# the fonts used for the body text and for the heading at the start of each sheet
+PDF_TEXT_FONT    = "F1"
+PDF_HEADING_FONT = "F2"
+PDF_FONTS        = {
+                       PDF_TEXT_FONT    : "Helvetica",
+                       PDF_HEADING_FONT : "Helvetica-Bold",
+                   }
+
+# the numbers of the objects that are written last but referred to by
+# everything else; the fonts come right after these
+PDF_CATALOG_OBJECT = 1
+PDF_PAGES_OBJECT   = 2
+PDF_INFO_OBJECT    = 3
+
+# the widths of the printable ascii characters in Helvetica, in thousandths
+# of the text size, from the font's metrics (bold is a little wider, which
+# is made up for by PDF_HEADING_WIDTH_SCALE)
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,     # space to /
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,     # 0 to ?
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,    # @ to O
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,     # P to _
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,     # ` to o
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,          # p to ~
+]
+HELVETICA_DEFAULT_WIDTH = 556
+PDF_HEADING_WIDTH_SCALE = 1.1
+
+# characters the pdf's text encoding (windows-1252) doesn't have but that have a close match
+PDF_CHARACTER_REPLACEMENTS = str.maketrans({
+                                               "\u2010" : "-",
+                                               "\u2011" : "-",
+                                               "\u2012" : "-",
+                                               "\u200b" : "",
+                                               "\r"     : "",
+                                               "\f"     : "\n",
+                                               "\t"     : " " * PDF_TAB_SPACES,
+                                           })
+
+def make_pdf_string (text) :
+    """
+    turn text into a pdf string that can be shown in one of our fonts,
+    replacing any characters the fonts can't show with ?
+    """
+
+    encoded = text.encode("cp1252", "replace")
+    encoded = encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+    return b"(" + encoded + b")"
+
+def make_pdf_text_string (text) :
+    """
+    turn text into a pdf string for the document information (like its
+    title), which can have any unicode characters in it
+    """
+
+    return b"<FEFF" + text.encode("utf-16-be").hex().upper().encode("ascii") + b">"
+
+class PdfPacketWriter :
+    """
+    Writes text into a paginated pdf in an open binary file.
+
+    Each sheet is started with start_sheet, which begins a new page with a
+    heading, and its text is added with write (as many times as needed).
+    Text is broken into lines at line breaks and wrapped at spaces to fit
+    the page. Each page is written to the file as soon as it's full, and
+    close finishes the pdf (it doesn't close the file).
+    """
+
+    def __init__ (self, output_file, title=None, compress=True) :
+
+        self.output_file  = output_file
+        self.title        = title
+        self.compress     = compress
+
+        # where each object starts in the file, by object number
+        self.offsets      = { }
+        self.next_object  = PDF_INFO_OBJECT + len(PDF_FONTS) + 1
+        self.page_objects = [ ]
+        self.line_width   = PDF_PAGE_WIDTH - (2 * PDF_PAGE_MARGIN)
+
+        # the lines on the current page, in the form (font, size, height, text),
+        # and the height of the top of the next line
+        self.page_lines   = [ ]
+        self.line_top     = PDF_PAGE_HEIGHT - PDF_PAGE_MARGIN
+        # the end of the text we've been given that isn't a whole line yet
+        self.partial      = ""
+
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def start_sheet (self, heading) :
+        """
+        start a new sheet on a new page, with the given heading at the top
+        """
+
+        self._finish_paragraph()
+        if self.page_lines :
+            self._finish_page()
+
+        for line in self._wrap(heading.translate(PDF_CHARACTER_REPLACEMENTS), PDF_HEADING_SIZE * PDF_HEADING_WIDTH_SCALE) :
+            self._add_line(PDF_HEADING_FONT, PDF_HEADING_SIZE, line)
+        self._add_line(PDF_TEXT_FONT, PDF_TEXT_SIZE, "")
+
+    def write (self, text) :
+        """
+        add more text to the current sheet
+        """
+
+        lines        = (self.partial + text.translate(PDF_CHARACTER_REPLACEMENTS)).split("\n")
+        self.partial = lines.pop()
+        for line in lines :
+            for wrapped_line in self._wrap(line, PDF_TEXT_SIZE) :
+                self._add_line(PDF_TEXT_FONT, PDF_TEXT_SIZE, wrapped_line)
+
+        # a paragraph too long for one line can have its first lines laid out already
+        wrapped_lines = self._wrap(self.partial, PDF_TEXT_SIZE)
+        self.partial  = wrapped_lines.pop()
+        for wrapped_line in wrapped_lines :
+            self._add_line(PDF_TEXT_FONT, PDF_TEXT_SIZE, wrapped_line)
+
+    def close (self) :
+        """
+        finish the last page and write the information that ties the pdf together
+        """
+
+        self._finish_paragraph()
+        if self.page_lines or not self.page_objects :
+            self._finish_page()
+
+        # the fonts
+        for font_number, font_key in enumerate(sorted(PDF_FONTS.keys())) :
+            self._write_object(PDF_INFO_OBJECT + 1 + font_number,
+                               ("<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+                                % PDF_FONTS[font_key]).encode("ascii"))
+
+        # the list of pages, the document catalog and the document information
+        kids = " ".join(["%d 0 R" % page_object for page_object in self.page_objects])
+        self._write_object(PDF_PAGES_OBJECT,
+                           ("<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_objects))).encode("ascii"))
+        self._write_object(PDF_CATALOG_OBJECT,
+                           ("<< /Type /Catalog /Pages %d 0 R >>" % PDF_PAGES_OBJECT).encode("ascii"))
+        info = b"<< /Producer " + make_pdf_text_string("gender_swap")
+        if self.title is not None :
+            info += b" /Title " + make_pdf_text_string(self.title)
+        self._write_object(PDF_INFO_OBJECT, info + b" >>")
+
+        # the table of where each object is
+        xref_offset  = self.output_file.tell()
+        object_count = self.next_object
+        xref         = ["xref\n0 %d\n0000000000 65535 f \n" % object_count]
+        for object_number in range(1, object_count) :
+            xref.append("%010d 00000 n \n" % self.offsets[object_number])
+        xref.append("trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                    % (object_count, PDF_CATALOG_OBJECT, PDF_INFO_OBJECT, xref_offset))
+        self._write("".join(xref).encode("ascii"))
+
+    def _wrap (self, text, size) :
+        """
+        break one line of text into a list of lines that fit on the page,
+        at spaces where possible
+        """
+
+        # the widths are added up in thousandths of the text size
+        line_width = self.line_width * 1000.0 / size
+        lines      = [ ]
+        while True :
+
+            # find the first character that doesn't fit
+            width = 0
+            end   = None
+            for index, character in enumerate(text) :
+                code   = ord(character) - 32
+                width += HELVETICA_WIDTHS[code] if 0 <= code < len(HELVETICA_WIDTHS) else HELVETICA_DEFAULT_WIDTH
+                if width > line_width :
+                    end = index
+                    break
+            if end is None :
+                lines.append(text)
+                return lines
+
+            # break at the last space that fits, or in the middle of a word that's too long for a line
+            break_index = text.rfind(" ", 0, end + 1)
+            if break_index <= 0 :
+                break_index = max(end, 1)
+                lines.append(text[:break_index])
+                text = text[break_index:]
+            else :
+                lines.append(text[:break_index])
+                text = text[break_index + 1:]
+
+    def _finish_paragraph (self) :
+        """
+        lay out the end of the text we've been given as a whole line
+        """
+
+        if self.partial :
+            for wrapped_line in self._wrap(self.partial, PDF_TEXT_SIZE) :
+                self._add_line(PDF_TEXT_FONT, PDF_TEXT_SIZE, wrapped_line)
+        self.partial = ""
+
+    def _add_line (self, font, size, text) :
+        """
+        add a line to the current page, starting a new page if it's full
+        """
+
+        height = size * PDF_LINE_SPACING
+        if (self.line_top - height < PDF_PAGE_MARGIN) and self.page_lines :
+            self._finish_page()
+
+        self.line_top -= height
+        self.page_lines.append((font, size, self.line_top, text))
+
+    def _finish_page (self) :
+        """
+        write the current page to the file and start a new one
+        """
+
+        content = [ ]
+        for font, size, height, text in self.page_lines :
+            if text :
+                content.append(("BT /%s %d Tf %d %.2f Td " % (font, size, PDF_PAGE_MARGIN, height)).encode("ascii")
+                               + make_pdf_string(text) + b" Tj ET\n")
+        content = b"".join(content)
+
+        stream_info = b"<< /Length %d >>"
+        if self.compress :
+            content     = zlib.compress(content)
+            stream_info = b"<< /Length %d /Filter /FlateDecode >>"
+
+        content_object = self._new_object()
+        self._write_object(content_object, (stream_info % len(content)) + b"\nstream\n" + content + b"\nendstream")
+
+        page_object = self._new_object()
+        fonts       = " ".join(["/%s %d 0 R" % (font_key, PDF_INFO_OBJECT + 1 + font_number)
+                                for font_number, font_key in enumerate(sorted(PDF_FONTS.keys()))])
+        self._write_object(page_object,
+                           ("<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> "
+                            "/Contents %d 0 R >>" % (PDF_PAGES_OBJECT, PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT,
+                                                     fonts, content_object)).encode("ascii"))
+        self.page_objects.append(page_object)
+
+        self.page_lines = [ ]
+        self.line_top   = PDF_PAGE_HEIGHT - PDF_PAGE_MARGIN
+
+    def _new_object (self) :
+        """
+        get the number for a new object
+        """
+
+        object_number     = self.next_object
+        self.next_object += 1
+
+        return object_number
+
+    def _write_object (self, object_number, body) :
+        """
+        write one numbered object to the file
+        """
+
+        self.offsets[object_number] = self.output_file.tell()
+        self._write(b"%d 0 obj\n" % object_number + body + b"\nendobj\n")
+
+    def _write (self, data) :
+        """
+        write bytes to the file
+        """
+
+        self.output_file.write(data)
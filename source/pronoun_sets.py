@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+This module keeps track of the genders the gender swap tool understands:
+the pronouns used for each of them and the ways their names might be
+written in a gender list. The built in genders (see constants) can be
+added to or replaced with a pronoun config file, which is json like this:
+
+    {
+        "genders" : {
+            "neutral xe" : {
+                "pronouns" : ["xe", "xem", "xyr", "xyrs", "xemself"],
+                "aliases"  : ["xe"]
+            }
+        },
+        "replace_defaults" : false
+    }
+
+Each gender in the file replaces the built in gender with the same name
+(if there is one); if replace_defaults is true, none of the built in
+genders are kept.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import json
+from types import MappingProxyType
+
+from constants import *
+from swap_log import LOG
+
+# the words in the selected gender text of a gender list
+GENDER_TEXT_WORD_PATTERN = re.compile(r"[^\W_]+")
+
+class PronounSets :
+    """
+    The pronouns and aliases for every gender the program understands,
+    along with indexes for looking them up, which are all built once
+    when the PronounSets is made and can't be changed after that.
+
+    pronoun_sets maps each gender to a frozenset of its pronouns,
+    word_index maps each pronoun to a frozenset of the genders that use it,
+    and alias_index maps each lowercase alias (including the gender's own
+    name) to the gender it stands for.
+    """
+
+    __slots__ = ("pronoun_sets", "aliases", "word_index", "alias_index")
+
+    def __init__ (self, pronoun_sets, aliases=None) :
+        """
+        build the indexes for the given dictionaries in the form
+        { gender : iterable of pronouns } and { gender : iterable of aliases }
+        """
+
+        aliases = { } if aliases is None else aliases
+
+        frozen_sets    = { }
+        frozen_aliases = { }
+        word_index     = { }
+        alias_index    = { }
+        for gender in pronoun_sets :
+            frozen_sets[gender]    = frozenset([word.strip().lower() for word in pronoun_sets[gender]])
+            frozen_aliases[gender] = frozenset([alias.strip().lower() for alias in aliases.get(gender, [ ])])
+            for word in frozen_sets[gender] :
+                word_index[word] = word_index.get(word, frozenset()) | frozenset([gender])
+            for alias in frozen_aliases[gender] | frozenset([gender.lower()]) :
+                if (alias in alias_index) and (alias_index[alias] != gender) :
+                    LOG.warning("The gender alias \"%s\" is used for both %s and %s. It will mean %s.",
+                                alias, alias_index[alias], gender, gender)
+                alias_index[alias] = gender
+
+        set_slot = object.__setattr__
+        set_slot(self, "pronoun_sets", MappingProxyType(frozen_sets))
+        set_slot(self, "aliases",      MappingProxyType(frozen_aliases))
+        set_slot(self, "word_index",   MappingProxyType(word_index))
+        set_slot(self, "alias_index",  MappingProxyType(alias_index))
+
+    def genders_for_word (self, word) :
+        """
+        the frozenset of genders that use the given pronoun (empty if none do)
+        """
+
+        return self.word_index.get(word.lower(), frozenset())
+
+    def detect_gender (self, genderText) :
+        """
+        figure out which gender the selected gender text from a gender list
+        stands for, or None if it doesn't seem to be any gender we know
+
+        If the whole text isn't the name or an alias of a gender, each word
+        of it is looked up as an alias or as a pronoun used by only one
+        gender, and the last word that matches decides the gender (so
+        "neutral they" and "they/them" are both NEUTRAL_THEY_GENDER).
+        """
+
+        genderText = genderText.strip().lower()
+        gender     = self.alias_index.get(genderText)
+        if gender is not None :
+            return gender
+
+        for word in GENDER_TEXT_WORD_PATTERN.findall(genderText) :
+            word_gender = self.alias_index.get(word)
+            if word_gender is None :
+                word_genders = self.word_index.get(word, ())
+                word_gender  = next(iter(word_genders)) if len(word_genders) == 1 else None
+            if word_gender is not None :
+                gender = word_gender
+
+        return gender
+
+    def with_config (self, config) :
+        """
+        make a new PronounSets with the genders from a parsed pronoun config
+        file added to these (see the module documentation for the format)
+        """
+
+        if not isinstance(config, dict) or not isinstance(config.get("genders", { }), dict) :
+            raise ValueError("A pronoun config file should have a \"genders\" object in it.")
+
+        if config.get("replace_defaults", False) :
+            pronoun_sets, aliases = { }, { }
+        else :
+            pronoun_sets, aliases = dict(self.pronoun_sets), dict(self.aliases)
+
+        for gender, gender_info in config.get("genders", { }).items() :
+            pronouns = gender_info.get("pronouns", [ ]) if isinstance(gender_info, dict) else None
+            if (not isinstance(pronouns, list)) or (not all([isinstance(word, str) for word in pronouns])) :
+                raise ValueError("The pronouns for " + gender + " should be a list of words.")
+            gender_aliases = gender_info.get("aliases", [ ])
+            if (not isinstance(gender_aliases, list)) or (not all([isinstance(alias, str) for alias in gender_aliases])) :
+                raise ValueError("The aliases for " + gender + " should be a list of words.")
+            pronoun_sets[gender] = pronouns
+            aliases[gender]      = gender_aliases
+
+        return PronounSets(pronoun_sets, aliases)
+
+    def __setattr__ (self, name, value) :
+
+        raise AttributeError("PronounSets can't be changed once they're made.")
+
+    def __reduce__ (self) :
+
+        return (PronounSets, (dict([(gender, sorted(words)) for gender, words in self.pronoun_sets.items()]),
+                              dict([(gender, sorted(words)) for gender, words in self.aliases.items()])))
+
+# the built in genders
+DEFAULT_PRONOUN_SETS = PronounSets(POSSIBLE_PRONOUN_SETS, POSSIBLE_GENDER_ALIASES)
+
+# the pronoun sets in use, which are loaded the first time they're needed
+_active_pronoun_sets = None
+
+def load_pronoun_config (config_path, base=DEFAULT_PRONOUN_SETS) :
+    """
+    load a pronoun config file and return the PronounSets with
+    its genders added to the base pronoun sets
+    """
+
+    config_file = open(config_path, "r")
+    try :
+        config = json.load(config_file)
+    finally :
+        config_file.close()
+
+    return base.with_config(config)
+
+def load_user_pronoun_sets (config_path=None) :
+    """
+    load the user's pronoun config file (config_path, or if that's None the
+    file named by the GENDER_SWAP_PRONOUNS environment variable, or if that
+    isn't set ~/.gender_swap_pronouns.json) and start using its pronoun sets
+
+    If no config_path was given and there's no file in the default place,
+    the built in genders are used. Returns the PronounSets now in use.
+    """
+
+    if config_path is None :
+        config_path = os.environ.get(PRONOUN_CONFIG_VARIABLE, PRONOUN_CONFIG_PATH)
+        if not os.path.exists(config_path) :
+            set_pronoun_sets(DEFAULT_PRONOUN_SETS)
+            return DEFAULT_PRONOUN_SETS
+
+    LOG.debug("Loading pronoun config file: %s", config_path)
+    set_pronoun_sets(load_pronoun_config(config_path))
+
+    return _active_pronoun_sets
+
+def set_pronoun_sets (pronoun_sets) :
+    """
+    start using the given PronounSets
+    """
+
+    global _active_pronoun_sets
+
+    _active_pronoun_sets = pronoun_sets
+
+def get_pronoun_sets () :
+    """
+    get the PronounSets in use, loading the user's pronoun config
+    file (see load_user_pronoun_sets) if nothing's been loaded yet
+    """
+
+    if _active_pronoun_sets is None :
+        load_user_pronoun_sets()
+
+    return _active_pronoun_sets
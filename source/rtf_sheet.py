@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+This module splits rtf documents into pieces so the gender swap tool can
+find gendered phrases in the text a reader would see, even when that text
+is broken up by formatting like: [01: {\\b her} / his]
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+
+# each piece of an rtf document is one of these, matched in a single pass
+RTF_PIECE_PATTERN = re.compile(r"""
+      (?P<word>\\[a-zA-Z]{1,32})(?P<param>-?\d{1,10})?[ ]?   # a control word like \b0 or \fs24
+    | \\'(?P<hex>[0-9a-fA-F]{2})                           # a hex escaped character like \'92
+    | \\[^a-zA-Z']                                         # a control symbol like \{ or \~
+    | \\(?:'[0-9a-fA-F]?)?                                 # an escape that's been cut off
+    | [{}]                                                 # the start or end of a group
+    | [^\\{}\r\n]+                                         # plain text
+    | [\r\n]+                                              # line breaks, which rtf ignores
+    """, re.VERBOSE)
+
+# control words that can't be cut off from anything that follows them
+RTF_UNDELIMITED_WORD_PATTERN = re.compile(r"\\[a-zA-Z]{1,32}(?:-?\d{1,10})?$")
+
+# control words that stand for visible text
+RTF_WORD_TEXT = {
+                    "par"       : "\n",
+                    "line"      : "\n",
+                    "sect"      : "\n",
+                    "page"      : "\n",
+                    "row"       : "\n",
+                    "cell"      : "\t",
+                    "tab"       : "\t",
+                    "emdash"    : "\u2014",
+                    "endash"    : "\u2013",
+                    "emspace"   : " ",
+                    "enspace"   : " ",
+                    "qmspace"   : " ",
+                    "bullet"    : "\u2022",
+                    "lquote"    : "\u2018",
+                    "rquote"    : "\u2019",
+                    "ldblquote" : "\u201c",
+                    "rdblquote" : "\u201d",
+                }
+
+# control symbols that stand for visible text
+RTF_SYMBOL_TEXT = {
+                      "\\\\" : "\\",
+                      "\\{"  : "{",
+                      "\\}"  : "}",
+                      "\\~"  : "\u00a0",
+                      "\\_"  : "\u2011",
+                      "\\\n" : "\n",
+                      "\\\r" : "\n",
+                  }
+
+# groups starting with these hold information about the document, not its text
+RTF_HIDDEN_DESTINATIONS = frozenset(["fonttbl", "colortbl", "stylesheet", "info", "pict", "object",
+                                     "listtable", "listoverridetable", "revtbl", "rsidtbl", "generator",
+                                     "themedata", "colorschememapping", "datastore", "latentstyles",
+                                     "xmlnstbl", "filetbl", "fldinst", "bkmkstart", "bkmkend"])
+
+def delimit_control_word (raw) :
+    """
+    given the raw text of a piece that's being kept while the text around
+    it is removed, make sure it won't run into whatever ends up after it
+
+    A control word like \\b can be ended by any character that isn't a
+    letter or number, so once that character is removed it needs a space
+    (which rtf drops after a control word) to end it instead.
+    """
+
+    if RTF_UNDELIMITED_WORD_PATTERN.match(raw) :
+        return raw + " "
+
+    return raw
+
+class RtfLexer :
+    """
+    Splits rtf text into (raw text, visible text) pieces.
+
+    The raw text of all the pieces joined together is exactly the text
+    that was given; the visible text is what a reader would see for that
+    piece (empty for formatting, group braces, document information, etc.).
+    Pieces with visible text longer than one character are always plain
+    text, where the raw and visible text are the same.
+
+    Text can be fed in a chunk at a time, and the lexer keeps track of
+    groups between chunks. Anything at the end of a chunk that could be
+    changed by what comes next (like a control word that might not be
+    finished) is held back until the next chunk or close.
+
+    text_only is accepted so all the sheet lexers can be made the same way
+    (see html_sheet.HtmlLexer); rtf already has visible paragraph breaks.
+    """
+
+    def __init__ (self, text_only=False) :
+
+        self.text_only     = text_only
+        self.carry         = ""
+        # for each group we're in, whether its text is hidden
+        self.hidden_stack  = [ ]
+        self.hidden        = False
+        # whether we're at the very start of a group
+        self.group_start   = False
+        # how many characters after a \uN control word are a fallback for
+        # readers that don't understand unicode (set by \ucN)
+        self.fallback_size = 1
+        self.fallback_left = 0
+
+    def feed (self, text) :
+        """
+        split more of the document into pieces, returning a list of them
+        """
+
+        text       = self.carry + text
+        self.carry = ""
+        pieces     = [ ]
+        for matchInfo in RTF_PIECE_PATTERN.finditer(text) :
+
+            raw = matchInfo.group(0)
+
+            # a control word or escape at the very end may be missing part of itself
+            if (matchInfo.end() == len(text)) and raw.startswith("\\") and (matchInfo.group("hex") is None) :
+                if (matchInfo.group("word") is not None) or (len(raw) < 2) or raw.startswith("\\'") :
+                    self.carry = raw
+                    break
+
+            self._add_pieces(pieces, matchInfo)
+
+        return pieces
+
+    def close (self) :
+        """
+        finish the document, returning a list of any pieces that were held back
+        """
+
+        text       = self.carry
+        self.carry = ""
+        if not text :
+            return [ ]
+
+        pieces = [ ]
+        for matchInfo in RTF_PIECE_PATTERN.finditer(text) :
+            self._add_pieces(pieces, matchInfo)
+
+        return pieces
+
+    def kept_raw (self, raw) :
+        """
+        the raw text to use for a piece with no visible text when it's
+        kept as part of a gendered phrase that's been rewritten
+        """
+
+        return delimit_control_word(raw)
+
+    def _add_pieces (self, pieces, matchInfo) :
+        """
+        add the piece for one match of RTF_PIECE_PATTERN to the list of pieces,
+        keeping track of the groups we're in along the way
+        """
+
+        raw              = matchInfo.group(0)
+        at_group_start   = self.group_start
+        self.group_start = False
+
+        if raw == "{" :
+            self.hidden_stack.append(self.hidden)
+            self.group_start   = True
+            self.fallback_left = 0
+            pieces.append((raw, ""))
+            return
+
+        if raw == "}" :
+            if self.hidden_stack :
+                self.hidden = self.hidden_stack.pop()
+            self.fallback_left = 0
+            pieces.append((raw, ""))
+            return
+
+        word = matchInfo.group("word")
+
+        if word is not None :
+            word    = word[1:]
+            param   = matchInfo.group("param")
+            visible = ""
+
+            if at_group_start and (word in RTF_HIDDEN_DESTINATIONS) :
+                self.hidden = True
+
+            if (word == "uc") and (param is not None) :
+                self.fallback_size = int(param)
+            elif (word == "u") and (param is not None) :
+                self.fallback_left = self.fallback_size
+                code    = int(param)
+                visible = chr(code + 65536 if code < 0 else code)
+            else :
+                visible = RTF_WORD_TEXT.get(word, "")
+
+            pieces.append((raw, "" if self.hidden else visible))
+            return
+
+        if raw == "\\*" :
+            if at_group_start :
+                self.hidden = True
+            pieces.append((raw, ""))
+            return
+
+        is_hex = matchInfo.group("hex") is not None
+
+        # the characters after a \uN control word are a fallback for the unicode character
+        if (self.fallback_left > 0) and (raw[0] not in "\r\n") :
+            if raw[0] == "\\" and not is_hex :
+                self.fallback_left = 0
+            else :
+                skipped             = 1 if is_hex else min(self.fallback_left, len(raw))
+                self.fallback_left -= skipped
+                # keep the fallback with its unicode character, so
+                # they're always kept or removed together
+                if pieces :
+                    pieces[-1] = (pieces[-1][0] + raw[:len(raw) if is_hex else skipped], pieces[-1][1])
+                else :
+                    pieces.append((raw[:len(raw) if is_hex else skipped], ""))
+                raw = "" if is_hex else raw[skipped:]
+                if not raw :
+                    return
+
+        if self.hidden or raw[0] in "\r\n" :
+            visible = ""
+        elif is_hex :
+            visible = bytes([int(matchInfo.group("hex"), 16)]).decode("cp1252", "replace")
+        elif raw.startswith("\\") :
+            visible = RTF_SYMBOL_TEXT.get(raw, "")
+        else :
+            visible = raw
+
+        pieces.append((raw, visible))
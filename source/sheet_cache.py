@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+This module holds on-disk and in-memory caches of tokenized sheets for the gender swap tool.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import swap_util
+
+# the default limit on the total size of the cache files, in bytes
+DEFAULT_MAX_CACHE_SIZE = 256 * 1024 * 1024
+
+# how many tokens to hand back at a time when reading a cached sheet
+TOKENS_PER_BATCH       = 4096
+
+CACHE_FILE_SUFFIX      = ".tokens"
+
+# the default limit on the total size of the sheets kept by a MemorySheetCache, in bytes
+DEFAULT_MAX_MEMORY_SIZE = 256 * 1024 * 1024
+
+def hash_sheet_file (file_path) :
+    """
+    return a hex digest of the contents of the file at file_path, the
+    version of the markup grammar and the lexer used to tokenize it (the
+    same bytes are tokenized differently as a .txt file and an .html file)
+    """
+
+    lexer_type = swap_util.SHEET_LEXERS.get(os.path.splitext(file_path)[1].lower())
+    lexer_name = "text" if lexer_type is None else lexer_type.__name__
+
+    hasher = hashlib.sha256()
+    hasher.update(("grammar " + str(swap_util.MARKUP_GRAMMAR_VERSION) + "\n").encode("utf-8"))
+    hasher.update(("lexer " + lexer_name + "\n").encode("utf-8"))
+
+    sheet_file = open(file_path, "rb")
+    for block in iter(lambda : sheet_file.read(swap_util.SHEET_CHUNK_SIZE), b"") :
+        hasher.update(block)
+    sheet_file.close()
+
+    return hasher.hexdigest()
+
+def encode_token (token) :
+    """
+    turn a token (as created by swap_util.iter_sheet_tokens) into
+    something that can be saved as json
+    """
+
+    if isinstance(token, str) :
+        return token
+
+    if isinstance(token, swap_util.FormattedPhrase) :
+        return [token.text, token.character_number, token.options, token.raw, token.renderings]
+
+    return [token.text, token.character_number, token.options]
+
+def decode_token (encoded) :
+    """
+    turn the output of encode_token back into a token
+    """
+
+    if isinstance(encoded, str) :
+        return encoded
+
+    if len(encoded) > 3 :
+        return swap_util.FormattedPhrase(encoded[0], encoded[1], encoded[2], raw=encoded[3], renderings=encoded[4])
+
+    return swap_util.MarkupPhrase(encoded[0], encoded[1], encoded[2])
+
+class SheetCache :
+    """
+    An on-disk cache of the tokenized form of sheets.
+
+    Each sheet is stored in its own file, named for the hash of the sheet's
+    contents and the markup grammar version, with one json encoded token per
+    line. Looking a sheet up marks its file as recently used, and when the
+    cache grows past max_size the least recently used files are removed.
+    """
+
+    def __init__ (self, cache_path, max_size=DEFAULT_MAX_CACHE_SIZE) :
+        """
+        set up a cache in the cache_path directory, creating it if needed
+        """
+
+        self.cache_path = cache_path
+        self.max_size   = max_size
+
+        if not os.path.exists(self.cache_path) :
+            os.makedirs(self.cache_path)
+
+    def get_cache_file_path (self, sheet_hash) :
+        """
+        get the path to the cache file for the sheet with the given hash
+        """
+
+        return os.path.join(self.cache_path, sheet_hash + CACHE_FILE_SUFFIX)
+
+    def iter_tokens (self, file_path) :
+        """
+        get the tokens for the sheet at file_path
+
+        Yields lists of tokens in order. If the sheet is in the cache the
+        tokens are read from there, otherwise the sheet is tokenized a chunk
+        at a time and the tokens are saved to the cache as they're yielded.
+        """
+
+        cache_file_path = self.get_cache_file_path(hash_sheet_file(file_path))
+
+        if os.path.exists(cache_file_path) :
+            try :
+                # mark this as recently used so it won't be evicted soon
+                os.utime(cache_file_path, None)
+                cache_file = open(cache_file_path, "r")
+            except (IOError, OSError) :
+                # it was probably evicted by someone else, so just build it again
+                cache_file = None
+
+            if cache_file is not None :
+                batch = [ ]
+                for line in cache_file :
+                    batch.append(decode_token(json.loads(line)))
+                    if len(batch) >= TOKENS_PER_BATCH :
+                        yield batch
+                        batch = [ ]
+                cache_file.close()
+                if batch :
+                    yield batch
+                return
+
+        # tokenize the sheet, saving the tokens to a temporary file
+        # and moving it into place only once it's complete
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_path)
+        temp_file          = os.fdopen(temp_fd, "w")
+        try :
+            for tokens in swap_util.iter_file_tokens(file_path) :
+                for token in tokens :
+                    temp_file.write(json.dumps(encode_token(token)) + "\n")
+                yield tokens
+        except :
+            temp_file.close()
+            os.remove(temp_path)
+            raise
+
+        temp_file.close()
+        os.replace(temp_path, cache_file_path)
+
+        self.evict()
+
+    def evict (self) :
+        """
+        remove the least recently used cache files until the
+        cache is no larger than max_size
+        """
+
+        cache_files = [ ]
+        total_size  = 0
+        for entry in os.scandir(self.cache_path) :
+            if entry.name.endswith(CACHE_FILE_SUFFIX) :
+                try :
+                    stat_info = entry.stat()
+                except OSError :
+                    continue
+                cache_files.append((stat_info.st_mtime, stat_info.st_size, entry.path))
+                total_size += stat_info.st_size
+
+        # remove the oldest files first
+        for _, file_size, file_path in sorted(cache_files) :
+            if total_size <= self.max_size :
+                break
+            try :
+                os.remove(file_path)
+            except OSError :
+                # someone else probably already removed it
+                pass
+            total_size -= file_size
+
+class MemorySheetCache :
+    """
+    An in-memory cache of the tokenized form of sheets, for a long running
+    process (like swap_server) that genders the same sheets over and over.
+
+    Sheets are looked up by path and their tokens are kept as long as the
+    file's size and modification time don't change, so an edited sheet is
+    tokenized again the next time it's needed. When the sheets add up to
+    more than max_size bytes (going by the size of their files), the least
+    recently used ones are dropped. If a backing SheetCache is given, sheets
+    that aren't in memory are looked up there before being tokenized.
+
+    It has the same iter_tokens as SheetCache, so it can be used anywhere
+    a SheetCache can, and it's safe to use from several threads at once.
+    """
+
+    def __init__ (self, max_size=DEFAULT_MAX_MEMORY_SIZE, backing=None) :
+
+        self.max_size   = max_size
+        self.backing    = backing
+        # path: ((size, modification time), list of token batches), least recently used first
+        self.sheets     = OrderedDict()
+        self.total_size = 0
+        self.lock       = threading.Lock()
+
+    def iter_tokens (self, file_path) :
+        """
+        get the tokens for the sheet at file_path
+
+        Yields lists of tokens in order, from memory if the sheet hasn't
+        changed since it was last tokenized.
+        """
+
+        stat_info = os.stat(file_path)
+        sheet_key = (stat_info.st_size, stat_info.st_mtime_ns)
+
+        with self.lock :
+            entry = self.sheets.get(file_path)
+            if (entry is not None) and (entry[0] == sheet_key) :
+                self.sheets.move_to_end(file_path)
+                batches = entry[1]
+            else :
+                batches = None
+
+        if batches is not None :
+            for tokens in batches :
+                yield tokens
+            return
+
+        batches      = [ ]
+        token_source = swap_util.iter_file_tokens(file_path) if self.backing is None else self.backing.iter_tokens(file_path)
+        for tokens in token_source :
+            batches.append(tokens)
+            yield tokens
+
+        self._add(file_path, sheet_key, batches)
+
+    def _add (self, file_path, sheet_key, batches) :
+        """
+        keep the tokens for a sheet, dropping the least recently
+        used sheets if that puts us over max_size
+        """
+
+        with self.lock :
+            old_entry = self.sheets.pop(file_path, None)
+            if old_entry is not None :
+                self.total_size -= old_entry[0][0]
+
+            # a sheet too big for the cache isn't kept at all
+            if sheet_key[0] > self.max_size :
+                return
+
+            self.sheets[file_path] = (sheet_key, batches)
+            self.total_size       += sheet_key[0]
+            while self.total_size > self.max_size :
+                _, (dropped_key, _) = self.sheets.popitem(last=False)
+                self.total_size    -= dropped_key[0]
+
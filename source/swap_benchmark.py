@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""
+This is a benchmark for the gender swap tool's processing pipeline.
+
+It generates a synthetic corpus of sheets and a matching gender list,
+times the main steps of gendering them, and prints the results as json
+so they can be compared between versions.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import contextlib
+
+from optparse import OptionParser
+
+import swap_util
+import gender_swap
+from constants import *
+
+BENCHMARK_VERSION = 1
+
+# the genders a synthetic character can have, and what's written for each
+SYNTHETIC_GENDER_OPTIONS = [
+                               (FEMALE_GENDER,       "Female", "her"),
+                               (MALE_GENDER,         "Male",   "his"),
+                               (NEUTRAL_THEY_GENDER, "They",   "their"),
+                               (NEUTRAL_ZE_GENDER,   "Ze",     "zir"),
+                           ]
+
+FILLER_WORDS = ("the robot waited in the lab while the doctor read over notes "
+                "about three laws and the long history of the company").split()
+
+RTF_HEADER = "{\\rtf1\\ansi\\ansicpg1252\n{\\fonttbl\\f0\\fswiss\\fcharset0 Helvetica;}\n\\f0\\fs24 "
+RTF_FOOTER = "}\n"
+HTML_HEADER = "<html><body><p>"
+HTML_FOOTER = "</p></body></html>\n"
+
+def generate_gender_list (character_count, random_gen) :
+    """
+    make the lines of a gender list for character_count characters,
+    each with between two and four possible genders
+    """
+
+    lines = [ ]
+    for number in range(1, character_count + 1) :
+        options  = SYNTHETIC_GENDER_OPTIONS[:random_gen.randint(2, len(SYNTHETIC_GENDER_OPTIONS))]
+        selected = random_gen.choice(options)
+        lines.append("Character " + str(number) + ": " + "%02d" % number + ": "
+                     + "/".join([option[0] for option in options]) + ": " + selected[1] + "\n")
+
+    return lines
+
+def generate_sheet_text (size, markup_density, gender_orders, random_gen) :
+    """
+    make about size characters of sheet text where roughly markup_density
+    of the words are gendered phrases for random characters
+    """
+
+    numbers = sorted(gender_orders.keys())
+    words   = [ ]
+    length  = 0
+    while length < size :
+        if random_gen.random() < markup_density :
+            number  = random_gen.choice(numbers)
+            options = [option[2] for option in SYNTHETIC_GENDER_OPTIONS[:len(gender_orders[number])]]
+            word    = "[" + "%02d" % number + ": " + " / ".join(options) + "]"
+        else :
+            word = random_gen.choice(FILLER_WORDS)
+        words.append(word)
+        length += len(word) + 1
+        if random_gen.random() < 0.05 :
+            words.append("\n")
+
+    return " ".join(words)
+
+def generate_corpus (corpus_path, sheet_count, sheet_size, markup_density,
+                     character_count, file_types, random_seed=0) :
+    """
+    write a gender list and sheet_count synthetic sheets into corpus_path
+
+    the file types of the sheets cycle through file_types and each sheet
+    name is in the form that parse_file_name can gender
+
+    returns the path of the gender list file
+    """
+
+    random_gen = random.Random(random_seed)
+
+    os.makedirs(corpus_path, exist_ok=True)
+    gender_list_path = os.path.join(corpus_path, "genderList.txt")
+    gender_list_file = open(gender_list_path, "w")
+    gender_list_file.writelines(generate_gender_list(character_count, random_gen))
+    gender_list_file.close()
+
+    gender_list_file = open(gender_list_path, "r")
+    _, gender_orders = swap_util.parse_genderlist_file(gender_list_file.readlines())
+    gender_list_file.close()
+
+    # regenerating a corpus replaces all of its old sheets
+    sheet_path = os.path.join(corpus_path, "sheets")
+    if os.path.exists(sheet_path) :
+        shutil.rmtree(sheet_path)
+    os.makedirs(sheet_path)
+    for index in range(sheet_count) :
+        number    = (index % character_count) + 1
+        file_type = file_types[index % len(file_types)]
+        name      = ("%02d" % number + "." + ".".join(["Name" + str(option) for option in range(len(gender_orders[number]))])
+                     + ".sheet" + str(index) + file_type)
+        text      = generate_sheet_text(sheet_size, markup_density, gender_orders, random_gen)
+        if file_type == ".rtf" :
+            text = RTF_HEADER + text.replace("\n", "\\\n") + RTF_FOOTER
+        elif file_type == ".html" :
+            text = HTML_HEADER + text.replace("\n", "</p>\n<p>") + HTML_FOOTER
+        sheet_file = open(os.path.join(sheet_path, name), "w")
+        sheet_file.write(text)
+        sheet_file.close()
+
+    return gender_list_path
+
+def time_runs (function, repeat) :
+    """
+    call function repeat times with printing turned off and
+    return a list of how long each call took in seconds
+    """
+
+    times = [ ]
+    with open(os.devnull, "w") as null_output :
+        with contextlib.redirect_stdout(null_output) :
+            for _ in range(repeat) :
+                start = time.perf_counter()
+                function()
+                times.append(time.perf_counter() - start)
+
+    return times
+
+def summarize_times (times, item_count) :
+    """
+    summarize timing results for a step that handles item_count things per run
+    """
+
+    best = min(times)
+
+    return {
+                "runs"             : times,
+                "best_seconds"     : best,
+                "mean_seconds"     : sum(times) / len(times),
+                "items"            : item_count,
+                "items_per_second" : (item_count / best) if best > 0 else None,
+           }
+
+def run_benchmark (corpus_path, repeat=3, swap_args=( )) :
+    """
+    time each step of the pipeline on the corpus in corpus_path
+    (as made by generate_corpus) and return the results as a dictionary
+
+    swap_args are any extra command line options to pass to the swap command
+    """
+
+    gender_list_path = os.path.join(corpus_path, "genderList.txt")
+    sheet_path       = os.path.join(corpus_path, "sheets")
+    output_path      = os.path.join(corpus_path, "out")
+
+    gender_list_file = open(gender_list_path, "r")
+    gender_lines     = gender_list_file.readlines()
+    gender_list_file.close()
+    gender_defs, gender_orders = swap_util.parse_genderlist_file(gender_lines)
+
+    sheet_names = sorted(os.listdir(sheet_path))
+    sheet_texts = [ ]
+    for name in sheet_names :
+        sheet_file = open(os.path.join(sheet_path, name), "r")
+        sheet_texts.append(sheet_file.read())
+        sheet_file.close()
+    total_size = sum([len(text) for text in sheet_texts])
+
+    results = { }
+
+    results["parse_genderlist_file"] = summarize_times(
+        time_runs(lambda : swap_util.parse_genderlist_file(gender_lines), repeat),
+        len(gender_lines))
+
+    def parse_all_sheets () :
+        gender_plan = swap_util.GenderPlan(gender_defs, gender_orders)
+        for text in sheet_texts :
+            swap_util.parse_ungendered_sheet(text, gender_defs, gender_orders, genderPlan=gender_plan)
+    results["parse_ungendered_sheet"] = summarize_times(time_runs(parse_all_sheets, repeat), len(sheet_texts))
+    results["parse_ungendered_sheet"]["characters"] = total_size
+
+    def parse_all_names () :
+        for name in sheet_names :
+            swap_util.parse_file_name(name, gender_defs, gender_orders)
+    results["parse_file_name"] = summarize_times(time_runs(parse_all_names, repeat), len(sheet_names))
+
+    def gender_all_names () :
+        swap_util.FileNameTable(gender_defs, gender_orders).gender_file_names(sheet_names)
+    results["gender_file_names"] = summarize_times(time_runs(gender_all_names, repeat), len(sheet_names))
+
+    def swap_all () :
+        if os.path.exists(output_path) :
+            shutil.rmtree(output_path)
+        real_argv = sys.argv
+        sys.argv  = (["gender_swap", "swap", "-p", "-g", gender_list_path, "-i", sheet_path, "-o", output_path]
+                     + list(swap_args))
+        try :
+            gender_swap.main()
+        finally :
+            sys.argv = real_argv
+    results["swap"] = summarize_times(time_runs(swap_all, repeat), len(sheet_names))
+    results["swap"]["characters"] = total_size
+
+    return results
+
+def main () :
+    usage = """
+%prog [options]
+generates a synthetic corpus and prints json timing results for the swap pipeline
+examples:
+
+python -m swap_benchmark --sheets 500 --size 20000 --types .txt,.rtf > results.json
+python -m swap_benchmark --swapArgs="-j 4"
+
+"""
+
+    parser = OptionParser(usage=usage)
+
+    parser.add_option("--sheets", dest="sheetCount", type="int", default=100,
+                      help="the number of sheets to generate")
+    parser.add_option("--size", dest="sheetSize", type="int", default=10000,
+                      help="the approximate size of each sheet in characters")
+    parser.add_option("--density", dest="markupDensity", type="float", default=0.05,
+                      help="the fraction of words in each sheet that are gendered phrases")
+    parser.add_option("--characters", dest="characterCount", type="int", default=20,
+                      help="the number of characters in the gender list")
+    parser.add_option("--types", dest="fileTypes", default=".txt,.rtf",
+                      help="a comma separated list of the file types to cycle through for the sheets")
+    parser.add_option("--repeat", dest="repeat", type="int", default=3,
+                      help="how many times to run each step")
+    parser.add_option("--seed", dest="seed", type="int", default=0,
+                      help="the random seed used to generate the corpus")
+    parser.add_option("--swapArgs", dest="swapArgs", default="",
+                      help="extra options to pass to the swap command, like \"-j 4\"")
+    parser.add_option("--corpusDir", dest="corpusDirectory", default=None,
+                      help="generate the corpus here and keep it, rather than in a temporary directory")
+
+    (options, args) = parser.parse_args()
+
+    file_types  = [file_type.strip() for file_type in options.fileTypes.split(",") if file_type.strip()]
+    corpus_path = options.corpusDirectory if options.corpusDirectory is not None else tempfile.mkdtemp(prefix="gender_swap_benchmark_")
+
+    try :
+        generate_corpus(corpus_path, options.sheetCount, options.sheetSize, options.markupDensity,
+                        options.characterCount, file_types, random_seed=options.seed)
+        results = run_benchmark(corpus_path, repeat=options.repeat, swap_args=options.swapArgs.split())
+    finally :
+        if options.corpusDirectory is None :
+            shutil.rmtree(corpus_path)
+
+    report = {
+                 "benchmark_version" : BENCHMARK_VERSION,
+                 "python"            : platform.python_version(),
+                 "platform"          : platform.platform(),
+                 "config"            : {
+                                           "sheets"         : options.sheetCount,
+                                           "sheet_size"     : options.sheetSize,
+                                           "markup_density" : options.markupDensity,
+                                           "characters"     : options.characterCount,
+                                           "file_types"     : file_types,
+                                           "repeat"         : options.repeat,
+                                           "seed"           : options.seed,
+                                           "swap_args"      : options.swapArgs,
+                                       },
+                 "results"           : results,
+             }
+    print (json.dumps(report, indent=1, sort_keys=True))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+This is a simple client for the gender swap server (see swap_server),
+for trying the server out and checking how fast it answers.
+
+examples:
+
+python swap_client.py castings
+python swap_client.py sheets
+python swap_client.py render genderList_201310run "01.Susan Calvin.Scott Calvin.Doctor Calvin.rtf"
+python swap_client.py bundle genderList_201310run 1 -o ./01.zip
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from optparse import OptionParser
+
+from swap_server import DEFAULT_SERVER_HOST, DEFAULT_SERVER_PORT
+
+def send_request (host, port, path, params=None) :
+    """
+    ask the server at host and port for path (with the
+    given dictionary of query parameters, if any)
+
+    returns a tuple in the form:
+
+        (http status, file name the server suggested or None, response body as bytes)
+    """
+
+    url = "http://" + host + ":" + str(port) + path
+    if params :
+        url += "?" + urllib.parse.urlencode(params)
+
+    try :
+        response = urllib.request.urlopen(url)
+    except urllib.error.HTTPError as error :
+        response = error
+
+    try :
+        status      = response.status if hasattr(response, "status") else response.code
+        disposition = response.headers.get("Content-Disposition", "")
+        body        = response.read()
+    finally :
+        response.close()
+
+    file_name = None
+    if "filename*=UTF-8''" in disposition :
+        file_name = urllib.parse.unquote(disposition.split("filename*=UTF-8''", 1)[1])
+
+    return status, file_name, body
+
+def main () :
+    usage = """
+%prog [options] castings
+%prog [options] sheets
+%prog [options] render casting "sheet file name"
+%prog [options] bundle casting [character number]
+
+ask a running gender swap server (python -m gender_swap serve) for
+gendered sheets; render and bundle save what they get in the current
+directory (or the file given with -o) and print how long it took
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option('--host', dest='host', default=DEFAULT_SERVER_HOST,
+                      help="the host the server is running on")
+    parser.add_option('--port', dest='port', type="int", default=DEFAULT_SERVER_PORT,
+                      help="the port the server is listening on")
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help="the file to save a rendered sheet or bundle in")
+    parser.add_option('-r', '--repeat', dest='repeat', type="int", default=1,
+                      help="how many times to send the request (the fastest time is printed)")
+
+    (options, args) = parser.parse_args()
+
+    if (not args) or (args[0] not in ("castings", "sheets", "render", "bundle")) :
+        parser.print_help()
+        return 1
+
+    command = args[0]
+    params  = { }
+    if command == "render" :
+        if len(args) != 3 :
+            parser.error("render needs a casting and a sheet file name")
+        params = { "casting" : args[1], "sheet" : args[2] }
+    elif command == "bundle" :
+        if len(args) not in (2, 3) :
+            parser.error("bundle needs a casting and optionally a character number")
+        params = { "casting" : args[1] }
+        if len(args) == 3 :
+            params["character"] = args[2]
+
+    times = [ ]
+    for _ in range(max(options.repeat, 1)) :
+        start = time.perf_counter()
+        status, file_name, body = send_request(options.host, options.port, "/" + command, params)
+        times.append(time.perf_counter() - start)
+
+    if status != 200 :
+        print ("Error " + str(status) + ": " + json.loads(body.decode("utf-8")).get("error", ""))
+        return 1
+
+    if command in ("castings", "sheets") :
+        print (json.dumps(json.loads(body.decode("utf-8")), indent=1, sort_keys=True))
+        return 0
+
+    output_path = options.output if options.output is not None else os.path.basename(file_name)
+    output_file = open(output_path, "wb")
+    output_file.write(body)
+    output_file.close()
+    print ("Saved " + str(len(body)) + " bytes to " + output_path + " in %.1f ms" % (min(times) * 1000.0))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+This module checks sheets for problems with their gender markup,
+separately from gendering them.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import swap_log
+import swap_util
+
+class LintIssue :
+    """
+    One problem found in a sheet's gender markup.
+    """
+
+    __slots__ = ("file_path", "line_number", "kind", "phrase", "message")
+
+    def __init__ (self, file_path, line_number, kind, phrase, message) :
+        """
+        kind is one of the problem kinds in swap_log (like swap_log.UNKNOWN_CHARACTER)
+        """
+
+        self.file_path   = file_path
+        self.line_number = line_number
+        self.kind        = kind
+        self.phrase      = phrase
+        self.message     = message
+
+    def as_dict (self) :
+        """
+        this issue in a form that can be saved as json
+        """
+
+        return {
+                   "file"    : self.file_path,
+                   "line"    : self.line_number,
+                   "kind"    : self.kind,
+                   "phrase"  : self.phrase,
+                   "message" : self.message,
+               }
+
+    def __str__ (self) :
+
+        return str(self.file_path) + ":" + str(self.line_number) + ": " + self.kind + ": " + self.message
+
+def lint_phrase (phrase, gender_plan) :
+    """
+    check one MarkupPhrase against the gender plan
+
+    returns a list of (kind, message) tuples, one for each problem found
+    """
+
+    problems = [ ]
+    number   = phrase.character_number
+
+    if phrase.text.find("[", 1) >= 0 :
+        problems.append((swap_log.UNEXPECTED_BRACKET,
+                         "Unexpected [ character found inside phrase: " + phrase.text))
+
+    if number < 0 :
+        problems.append((swap_log.BAD_CHARACTER_NUMBER,
+                         "Unable to extract character number from phrase: " + phrase.text))
+    elif number not in gender_plan.gender_list :
+        problems.append((swap_log.UNKNOWN_CHARACTER,
+                         "Character number " + str(number) + " is not in the gender list: " + phrase.text))
+    elif len(phrase.options) != gender_plan.gender_list.option_count(number) :
+        problems.append((swap_log.WRONG_OPTION_COUNT,
+                         "Expected " + str(gender_plan.gender_list.option_count(number)) + " options but found "
+                         + str(len(phrase.options)) + ": " + phrase.text))
+    else :
+        for term, expected_gender in zip(phrase.options, gender_plan.gender_list.option_genders(number)) :
+            for other_gender in swap_util.find_gender_mismatches(term, expected_gender) :
+                problems.append((swap_log.TERM_GENDER_MISMATCH,
+                                 "The term \"" + term + "\" was given as a " + expected_gender
+                                 + " term but is more commonly considered " + other_gender + ": " + phrase.text))
+
+    return problems
+
+def lint_tokens (token_batches, gender_plan, file_path=None) :
+    """
+    check the tokens of one sheet (as lists of tokens, like those from
+    swap_util.iter_sheet_tokens) against the gender plan
+
+    returns a list of LintIssues
+    """
+
+    issues      = [ ]
+    line_number = 1
+    for tokens in token_batches :
+        for token in tokens :
+            if isinstance(token, str) :
+                line_number += token.count("\n")
+                continue
+            for kind, message in lint_phrase(token, gender_plan) :
+                issues.append(LintIssue(file_path, line_number, kind, token.text, message))
+            line_number += token.original_text().count("\n")
+
+    return issues
+
+def lint_file (file_path, gender_plan, sheet_cache=None) :
+    """
+    check the sheet at file_path against the gender plan, using the
+    sheet cache for its tokens if one is given
+
+    returns a list of LintIssues
+    """
+
+    if sheet_cache is not None :
+        return lint_tokens(sheet_cache.iter_tokens(file_path), gender_plan, file_path=file_path)
+
+    return lint_tokens(swap_util.iter_file_tokens(file_path), gender_plan, file_path=file_path)
+
+def lint_gender_plan (gender_plan) :
+    """
+    check the gender list itself for characters whose selected gender
+    isn't one of their possible genders
+
+    returns a list of LintIssues
+    """
+
+    issues = [ ]
+    genderList = gender_plan.gender_list
+    for position, number in enumerate(genderList.numbers) :
+        if genderList.selected_indexes[position] < 0 :
+            name, gender = genderList.names[position], genderList.genders[position]
+            issues.append(LintIssue(None, None, swap_log.UNKNOWN_GENDER, None,
+                                    "The selected gender (" + str(gender) + ") for character " + str(number)
+                                    + " (" + name + ") is not one of their possible genders."))
+
+    return issues
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+This module handles logging and diagnostic counts for the gender swap tool.
+
+Messages about individual gendered phrases are counted per file and only
+logged one by one at the debug level; at the default level each file gets
+a single summary line instead.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import json
+import logging
+import threading
+
+LOG = logging.getLogger("gender_swap")
+
+# the kinds of problems that can be found in gendered phrases
+BAD_CHARACTER_NUMBER = "bad character number"
+UNEXPECTED_BRACKET   = "unexpected ["
+UNKNOWN_CHARACTER    = "unknown character"
+WRONG_OPTION_COUNT   = "wrong number of options"
+TERM_GENDER_MISMATCH = "term gender mismatch"
+UNKNOWN_GENDER       = "unknown selected gender"
+
+# the diagnostics for the file being processed in each thread
+_current = threading.local()
+
+# the total number of each kind of problem found during this run
+total_counts = { }
+
+class FileDiagnostics :
+    """
+    The counts of each kind of problem found while processing one file.
+    """
+
+    def __init__ (self, file_path) :
+
+        self.file_path = file_path
+        self.counts    = { }
+
+    def warning_count (self) :
+        """
+        the total number of problems found in this file
+        """
+
+        return sum(self.counts.values())
+
+    def summary (self) :
+        """
+        a short description of the problems found in this file
+        """
+
+        return summarize_counts(self.counts)
+
+def summarize_counts (counts) :
+    """
+    a short description of a dictionary of counts of each kind of problem
+    """
+
+    if len(counts) <= 0 :
+        return "no warnings"
+
+    return (str(sum(counts.values())) + " warnings ("
+            + ", ".join([str(counts[kind]) + " " + kind for kind in sorted(counts.keys())]) + ")")
+
+def start_file (file_path) :
+    """
+    start counting problems for the file at file_path in this thread
+    """
+
+    _current.diagnostics = FileDiagnostics(file_path)
+
+    return _current.diagnostics
+
+def finish_file (output_path=None) :
+    """
+    stop counting problems for the current file in this thread, log a
+    summary of them and add them to the totals for the run
+
+    returns the FileDiagnostics for the file
+    """
+
+    diagnostics            = _current.diagnostics
+    _current.diagnostics   = None
+    _current.last_finished = diagnostics
+
+    add_to_totals(diagnostics)
+
+    message = "Gendered " + diagnostics.file_path
+    if output_path is not None :
+        message += " -> " + output_path
+    LOG.info(message + ": " + diagnostics.summary(),
+             extra={ "diagnostics" : { "file"     : diagnostics.file_path,
+                                       "output"   : output_path,
+                                       "warnings" : diagnostics.counts } })
+
+    return diagnostics
+
+def get_last_finished () :
+    """
+    get the FileDiagnostics for the last file finished in this thread
+    """
+
+    return getattr(_current, "last_finished", None)
+
+def add_to_totals (diagnostics) :
+    """
+    add the counts from one file's diagnostics to the totals for the run
+    """
+
+    for kind, count in diagnostics.counts.items() :
+        total_counts[kind] = total_counts.get(kind, 0) + count
+
+def log_totals () :
+    """
+    log a summary of all the problems found during this run
+    """
+
+    LOG.info("Total for all sheets: " + summarize_counts(total_counts),
+             extra={ "diagnostics" : { "warnings" : total_counts } })
+
+def phrase_warning (kind, message, *args) :
+    """
+    note a problem with one gendered phrase
+
+    If a file is being processed in this thread the problem is counted and
+    the message is only logged at the debug level, otherwise it's logged as
+    a warning. The message is formatted with args (in the same way as the
+    logging module does) only if it's actually going to be logged.
+    """
+
+    diagnostics = getattr(_current, "diagnostics", None)
+
+    if diagnostics is None :
+        LOG.warning(message, *args)
+    else :
+        diagnostics.counts[kind] = diagnostics.counts.get(kind, 0) + 1
+        if LOG.isEnabledFor(logging.DEBUG) :
+            LOG.debug(message, *args)
+
+class JsonFormatter (logging.Formatter) :
+    """
+    Formats each log record as one line of json.
+    """
+
+    def format (self, record) :
+
+        data = {
+                   "time"    : record.created,
+                   "level"   : record.levelname.lower(),
+                   "message" : record.getMessage(),
+               }
+        if getattr(record, "diagnostics", None) is not None :
+            data["diagnostics"] = record.diagnostics
+        if record.exc_info :
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text :
+            data["exception"] = record.exc_text
+
+        return json.dumps(data, sort_keys=True)
+
+class CollectingHandler (logging.Handler) :
+    """
+    Holds on to log records so they can be handled somewhere else later,
+    like in the main process after a worker process is done with a file.
+    """
+
+    def __init__ (self) :
+
+        super(CollectingHandler, self).__init__()
+
+        self.records = [ ]
+
+    def emit (self, record) :
+
+        # make sure the record can be sent between processes
+        record.msg  = record.getMessage()
+        record.args = None
+        if record.exc_info :
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+    def take_records (self) :
+        """
+        return all the records collected so far and start a new list
+        """
+
+        records      = self.records
+        self.records = [ ]
+
+        return records
+
+def setup_logging (level=logging.INFO, json_output=False, stream=None, handler=None) :
+    """
+    send log messages at or above level to stream (stdout by default),
+    either as plain text or as one json object per line
+
+    if a handler is given, messages go to it instead of a stream
+    """
+
+    if handler is None :
+        handler = logging.StreamHandler(sys.stdout if stream is None else stream)
+        handler.setFormatter(JsonFormatter() if json_output else logging.Formatter("%(message)s"))
+
+    for old_handler in list(LOG.handlers) :
+        LOG.removeHandler(old_handler)
+    LOG.addHandler(handler)
+    LOG.setLevel(level)
+    LOG.propagate = False
+
+    return handler
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+"""
+This module runs the gender swap tool as a long running local http server,
+so other programs (like a casting website) can get gendered sheets without
+starting a new copy of the tool for every request.
+
+The gender lists are parsed once (and again only when they change) and the
+sheets are tokenized once and kept in memory (see sheet_cache.MemorySheetCache),
+so each request only has to render the sheets it asks for. The server answers:
+
+    GET /castings
+        json describing each casting (gender list) and its characters
+    GET /sheets
+        a json list of the names of the sheets in the input directory
+    GET /render?casting=NAME&sheet=FILE NAME
+        the gendered version of one sheet for a casting
+    GET /bundle?casting=NAME[&character=NUMBER]
+        a zip file of the gendered versions of all of a casting's sheets
+        (or only the sheets for one of its characters)
+
+Errors are returned with the matching http status and a json body in the
+form { "error" : message }. See swap_client for a simple client.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import io
+import os
+import json
+import locale
+import zipfile
+import threading
+import http.server
+import urllib.parse
+
+import swap_log
+import swap_util
+from constants   import *
+from swap_log    import LOG
+from sheet_cache import MemorySheetCache, DEFAULT_MAX_MEMORY_SIZE
+
+# where the server listens by default (only on this computer)
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8642
+
+# the content type sent back for each kind of sheet
+SHEET_CONTENT_TYPES = {
+                          ".txt"  : "text/plain",
+                          ".rtf"  : "application/rtf",
+                          ".html" : "text/html",
+                          ".docx" : "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                          ".odt"  : "application/vnd.oasis.opendocument.text",
+                      }
+
+class RequestError (Exception) :
+    """
+    a request that can't be answered, with the http status to answer it with
+    """
+
+    def __init__ (self, status, message) :
+
+        Exception.__init__(self, message)
+        self.status = status
+
+class Casting :
+    """
+    One gender list the server genders sheets for, named after its file
+    (like the multiswap command's output directories). It's parsed when it's
+    first needed and parsed again whenever the file's size or modification
+    time changes.
+    """
+
+    def __init__ (self, gender_list_path) :
+
+        self.name             = os.path.splitext(os.path.basename(gender_list_path))[0]
+        self.gender_list_path = gender_list_path
+        self.file_key         = None
+        self.gender_info      = None
+        self.lock             = threading.Lock()
+
+    def get_gender_info (self) :
+        """
+        get the parsed gender list as a tuple in the form:
+
+            (gender_defs, gender_ordering, gender_plan)
+        """
+
+        stat_info = os.stat(self.gender_list_path)
+        file_key  = (stat_info.st_size, stat_info.st_mtime_ns)
+
+        with self.lock :
+            if file_key != self.file_key :
+                LOG.info("Opening and parsing gender list: %s", self.gender_list_path)
+                gender_list_file = open(self.gender_list_path, "r")
+                try :
+                    gender_defs, gender_ordering = swap_util.parse_genderlist_file(gender_list_file.readlines())
+                finally :
+                    gender_list_file.close()
+                self.gender_info = (gender_defs, gender_ordering, swap_util.GenderPlan(gender_defs, gender_ordering))
+                self.file_key    = file_key
+
+            return self.gender_info
+
+class SwapService :
+    """
+    Genders the sheets in one input directory for any of a set of castings,
+    keeping everything it can in memory between requests.
+
+    Each sheet is rendered the same way the swap command would save it
+    (including its gendered file name, if process_file_names is True), but
+    into memory instead of a file. If a sheet_cache.SheetCache is given, it's
+    used for sheets that aren't in memory yet.
+    """
+
+    def __init__ (self, input_path, gender_list_paths, process_file_names=False, sheet_cache=None,
+                  max_memory_size=DEFAULT_MAX_MEMORY_SIZE) :
+
+        self.input_path         = os.path.abspath(input_path)
+        self.process_file_names = process_file_names
+        self.token_cache        = MemorySheetCache(max_size=max_memory_size, backing=sheet_cache)
+        # the encoding sheets are read and saved with when they're text
+        self.text_encoding      = locale.getpreferredencoding(False)
+
+        self.castings = { }
+        for gender_list_path in gender_list_paths :
+            casting = Casting(gender_list_path)
+            if casting.name in self.castings :
+                raise ValueError("More than one gender list is named " + casting.name + ".")
+            self.castings[casting.name] = casting
+
+    def warm_up (self) :
+        """
+        parse every gender list and tokenize every sheet, so
+        the first requests don't have to wait for it
+
+        .docx and .odt sheets aren't kept in memory (their parts are gendered
+        one at a time as they're read), so they aren't warmed up and every
+        request for one reads it again
+        """
+
+        for casting in self.castings.values() :
+            casting.get_gender_info()
+
+        for sheet_name in self.list_sheets() :
+            sheet_path = os.path.join(self.input_path, sheet_name)
+            if not swap_util.is_zip_sheet(sheet_path) :
+                for _ in self.token_cache.iter_tokens(sheet_path) :
+                    pass
+
+    def list_sheets (self) :
+        """
+        get the sorted names of the sheets in the input directory (the files
+        whose names start with a character number and have a file type we
+        know how to gender)
+        """
+
+        return sorted([file_name for file_name in os.listdir(self.input_path) if self.is_sheet(file_name)])
+
+    def is_sheet (self, sheet_name) :
+        """
+        check whether there's a sheet named sheet_name in the input
+        directory (see list_sheets)
+        """
+
+        if (os.sep in sheet_name) or (os.altsep and (os.altsep in sheet_name)) :
+            return False
+
+        return ( sheet_name.split('.')[0].isdigit() and
+                 (os.path.splitext(sheet_name)[1] in POSSIBLE_FILE_TYPES) and
+                 os.path.isfile(os.path.join(self.input_path, sheet_name)) )
+
+    def get_casting (self, casting_name) :
+        """
+        get the gender information for a casting (see Casting.get_gender_info)
+        """
+
+        if casting_name not in self.castings :
+            raise RequestError(404, "There's no casting named " + str(casting_name) + ".")
+
+        return self.castings[casting_name].get_gender_info()
+
+    def describe_castings (self) :
+        """
+        describe each casting and its characters, in a form that can be sent as json
+        """
+
+        description = { }
+        for casting_name in sorted(self.castings.keys()) :
+            gender_defs, _, _ = self.get_casting(casting_name)
+            description[casting_name] = {
+                                            "gender_list" : self.castings[casting_name].gender_list_path,
+                                            "characters"  : dict([(str(number), { "name"   : gender_defs[number][0],
+                                                                                  "gender" : gender_defs[number][1] })
+                                                                  for number in sorted(gender_defs.keys())]),
+                                        }
+
+        return description
+
+    def render_sheet (self, casting_name, sheet_name) :
+        """
+        gender one sheet for a casting
+
+        returns a tuple in the form (output file name, gendered sheet as bytes)
+        """
+
+        gender_defs, _, _ = self.get_casting(casting_name)
+
+        if not self.is_sheet(sheet_name) :
+            raise RequestError(404, "There's no sheet named " + str(sheet_name) + ".")
+        if int(sheet_name.split('.')[0]) not in gender_defs :
+            raise RequestError(404, "The sheet " + sheet_name + " isn't for a character in the casting "
+                                    + casting_name + ".")
+
+        return self._render(casting_name, sheet_name)
+
+    def _render (self, casting_name, sheet_name) :
+        """
+        gender one sheet that's known to be in the input directory for a casting
+        (see render_sheet)
+        """
+
+        _, _, gender_plan = self.get_casting(casting_name)
+        sheet_path = os.path.join(self.input_path, sheet_name)
+
+        output_name = sheet_name
+        if self.process_file_names :
+            output_name = gender_plan.file_names.gender_file_name(sheet_name)
+
+        swap_log.start_file(sheet_path)
+        try :
+            if swap_util.is_zip_sheet(sheet_path) :
+                output_file = io.BytesIO()
+                swap_util.gender_zip_sheet(sheet_path, [(output_file, gender_plan)])
+                data = output_file.getvalue()
+            else :
+                data = "".join([gender_plan.render_tokens(tokens)
+                                for tokens in self.token_cache.iter_tokens(sheet_path)]).encode(self.text_encoding)
+        finally :
+            swap_log.finish_file(casting_name + "/" + output_name)
+
+        return output_name, data
+
+    def render_bundle (self, casting_name, character_number=None) :
+        """
+        gender all of a casting's sheets (or if character_number is given,
+        only the sheets for that character) and put them in a zip file
+
+        returns a tuple in the form (zip file name, zip file as bytes)
+        """
+
+        gender_defs, _, _ = self.get_casting(casting_name)
+
+        if character_number is None :
+            sheet_names = [sheet_name for sheet_name in self.list_sheets()
+                           if int(sheet_name.split('.')[0]) in gender_defs]
+            bundle_name = casting_name + ".zip"
+        else :
+            if character_number not in gender_defs :
+                raise RequestError(404, "There's no character " + str(character_number) + " in the casting "
+                                        + casting_name + ".")
+            sheet_names = [sheet_name for sheet_name in self.list_sheets()
+                           if int(sheet_name.split('.')[0]) == character_number]
+            bundle_name = casting_name + "." + ("%02d" % character_number) + "." + gender_defs[character_number][0] + ".zip"
+
+        bundle_file = io.BytesIO()
+        bundle_zip  = zipfile.ZipFile(bundle_file, "w", compression=zipfile.ZIP_DEFLATED)
+        for sheet_name in sheet_names :
+            output_name, data = self._render(casting_name, sheet_name)
+            bundle_zip.writestr(output_name, data)
+        bundle_zip.close()
+
+        return bundle_name, bundle_file.getvalue()
+
+class SwapRequestHandler (http.server.BaseHTTPRequestHandler) :
+    """
+    Answers the requests described in the module documentation
+    using the server's SwapService.
+    """
+
+    server_version = "gender_swap/0.6"
+
+    def do_GET (self) :
+
+        url   = urllib.parse.urlsplit(self.path)
+        query = dict([(key, values[-1]) for key, values in urllib.parse.parse_qs(url.query).items()])
+        try :
+            if url.path == "/castings" :
+                self._send_json(200, self.server.service.describe_castings())
+            elif url.path == "/sheets" :
+                self._send_json(200, self.server.service.list_sheets())
+            elif url.path == "/render" :
+                output_name, data = self.server.service.render_sheet(self._get_param(query, "casting"),
+                                                                     self._get_param(query, "sheet"))
+                self._send_file(output_name, data)
+            elif url.path == "/bundle" :
+                character_number = query.get("character")
+                if character_number is not None :
+                    if not character_number.isdigit() :
+                        raise RequestError(400, "The character should be a character number.")
+                    character_number = int(character_number)
+                bundle_name, data = self.server.service.render_bundle(self._get_param(query, "casting"),
+                                                                      character_number=character_number)
+                self._send_file(bundle_name, data, content_type="application/zip")
+            else :
+                raise RequestError(404, "Unknown request: " + url.path)
+        except RequestError as error :
+            self._send_json(error.status, { "error" : str(error) })
+        except Exception as error :
+            LOG.exception("Unable to answer request: %s", self.path)
+            self._send_json(500, { "error" : str(error) })
+
+    def _get_param (self, query, name) :
+        """
+        get a parameter the request has to have
+        """
+
+        if name not in query :
+            raise RequestError(400, "The " + name + " parameter is missing.")
+
+        return query[name]
+
+    def _send_json (self, status, content) :
+        """
+        answer with some json
+        """
+
+        self._send(status, json.dumps(content, sort_keys=True).encode("utf-8"), "application/json")
+
+    def _send_file (self, file_name, data, content_type=None) :
+        """
+        answer with a file, named file_name if it's saved
+        """
+
+        if content_type is None :
+            content_type = SHEET_CONTENT_TYPES.get(os.path.splitext(file_name)[1].lower(), "application/octet-stream")
+            if content_type.startswith("text/") :
+                content_type += "; charset=" + self.server.service.text_encoding
+
+        self._send(200, data, content_type,
+                   { "Content-Disposition" : "attachment; filename*=UTF-8''" + urllib.parse.quote(file_name) })
+
+    def _send (self, status, data, content_type, headers=None) :
+        """
+        answer the request
+        """
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for header, value in (headers or { }).items() :
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message (self, format, *args) :
+
+        LOG.debug("%s - %s", self.address_string(), format % args)
+
+def make_server (service, host=DEFAULT_SERVER_HOST, port=DEFAULT_SERVER_PORT) :
+    """
+    make an http server that answers requests with the given SwapService,
+    one thread per request (call its serve_forever to start answering)
+    """
+
+    server         = http.server.ThreadingHTTPServer((host, port), SwapRequestHandler)
+    server.service = service
+
+    return server
@@ -18,88 +18,1612 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import io
 import os
+import codecs
 import re
+import queue
+import bisect
+import zipfile
+import itertools
+import threading
+import multiprocessing
+import concurrent.futures
 
+import swap_log
+import rtf_sheet
+import html_sheet
+import zip_sheet
+import pdf_packet
+import zip_bundle
+import gender_list
+import pronoun_sets
+import atomic_output
 from constants import *
+from swap_log  import LOG
+
+# gendered word markup looks like: [02: her/his]
+#GENDERED_WORD_PATTERN = re.compile(r"\[(\d+):\s*([^\]]*)]", re.DOTALL)
+GENDERED_WORD_PATTERN = re.compile(r"\[([\d\s]+):\s*([^\]]*)]", re.DOTALL)
+# this should change whenever the markup pattern or the way sheets are
+# tokenized changes, so that previously cached tokens aren't used
+MARKUP_GRAMMAR_VERSION = 2
+
+# how much text to read from a sheet at a time when streaming it
+SHEET_CHUNK_SIZE  = 1024 * 1024
+# the longest gendered phrase that will be held back waiting for its closing ]
+MAX_PHRASE_LENGTH = 1024 * 1024
+# how many chunks of text can wait between one stage of the sheet pipeline
+# and the next before the earlier stage has to wait for the later one to catch up
+PIPELINE_QUEUE_SIZE   = 8
+# how often a stage of the pipeline that's waiting checks whether it should stop
+PIPELINE_POLL_SECONDS = 0.1
+
+# file type: the class used to split that kind of formatted document into
+# (raw text, visible text) pieces; any other type is treated as plain text
+SHEET_LEXERS = {
+                   ".rtf"  : rtf_sheet.RtfLexer,
+                   ".html" : html_sheet.HtmlLexer,
+               }
+
+class MarkupPhrase :
+    """
+    One gendered phrase found in a sheet, like: [02: her/his]
+    
+    This holds everything about the phrase that doesn't depend on
+    which genders are selected, so it can be rendered for any number
+    of gender lists without matching it again.
+    """
+
+    __slots__ = ("text", "character_number", "options")
+
+    def __init__ (self, text, character_number, options) :
+        """
+        text is the full text of the phrase, character_number is the character
+        number it refers to (or -1 if that could not be parsed) and options
+        is the list of gendered options with any whitespace stripped off
+        """
+
+        self.text             = text
+        self.character_number = character_number
+        self.options          = options
+
+    @classmethod
+    def from_match (cls, matchInfo) :
+        """
+        build a phrase from a match of GENDERED_WORD_PATTERN
+        """
+
+        # double check that our characterNumber is a number
+        characterNumber = "".join(matchInfo.group(1).split())
+        if characterNumber == "" :
+            swap_log.phrase_warning(swap_log.BAD_CHARACTER_NUMBER,
+                                    "Unable to extract character number from text: %s", matchInfo.group(1))
+            characterNumber = -1
+        else :
+            characterNumber = int(characterNumber)
+
+        return cls(matchInfo.group(0), characterNumber,
+                   [option.strip() for option in matchInfo.group(2).split('/')])
+
+    def original_text (self) :
+        """
+        the text to leave in place of this phrase if it can't be gendered
+        """
+
+        return self.text
+
+    def option_text (self, index) :
+        """
+        the text to put in place of this phrase when option index is selected
+        """
+
+        return self.options[index]
+
+class FormattedPhrase (MarkupPhrase) :
+    """
+    A gendered phrase found in the visible text of a formatted document
+    (like an rtf file), where the phrase may be broken up by formatting.
+    
+    The text and options are what a reader would see; raw is the phrase as
+    it's written in the document and renderings holds the raw text to use
+    for each option, with all of the formatting from inside the phrase kept.
+    """
+
+    __slots__ = ("raw", "renderings")
+
+    def __init__ (self, text, character_number, options, raw=None, renderings=None) :
+
+        MarkupPhrase.__init__(self, text, character_number, options)
+
+        self.raw        = text if raw is None else raw
+        self.renderings = options if renderings is None else renderings
+
+    @classmethod
+    def from_pieces (cls, matchInfo, pieces, kept_raw=None) :
+        """
+        build a phrase from a match of GENDERED_WORD_PATTERN in visible text
+        and the (raw text, visible text) pieces that make up that match
+        
+        if kept_raw is given, it's called with the raw text of each piece
+        without visible text as it's kept in a rendering, and returns the
+        raw text to use instead
+        """
+
+        phrase = cls.from_match(matchInfo)
+
+        # with no formatting inside it, the phrase renders just like plain text
+        if all([raw == visible for raw, visible in pieces]) :
+            return phrase
+
+        phrase.raw = "".join([raw for raw, _ in pieces])
+
+        # find where each stripped option is in the visible text of the phrase
+        spans = [ ]
+        start = matchInfo.start(2) - matchInfo.start()
+        for option in matchInfo.group(2).split('/') :
+            stripped = option.strip()
+            offset   = start + len(option) - len(option.lstrip())
+            spans.append((offset, offset + len(stripped)))
+            start   += len(option) + 1
+
+        # keep the visible text for the option and everything that isn't visible
+        phrase.renderings = [ ]
+        for span_start, span_end in spans :
+            rendering = [ ]
+            position  = 0
+            for raw, visible in pieces :
+                if not visible :
+                    rendering.append(raw if kept_raw is None else kept_raw(raw))
+                elif raw == visible :
+                    rendering.append(raw[max(span_start - position, 0):max(span_end - position, 0)])
+                elif span_start <= position < span_end :
+                    rendering.append(raw)
+                position += len(visible)
+            phrase.renderings.append("".join(rendering))
+
+        return phrase
+
+    def original_text (self) :
+
+        return self.raw
+
+    def option_text (self, index) :
+
+        return self.renderings[index]
+
+def tokenize_sheet (inputText) :
+    """
+    split the text of a sheet into a list of literal strings and
+    MarkupPhrase objects, in the order they appear in the text
+    
+    The tokens can be rendered for any gender list with
+    GenderPlan.render_tokens without matching the text again.
+    """
+
+    tokens  = [ ]
+    lastEnd = 0
+    for matchInfo in GENDERED_WORD_PATTERN.finditer(inputText) :
+        if matchInfo.start() > lastEnd :
+            tokens.append(inputText[lastEnd:matchInfo.start()])
+        tokens.append(MarkupPhrase.from_match(matchInfo))
+        lastEnd = matchInfo.end()
+    if lastEnd < len(inputText) :
+        tokens.append(inputText[lastEnd:])
+
+    return tokens
+
+def tokenize_formatted_pieces (pieces, kept_raw=None) :
+    """
+    split a list of (raw text, visible text) pieces of a formatted document
+    (see rtf_sheet.RtfLexer or html_sheet.HtmlLexer) into a list of literal strings of raw text and
+    FormattedPhrase objects, in the order they appear
+    
+    Gendered phrases are found in the visible text, so formatting that
+    breaks up a phrase doesn't stop it from being found. The pieces where
+    each phrase starts and ends are looked up by their position in the
+    visible text, so the raw text between phrases is copied as it is
+    without looking at each piece.
+    """
+
+    raw_text       = "".join([raw for raw, _ in pieces])
+    visible_text   = "".join([visible for _, visible in pieces])
+    raw_starts     = list(itertools.accumulate([len(raw) for raw, _ in pieces], initial=0))
+    visible_starts = list(itertools.accumulate([len(visible) for _, visible in pieces], initial=0))
+
+    def find_piece (visible_index) :
+        """
+        find the piece holding the visible character at visible_index and
+        the offset of that character in the piece's raw text
+        """
+
+        piece_index = bisect.bisect_right(visible_starts, visible_index, 0, len(pieces)) - 1
+        raw, visible = pieces[piece_index]
+        offset = (visible_index - visible_starts[piece_index]) if raw == visible else 0
+
+        return piece_index, offset
+
+    tokens  = [ ]
+    lastEnd = 0
+    for matchInfo in GENDERED_WORD_PATTERN.finditer(visible_text) :
+
+        first, first_offset = find_piece(matchInfo.start())
+        last,  last_offset  = find_piece(matchInfo.end() - 1)
+        raw_start = raw_starts[first] + first_offset
+        raw_end   = raw_starts[last]  + (last_offset + 1 if pieces[last][0] == pieces[last][1] else len(pieces[last][0]))
+
+        if raw_start > lastEnd :
+            tokens.append(raw_text[lastEnd:raw_start])
+
+        if first == last :
+            phrase_pieces = [(raw_text[raw_start:raw_end], matchInfo.group(0))]
+        else :
+            phrase_pieces = ([(pieces[first][0][first_offset:], pieces[first][1][first_offset:])]
+                             + pieces[first + 1:last]
+                             + [(pieces[last][0][:raw_end - raw_starts[last]], pieces[last][1][:last_offset + 1])])
+        tokens.append(FormattedPhrase.from_pieces(matchInfo, phrase_pieces, kept_raw=kept_raw))
+
+        lastEnd = raw_end
+
+    if lastEnd < len(raw_text) :
+        tokens.append(raw_text[lastEnd:])
+
+    return tokens
+
+class GenderPlan :
+    """
+    A compiled version of a gender list that can be used
+    to gender any number of sheets.
+
+    All the per character work (finding the index of the selected gender,
+    counting the expected options, etc.) is done once when the plan's
+    gender_list.GenderList is built, so gendering a phrase only needs a
+    couple of array lookups. The same goes for gendering file names, with
+    the plan's FileNameTable (file_names).
+    """
+
+    def __init__ (self, genderDefinitions, genderOrdering=None) :
+        """
+        build the plan from a gender_list.GenderList, or from the gender
+        definitions and gender ordering returned from parse_genderlist_file
+        """
+
+        if isinstance(genderDefinitions, gender_list.GenderList) :
+            self.gender_list = genderDefinitions
+        else :
+            self.gender_list = gender_list.GenderList.from_dicts(genderDefinitions, genderOrdering)
+        self.file_names  = FileNameTable(self.gender_list)
+        self.pattern     = GENDERED_WORD_PATTERN
+
+    def gender_text (self, inputText, printWarnings=True) :
+        """
+        return the gender-specific version of the given text
+        """
+
+        def cleanup_gender_fn (matchInfo) :
+            """
+            this function will be used when calling re.sub to replace
+            each match with the appropriate gendered text
+            """
+
+            return self.render_phrase(MarkupPhrase.from_match(matchInfo), printWarnings=printWarnings)
+
+        return self.pattern.sub(cleanup_gender_fn, inputText)
+
+    def render_tokens (self, tokens, printWarnings=True, characterNumbers=None) :
+        """
+        return the gender-specific text for a list of tokens
+        (as created by tokenize_sheet)
+        
+        if a characterNumbers set is given, the character number of
+        each phrase rendered will be added to it
+        """
+
+        if characterNumbers is not None :
+            characterNumbers.update([token.character_number for token in tokens if not isinstance(token, str)])
+
+        return "".join([token if isinstance(token, str) else self.render_phrase(token, printWarnings=printWarnings)
+                        for token in tokens])
+
+    def render_phrase (self, phrase, printWarnings=True) :
+        """
+        given one MarkupPhrase, return the appropriate
+        gendered text to replace it
+        
+        This only warns about problems that stop the phrase from being
+        gendered; checking that the gendered terms match their genders
+        is left to the lint pass (see swap_lint).
+        """
+
+        toReturn        = phrase.original_text()
+        characterNumber = phrase.character_number
+
+        # if there's a "[" in the gendered text, something's gone wrong
+        if printWarnings and (phrase.text.find("[", 1) >= 0) :
+            swap_log.phrase_warning(swap_log.UNEXPECTED_BRACKET,
+                                    "Unexpected [ character found inside phrase: %s\n"
+                                    "This may indicate a serious mark up text formatting error.", phrase.text)
+
+        genderList = self.gender_list
+        position   = genderList.position(characterNumber)
+
+        if position < 0 :
+
+            if printWarnings :
+                swap_log.phrase_warning(swap_log.UNKNOWN_CHARACTER,
+                                        "Warning, unable to find character number %s in character list. "
+                                        "The following phrase will not be processed: %s", characterNumber, phrase.text)
+
+        # check if we have the number of gendered text options we expect
+        # based on the genders this character could be
+        elif len(phrase.options) != genderList.option_counts[position] :
+
+            swap_log.phrase_warning(swap_log.WRONG_OPTION_COUNT,
+                                    "The gendered phrase (%s) does not have the expected number of possible "
+                                    "gender options for this character (%s).\nThis phrase will not be parsed.",
+                                    phrase.text, genderList.option_counts[position])
+
+        else :
+
+            # pull the gendered term
+            toReturn = phrase.option_text(genderList.selected_indexes[position])
+
+        return toReturn
 
 def process_one_file (file_path, output_path,
                       gender_defs, gender_ordering,
-                      process_file_names=False) :
+                      process_file_names=False,
+                      gender_plan=None,
+                      sheet_cache=None,
+                      output_name=None) :
     """
     It is assumed that the inputs have been validated for
     existence and minimal suitability of type.
     
-    This method can only process .txt and .rtf files.
+    This method can only process .txt, .rtf, .html, .docx and .odt files.
+    In formatted files the gendered phrases are found in the visible text,
+    so formatting inside a phrase is kept (see iter_sheet_tokens). Only
+    the parts of .docx and .odt files with document text in them are
+    gendered (see gender_zip_sheet).
+    
+    If a gender_plan built from gender_defs and gender_ordering is
+    given it will be reused rather than rebuilt for this file. If the
+    output file name was already worked out (see get_output_sheet_path)
+    it can be given as output_name, so it isn't worked out again.
     
-    There are some known issues with formatting tags around the
-    syntax in .rtf files, especially where rich text formatting
-    spans the syntax.
+    The output is saved with atomic_output, so it only replaces the old
+    output once it's complete, and the old output isn't touched at all
+    if it's the same. The sheet is streamed through a chunk at a time,
+    so only a small part of it is ever held in memory. If a sheet_cache.SheetCache is given
+    the sheet's tokens will come from (or be saved to) that cache (except
+    for .docx and .odt files, whose parts are gendered one at a time).
+    
+    Returns the set of character numbers that the sheet's gendered phrases
+    (and, if process_file_names is True, its file name) refer to.
     """
 
-    print("*****")
+    swap_log.start_file(file_path)
+
+    if gender_plan is None :
+        gender_plan = GenderPlan(gender_defs, gender_ordering)
 
-    # get the text from the file and gender it
-    gendered_text = open_and_gender_sheet(file_path,
-                                          gender_defs, gender_ordering,
-                                          reason=" to set genders")
-    
     # figure out the path of the new sheet in the output directory
+    if output_name is not None :
+        out_sheet_path = os.path.join(output_path, output_name)
+    else :
+        out_sheet_path = get_output_sheet_path(file_path, output_path,
+                                               gender_defs, gender_ordering,
+                                               process_file_names=process_file_names,
+                                               gender_plan=gender_plan)
+
+    # word processor documents are archives that need to be rewritten member by member
+    if is_zip_sheet(file_path) :
+        LOG.debug("Saving gendered document from %s to: %s", file_path, out_sheet_path)
+        character_numbers = gender_zip_sheet(file_path, [(out_sheet_path, gender_plan)])
+        swap_log.finish_file(out_sheet_path)
+        return _add_file_name_character(file_path, character_numbers, process_file_names)
+
+    # open the input sheet and the output file
+    LOG.debug("Opening sheet to set genders: %s", file_path)
+    input_sheet_file = open(file_path, "r")
+    LOG.debug("Saving gendered character sheet to: %s", out_sheet_path)
+
+    # gender the text as we go, saving it in the output file (which
+    # only replaces the old output once it's complete)
+    try :
+        with atomic_output.AtomicOutputFile(out_sheet_path, "w") as out_sheet_file :
+            if sheet_cache is None :
+                character_numbers = gender_sheet_stream(input_sheet_file, out_sheet_file, gender_plan, file_path=file_path)
+            else :
+                character_numbers = set( )
+                for tokens in sheet_cache.iter_tokens(file_path) :
+                    out_sheet_file.write(gender_plan.render_tokens(tokens, characterNumbers=character_numbers))
+    finally :
+        # close the file we opened since we're done with it
+        input_sheet_file.close()
+    
+    swap_log.finish_file(out_sheet_path)
+
+    return _add_file_name_character(file_path, character_numbers, process_file_names)
+
+def _add_file_name_character (file_path, character_numbers, process_file_names) :
+    """
+    add the character the file name refers to (if it's being gendered)
+    to the set of character numbers used in a sheet and return the set
+    """
+
+    # the file name can only be gendered for the character it starts with
+    if process_file_names :
+        number = os.path.basename(file_path).split('.')[0]
+        if number.isdigit() :
+            character_numbers.add(int(number))
+
+    return character_numbers
+
+def get_output_sheet_path (file_path, output_path,
+                           gender_defs, gender_ordering,
+                           process_file_names=False,
+                           gender_plan=None) :
+    """
+    figure out the path that the gendered version of the sheet at
+    file_path should be saved to in the output_path directory
+    
+    if a gender_plan built from gender_defs and gender_ordering is
+    given, its FileNameTable is used to gender the file name
+    """
+
     file_name = os.path.basename(file_path)
-    output_sheet_name = parse_file_name (file_name, gender_defs, gender_ordering) if process_file_names else file_name
-    out_sheet_path    = os.path.join(output_path, output_sheet_name)
+    output_sheet_name = file_name
+    if process_file_names :
+        if gender_plan is not None :
+            output_sheet_name = gender_plan.file_names.gender_file_name(file_name)
+        else :
+            output_sheet_name = parse_file_name(file_name, gender_defs, gender_ordering)
+
+    return os.path.join(output_path, output_sheet_name)
+
+def process_one_file_for_castings (file_path, castings, process_file_names=False, sheet_cache=None) :
+    """
+    gender one file for several different castings at once
+    
+    castings is expected to be a list of tuples in the form:
+    
+        (output_path, gender_defs, gender_ordering, gender_plan)
+    
+    The file is read and its markup is found only once, then a
+    gendered version is rendered and saved for each casting. If a
+    sheet_cache.SheetCache is given the sheet's tokens will come from
+    (or be saved to) that cache.
+    """
+
+    swap_log.start_file(file_path)
+
+    # figure out where each casting's version of the sheet goes
+    out_paths = [ ]
+    for output_path, gender_defs, gender_ordering, gender_plan in castings :
+
+        if gender_plan is None :
+            gender_plan = GenderPlan(gender_defs, gender_ordering)
+
+        out_sheet_path = get_output_sheet_path(file_path, output_path,
+                                               gender_defs, gender_ordering,
+                                               process_file_names=process_file_names,
+                                               gender_plan=gender_plan)
+        LOG.debug("Saving gendered character sheet to: %s", out_sheet_path)
+        out_paths.append((out_sheet_path, gender_plan))
+
+    # word processor documents are archives that need to be rewritten member by member
+    if is_zip_sheet(file_path) :
+        gender_zip_sheet(file_path, out_paths)
+        swap_log.finish_file(", ".join([out_sheet_path for out_sheet_path, _ in out_paths]))
+        return
+
+    # open the input sheet and an output file for each casting
+    LOG.debug("Opening sheet to set genders: %s", file_path)
+    input_sheet_file = open(file_path, "r")
+    outputs = [(atomic_output.AtomicOutputFile(out_sheet_path, "w"), gender_plan) for out_sheet_path, gender_plan in out_paths]
+
+    # find the gendered phrases in each chunk once and render it for every casting
+    try :
+        if sheet_cache is None :
+            token_batches = iter_sheet_tokens(input_sheet_file, file_path)
+        else :
+            token_batches = sheet_cache.iter_tokens(file_path)
+        for tokens in token_batches :
+            for out_sheet_file, gender_plan in outputs :
+                out_sheet_file.write(gender_plan.render_tokens(tokens))
+    except :
+        for out_sheet_file, _ in outputs :
+            out_sheet_file.discard()
+        raise
+    finally :
+        input_sheet_file.close()
+
+    # move the finished outputs into place
+    for out_sheet_file, _ in outputs :
+        out_sheet_file.close()
+
+    swap_log.finish_file(", ".join([out_sheet_file.path for out_sheet_file, _ in outputs]))
+
+def iter_sheet_chunks (input_file, chunk_size=SHEET_CHUNK_SIZE, first_chunk_size=None) :
+    """
+    read the text of a sheet from an open file a chunk at a time
+    (if first_chunk_size is given, the first read will be that size instead,
+    which is handy for showing the start of a sheet as fast as possible)
+    
+    Yields pieces of the text in order, each of which can be gendered on
+    its own; the text is only split in places where a gendered phrase
+    can't be cut in half. Since gendered phrases can span lines, a
+    phrase that's started but not finished at the end of a chunk is held
+    back and joined with the next one (up to MAX_PHRASE_LENGTH characters,
+    after which the opening [ is treated as plain text).
+    """
+
+    carry     = ""
+    read_size = chunk_size if first_chunk_size is None else first_chunk_size
+    while True :
+        chunk     = input_file.read(read_size)
+        read_size = chunk_size
+        if not chunk :
+            break
+        text = carry + chunk
+
+        # any [ before the last ] will be finished (or fail to match) inside
+        # this text, so we only need to hold back from the first [ after that
+        split_index = text.find('[', text.rfind(']') + 1)
+        while (split_index >= 0) and (len(text) - split_index > MAX_PHRASE_LENGTH) :
+            split_index = text.find('[', split_index + 1)
+
+        if split_index < 0 :
+            carry = ""
+        else :
+            carry = text[split_index:]
+            text  = text[:split_index]
+
+        if text :
+            yield text
+
+    if carry :
+        yield carry
+
+def iter_sheet_tokens (input_file, file_path="", chunk_size=SHEET_CHUNK_SIZE, first_chunk_size=None, lexer=None,
+                       text_only=False) :
+    """
+    read a sheet from an open file and tokenize it a chunk at a time,
+    yielding a list of tokens for each chunk
+    
+    The file type of file_path decides how the sheet is tokenized; formatted
+    documents with a lexer in SHEET_LEXERS (or any document, if a lexer is
+    given) are split into pieces and their gendered phrases are found in
+    the visible text (see tokenize_formatted_pieces), anything else is
+    tokenized as plain text (see tokenize_sheet and iter_sheet_chunks).
+    
+    If text_only is True, the tokens for formatted documents are made from
+    only their visible text, so rendering them gives the text a reader would
+    see without any of the formatting (a given lexer should have been made
+    with text_only as well).
+    """
+
+    if lexer is None :
+        lexer_type = SHEET_LEXERS.get(os.path.splitext(file_path)[1].lower())
+
+        if lexer_type is None :
+            for chunk in iter_sheet_chunks(input_file, chunk_size=chunk_size, first_chunk_size=first_chunk_size) :
+                yield tokenize_sheet(chunk)
+            return
+
+        lexer = lexer_type(text_only=text_only)
+
+    carry     = [ ]
+    read_size = chunk_size if first_chunk_size is None else first_chunk_size
+    while True :
+        chunk     = input_file.read(read_size)
+        read_size = chunk_size
+        if not chunk :
+            break
+        pieces, carry = split_formatted_pieces(carry + lexer.feed(chunk))
+        if pieces :
+            yield _tokenize_lexed_pieces(pieces, lexer, text_only)
+
+    pieces = carry + lexer.close()
+    if pieces :
+        yield _tokenize_lexed_pieces(pieces, lexer, text_only)
+
+def _tokenize_lexed_pieces (pieces, lexer, text_only) :
+    """
+    tokenize (raw text, visible text) pieces from a lexer, using
+    only their visible text if text_only is True
+    """
+
+    if text_only :
+        return tokenize_sheet("".join([visible for _, visible in pieces]))
+
+    return tokenize_formatted_pieces(pieces, kept_raw=lexer.kept_raw)
+
+def iter_file_tokens (file_path, first_chunk_size=None, text_only=False) :
+    """
+    open the sheet at file_path and tokenize it a chunk at a time,
+    yielding a list of tokens for each chunk (see iter_sheet_tokens)
+    
+    for .docx and .odt files, the tokens for each part of the document
+    with document text in it are yielded one part after another
+    """
+
+    if is_zip_sheet(file_path) :
+        part_pattern, lexer_type = zip_sheet.ZIP_SHEET_PARTS[os.path.splitext(file_path)[1].lower()]
+        source_zip = zipfile.ZipFile(file_path, "r")
+        try :
+            for info in source_zip.infolist() :
+                if part_pattern.match(info.filename) :
+                    part_file = io.TextIOWrapper(source_zip.open(info), encoding="utf-8", newline="")
+                    for tokens in iter_sheet_tokens(part_file, first_chunk_size=first_chunk_size,
+                                                    lexer=lexer_type(text_only=text_only), text_only=text_only) :
+                        yield tokens
+                    part_file.close()
+        finally :
+            source_zip.close()
+        return
+
+    input_sheet_file = open(file_path, "r")
+    try :
+        for tokens in iter_sheet_tokens(input_sheet_file, file_path, first_chunk_size=first_chunk_size,
+                                        text_only=text_only) :
+            yield tokens
+    finally :
+        input_sheet_file.close()
+
+def is_zip_sheet (file_path) :
+    """
+    check whether the sheet at file_path is a word processor document
+    stored as an archive (see zip_sheet)
+    """
+
+    return os.path.splitext(file_path)[1].lower() in zip_sheet.ZIP_SHEET_PARTS
 
-    temp_gendered_text = gendered_text
+def gender_zip_sheet (file_path, outputs, printWarnings=True, file_type=None) :
     """
-    # if we're handling PDFs, recompress the text
-    if output_sheet_name.endswith('pdf') :
-        import zlib
-        temp_gendered_text = zlib.compress(gendered_text)
+    gender a word processor document stored as an archive (a .docx or .odt
+    file) for one or more gender plans
+    
+    file_path can also be an open binary file, in which case file_type
+    (".docx" or ".odt") has to be given to say what kind of document it is.
+    
+    outputs is expected to be a list of tuples in the form:
+    
+        (output file path or open binary file, gender_plan)
+    
+    Each member of the archive with document text in it is streamed through
+    the gender plans without being extracted; everything else (pictures,
+    styles, etc.) is copied into each output exactly as it's stored, without
+    decompressing it.
+    
+    Returns the set of character numbers the document's gendered phrases refer to.
+    """
+
+    if file_type is None :
+        file_type = os.path.splitext(file_path)[1]
+    part_pattern, lexer_type = zip_sheet.ZIP_SHEET_PARTS[file_type.lower()]
+    character_numbers = set( )
+
+    source_zip = zipfile.ZipFile(file_path, "r")
+    dest_files = [ ]
+    dest_zips  = [ ]
+    try :
+        for out_path, _ in outputs :
+            if isinstance(out_path, str) :
+                dest_files.append(atomic_output.AtomicOutputFile(out_path, "wb"))
+                dest_zips.append(zipfile.ZipFile(dest_files[-1].file, "w", compression=zipfile.ZIP_DEFLATED))
+            else :
+                dest_files.append(None)
+                dest_zips.append(zipfile.ZipFile(out_path, "w", compression=zipfile.ZIP_DEFLATED))
+
+        for info in source_zip.infolist() :
+
+            if not part_pattern.match(info.filename) :
+                for dest_zip in dest_zips :
+                    zip_sheet.copy_zip_member_raw(source_zip, info, dest_zip)
+                continue
+
+            LOG.debug("Gendering document part: %s", info.filename)
+            part_file = io.TextIOWrapper(source_zip.open(info), encoding="utf-8", newline="")
+            out_parts = [io.TextIOWrapper(dest_zip.open(zip_sheet.get_rewritten_info(info), "w"),
+                                          encoding="utf-8", newline="")
+                         for dest_zip in dest_zips]
+            for tokens in iter_sheet_tokens(part_file, lexer=lexer_type()) :
+                for out_part, (_, gender_plan) in zip(out_parts, outputs) :
+                    out_part.write(gender_plan.render_tokens(tokens, printWarnings=printWarnings,
+                                                             characterNumbers=character_numbers))
+            part_file.close()
+            for out_part in out_parts :
+                out_part.close()
+
+        # finish the archives and move them into place
+        for dest_zip, dest_file in zip(dest_zips, dest_files) :
+            dest_zip.close()
+            if dest_file is not None :
+                dest_file.close()
+    finally :
+        source_zip.close()
+        # anything that isn't finished by now is only partly written
+        for dest_file in dest_files :
+            if dest_file is not None :
+                dest_file.discard()
+
+    return character_numbers
+
+def get_packet_sheets (file_paths, gender_defs) :
+    """
+    sort the sheets at file_paths into packets for each character
+    in gender_defs, based on the character number their name starts with
+    
+    returns a dictionary in the form:
+    
+        {
+            character number (int): [sheet paths, sorted by file name],
+        }
+    """
+
+    packets = dict([(number, [ ]) for number in gender_defs.keys()])
+    for file_path in file_paths :
+        number = os.path.basename(file_path).split('.')[0]
+        if number.isdigit() and int(number) in packets :
+            packets[int(number)].append(file_path)
+
+    for sheet_paths in packets.values() :
+        sheet_paths.sort(key=os.path.basename)
+
+    return packets
+
+def get_packet_path (output_path, character_number, gender_defs) :
+    """
+    figure out the path the pdf packet for a character should be saved
+    to in the output_path directory (named after the character)
+    """
+
+    name = gender_defs[character_number][0].replace(os.sep, "-")
+
+    return os.path.join(output_path, "%02d.%s.pdf" % (character_number, name))
+
+def get_bundle_path (output_path, character_number, gender_defs) :
+    """
+    figure out the path the zip bundle of a character's sheets should be
+    saved to in the output_path directory (named after the character)
+    """
+
+    name = gender_defs[character_number][0].replace(os.sep, "-")
+
+    return os.path.join(output_path, "%02d.%s.zip" % (character_number, name))
+
+def bundle_sheets (file_paths, castings,
+                   per_character=False,
+                   process_file_names=False,
+                   sheet_cache=None,
+                   compress_jobs=1) :
+    """
+    gender the sheets at file_paths for one or more castings, streaming them
+    straight into a zip bundle for each casting (or if per_character is True,
+    for each character in each casting) instead of saving them one by one
+    
+    castings is expected to be a list of tuples in the form:
+    
+        (output path, gender_defs, gender_ordering, gender_plan)
+    
+    where the output path is the path of the casting's zip file, or if
+    per_character is True, the directory that each character's zip file
+    (see get_bundle_path) is saved in. Each sheet is only added to the
+    castings that have its character in them.
+    
+    Each sheet is read and its markup is found only once, no matter how
+    many castings there are, and the sheets are added in order of their
+    character numbers (so each character's bundle is finished before the
+    next one is started). If compress_jobs is more than 1, the bundles are
+    compressed with that many threads while the sheets are being gendered.
+    
+    Every bundle is saved with atomic_output; if anything goes wrong,
+    the bundles that aren't finished yet are thrown away.
     """
 
-    # save the resulting gendered character in the output file
-    print ("Saving gendered character sheet to: " + out_sheet_path)
-    out_sheet_file    = open(out_sheet_path, "w")
-    out_sheet_file.write(temp_gendered_text)
+    castings  = [(output_path, gender_defs, gender_ordering,
+                  GenderPlan(gender_defs, gender_ordering) if gender_plan is None else gender_plan)
+                 for output_path, gender_defs, gender_ordering, gender_plan in castings]
+    executor  = concurrent.futures.ThreadPoolExecutor(max_workers=compress_jobs) if compress_jobs > 1 else None
+    # the bundle being written for each casting, and the character it's for
+    bundles   = [None] * len(castings)
+    bundle_of = [None] * len(castings)
+
+    def finish_bundle (casting_index) :
+        if bundles[casting_index] is not None :
+            LOG.info("Saving bundle: %s", bundles[casting_index].path)
+            bundles[casting_index].close()
+            bundles[casting_index] = None
+
+    def get_bundle (casting_index, number) :
+        output_path, gender_defs, _, _ = castings[casting_index]
+        bundle_key = number if per_character else output_path
+        if (bundles[casting_index] is None) or (bundle_of[casting_index] != bundle_key) :
+            finish_bundle(casting_index)
+            bundle_path = get_bundle_path(output_path, number, gender_defs) if per_character else output_path
+            bundles[casting_index]   = zip_bundle.ZipBundle(bundle_path, executor=executor)
+            bundle_of[casting_index] = bundle_key
+        return bundles[casting_index]
+
+    try :
+        if not per_character :
+            for casting_index in range(len(castings)) :
+                get_bundle(casting_index, None)
+
+        sheet_paths = [file_path for file_path in file_paths if os.path.basename(file_path).split('.')[0].isdigit()]
+        for file_path in sorted(sheet_paths, key=lambda path : (int(os.path.basename(path).split('.')[0]),
+                                                                 os.path.basename(path))) :
+
+            number        = int(os.path.basename(file_path).split('.')[0])
+            sheet_indexes = [index for index in range(len(castings)) if number in castings[index][1]]
+            if len(sheet_indexes) <= 0 :
+                continue
+
+            swap_log.start_file(file_path)
+
+            # start this sheet's member in each bundle it goes in
+            members = [ ]
+            for casting_index in sheet_indexes :
+                _, gender_defs, gender_ordering, gender_plan = castings[casting_index]
+                member_name = os.path.basename(file_path)
+                if process_file_names :
+                    member_name = gender_plan.file_names.gender_file_name(member_name)
+                member = get_bundle(casting_index, number).open_member(member_name, source_path=file_path,
+                                                                       compress=not is_zip_sheet(file_path))
+                members.append((member, gender_plan))
 
-    # close the file we opened since we're done with it
-    out_sheet_file.close()
+            # find the gendered phrases in the sheet once and render it for every casting
+            if is_zip_sheet(file_path) :
+                gender_zip_sheet(file_path, members)
+            else :
+                token_batches = iter_file_tokens(file_path) if sheet_cache is None else sheet_cache.iter_tokens(file_path)
+                for tokens in token_batches :
+                    for member, gender_plan in members :
+                        member.write(gender_plan.render_tokens(tokens))
+            for member, _ in members :
+                member.close()
+
+            swap_log.finish_file(", ".join([bundles[casting_index].path + ":" + member.info.filename
+                                            for casting_index, (member, _) in zip(sheet_indexes, members)]))
+
+        for casting_index in range(len(castings)) :
+            finish_bundle(casting_index)
+    finally :
+        # anything that isn't finished by now is only partly written
+        for bundle in bundles :
+            if bundle is not None :
+                bundle.discard()
+        if executor is not None :
+            executor.shutdown(cancel_futures=True)
+
+def write_packet_pdf (sheet_paths, out_path,
+                      gender_defs, gender_ordering,
+                      process_file_names=False,
+                      gender_plan=None,
+                      title=None) :
+    """
+    gender each of the sheets at sheet_paths and write the text a reader
+    would see of all of them, in order, into a single pdf at out_path
     
-    print ("Finished saving and closing new sheet.")
+    Each sheet starts on a new page with its (gendered, if process_file_names
+    is True) file name at the top. The sheets are streamed straight into the
+    pdf a chunk at a time, so no gendered copy of them is ever saved.
+    
+    Returns the set of character numbers used by all of the sheets.
+    """
+
+    if gender_plan is None :
+        gender_plan = GenderPlan(gender_defs, gender_ordering)
+
+    character_numbers = set( )
+    with atomic_output.AtomicOutputFile(out_path, "wb") as out_file :
+        packet = pdf_packet.PdfPacketWriter(out_file.file, title=title)
+        for file_path in sheet_paths :
+
+            swap_log.start_file(file_path)
+            LOG.debug("Adding gendered sheet to packet %s: %s", out_path, file_path)
+
+            sheet_name    = os.path.basename(get_output_sheet_path(file_path, "", gender_defs, gender_ordering,
+                                                                   process_file_names=process_file_names,
+                                                                   gender_plan=gender_plan))
+            sheet_numbers = set( )
+            packet.start_sheet(os.path.splitext(sheet_name)[0])
+            for tokens in iter_file_tokens(file_path, text_only=True) :
+                packet.write(gender_plan.render_tokens(tokens, characterNumbers=sheet_numbers))
+
+            swap_log.finish_file(out_path)
+            character_numbers.update(_add_file_name_character(file_path, sheet_numbers, process_file_names))
+
+        packet.close()
+
+    return character_numbers
+
+def split_formatted_pieces (pieces) :
+    """
+    split a list of (raw text, visible text) pieces in the same way as
+    iter_sheet_chunks splits text, so that a gendered phrase that's been
+    started but not finished in the visible text is held back
+    
+    (tags, comments and other things with no visible text can have [ and ]
+    characters in them, so only the visible text is looked at)
+    
+    returns a tuple in the form:
+    
+        (the pieces that can be tokenized now, the pieces to hold back)
+    """
+
+    visible_text = "".join([visible for _, visible in pieces])
+
+    split_index = visible_text.find('[', visible_text.rfind(']') + 1)
+    while (split_index >= 0) and (len(visible_text) - split_index > MAX_PHRASE_LENGTH) :
+        split_index = visible_text.find('[', split_index + 1)
+
+    if split_index < 0 :
+        return pieces, [ ]
+
+    # find the piece with the [ in it, splitting it if it's a longer piece of text
+    position = 0
+    for piece_index, (raw, visible) in enumerate(pieces) :
+        if position + len(visible) > split_index :
+            break
+        position += len(visible)
+    offset = split_index - position
+    if offset == 0 :
+        return pieces[:piece_index], pieces[piece_index:]
+
+    return (pieces[:piece_index] + [(raw[:offset], visible[:offset])],
+            [(raw[offset:], visible[offset:])] + pieces[piece_index + 1:])
+
+def gender_sheet_stream (input_file, output_file, gender_plan, printWarnings=True, file_path="") :
+    """
+    read a sheet from one open file and write the gendered version
+    to another a chunk at a time (file_path is used to decide how to
+    tokenize the sheet, see iter_sheet_tokens)
+    
+    Returns the set of character numbers the sheet's gendered phrases refer to.
+    """
+
+    character_numbers = set( )
+    for tokens in iter_sheet_tokens(input_file, file_path) :
+        output_file.write(gender_plan.render_tokens(tokens,
+                                                    printWarnings=printWarnings,
+                                                    characterNumbers=character_numbers))
+
+    return character_numbers
+
+# the gender information shared with each worker process in a pool,
+# set once per worker by _init_pool_worker
+_pool_gender_info = None
+
+def _init_pool_worker (genderList, pronounSets, fsync_policy, process_file_names, sheet_cache, log_level) :
+    """
+    set up the shared gender information for one worker process from
+    the gender_list.GenderList and pronoun_sets.PronounSets it was sent,
+    and collect its log messages rather than letting it write them out
+    """
+
+    global _pool_gender_info
+
+    collector = swap_log.CollectingHandler()
+    swap_log.setup_logging(log_level, handler=collector)
+
+    pronoun_sets.set_pronoun_sets(pronounSets)
+    atomic_output.set_fsync_policy(fsync_policy)
+
+    gender_defs, gender_ordering = genderList.as_dicts()
+    _pool_gender_info = (gender_defs, gender_ordering, GenderPlan(genderList), process_file_names, sheet_cache, collector)
+
+def _process_one_file_in_pool (file_path, output_path, output_name) :
+    """
+    process one file in a worker process, collecting everything it logs
+    so that it can be reported later instead of interleaving with the
+    other workers
+    
+    returns a tuple in the form:
+    
+        (file_path, succeeded, collected log records, set of character numbers used, FileDiagnostics)
+    """
+
+    gender_defs, gender_ordering, gender_plan, process_file_names, sheet_cache, collector = _pool_gender_info
+
+    succeeded         = True
+    character_numbers = None
+    diagnostics       = None
+    try :
+        character_numbers = process_one_file(file_path, output_path,
+                                             gender_defs, gender_ordering,
+                                             process_file_names=process_file_names,
+                                             gender_plan=gender_plan,
+                                             sheet_cache=sheet_cache,
+                                             output_name=output_name)
+        diagnostics       = swap_log.get_last_finished()
+    except Exception :
+        succeeded = False
+        LOG.exception("Unable to process sheet: %s", file_path)
+
+    return file_path, succeeded, collector.take_records(), character_numbers, diagnostics
+
+def process_files_in_parallel (file_paths, output_path,
+                               gender_defs, gender_ordering,
+                               process_file_names=False,
+                               gender_plan=None,
+                               jobs=None,
+                               sheet_cache=None,
+                               output_names=None) :
+    """
+    process a list of files using a pool of jobs worker processes
+    (if jobs is None, one per cpu)
+    
+    The gender plan is built once here and its gender_list.GenderList (which
+    is much smaller to send than the gender dictionaries) is handed to each
+    worker when it starts rather than being sent along with every file.
+    
+    output_names can be a dictionary in the form { file_path : output file
+    name } for any files whose output names were already worked out.
+    
+    Returns a list with one tuple in the form:
+    
+        (file_path, succeeded, collected log records, set of character numbers used, FileDiagnostics)
+    
+    for each file, in the same order as file_paths. The log records
+    can be passed to swap_log.LOG.handle to log them in this process.
+    """
+
+    if gender_plan is None :
+        gender_plan = GenderPlan(gender_defs, gender_ordering)
+
+    pool = multiprocessing.Pool(processes=jobs,
+                                initializer=_init_pool_worker,
+                                initargs=(gender_plan.gender_list, pronoun_sets.get_pronoun_sets(),
+                                          atomic_output.get_fsync_policy(), process_file_names, sheet_cache,
+                                          LOG.getEffectiveLevel()))
+    try :
+        results = pool.starmap(_process_one_file_in_pool,
+                               [(file_path, output_path, (output_names or { }).get(file_path))
+                                for file_path in file_paths],
+                               chunksize=1)
+    finally :
+        pool.close()
+        pool.join()
+
+    return results
+
+class _PipelineStopped (Exception) :
+    """
+    raised in a stage of a SheetPipeline that was waiting on another
+    stage when the pipeline was stopped
+    """
+
+class SheetPipeline :
+    """
+    Genders a list of sheets with reading, gendering and writing overlapped,
+    so slow disks (like shared network drives) can be reading the next sheet
+    and saving the last one while the current one is being gendered.
+    
+    There are three stages, connected by queues that hold up to
+    PIPELINE_QUEUE_SIZE chunks of text each; a stage that gets that far
+    ahead of the next one waits for it to catch up, so only a few chunks
+    are ever held in memory. The reader thread reads each sheet's text in
+    order, the thread using the pipeline tokenizes and renders it (see
+    process_files_in_pipeline), and the writer thread saves the gendered
+    text with atomic_output.
+    
+    Sheets that can't be read as a stream of text (.docx and .odt files,
+    or any sheet when a sheet_cache.SheetCache is used) are read by the
+    gendering stage itself, but their output is still saved by the writer.
+    """
+
+    def __init__ (self, file_paths, reads_itself) :
+        """
+        start the reader and writer threads for the sheets at file_paths
+        (reads_itself is called with each path and should return True if
+        the gendering stage will read that sheet itself)
+        """
+
+        self.file_paths   = file_paths
+        self.reads_itself = reads_itself
+        self.read_queue   = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.write_queue  = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.done_queue   = queue.Queue()
+        self.stop_event   = threading.Event()
+        self.write_error  = None
+        # whether the end of the current sheet's text has been read
+        self.at_end       = False
+        # whether the writer has been told there are no more outputs
+        self.ended        = False
+
+        self.reader = threading.Thread(target=self._read_sheets, name="sheet reader", daemon=True)
+        self.writer = threading.Thread(target=self._write_sheets, name="sheet writer", daemon=True)
+        self.reader.start()
+        self.writer.start()
+
+    def _put (self, work_queue, item) :
+        """
+        put an item in a queue, waiting for room if it's full, unless the pipeline is stopped
+        """
+
+        while not self.stop_event.is_set() :
+            try :
+                work_queue.put(item, timeout=PIPELINE_POLL_SECONDS)
+                return
+            except queue.Full :
+                pass
+
+        raise _PipelineStopped()
+
+    def _get (self, work_queue) :
+        """
+        get an item from a queue, waiting for one if it's empty, unless the pipeline is stopped
+        """
+
+        while not self.stop_event.is_set() :
+            try :
+                return work_queue.get(timeout=PIPELINE_POLL_SECONDS)
+            except queue.Empty :
+                pass
+
+        raise _PipelineStopped()
+
+    def _read_sheets (self) :
+        """
+        the reader stage: read each sheet's text into the read queue a chunk
+        at a time, followed by "" to mark its end (or the exception that
+        stopped it from being read, or just None if it reads itself)
+        """
+
+        try :
+            for file_path in self.file_paths :
+
+                if self.reads_itself(file_path) :
+                    self._put(self.read_queue, None)
+                    continue
+
+                try :
+                    input_sheet_file = open(file_path, "r")
+                    try :
+                        for chunk in iter(lambda : input_sheet_file.read(SHEET_CHUNK_SIZE), "") :
+                            self._put(self.read_queue, chunk)
+                    finally :
+                        input_sheet_file.close()
+                except Exception as error :
+                    self._put(self.read_queue, error)
+                    continue
+
+                self._put(self.read_queue, "")
+        except _PipelineStopped :
+            pass
+
+    def _write_sheets (self) :
+        """
+        the writer stage: save the gendered text from the write queue, which
+        has ("open", output path), ("write", text), ("close", result) and
+        ("discard", ) items for each output and ends with None
+        
+        The result of each finished output is put in the done queue once it's
+        been saved, followed by None at the end; if an output can't be
+        saved, the whole pipeline is stopped.
+        """
+
+        out_sheet_file = None
+        try :
+            for item in iter(lambda : self._get(self.write_queue), None) :
+                if item[0] == "open" :
+                    out_sheet_file = atomic_output.AtomicOutputFile(item[1], "w")
+                elif item[0] == "write" :
+                    out_sheet_file.write(item[1])
+                elif item[0] == "close" :
+                    if out_sheet_file is not None :
+                        out_sheet_file.close()
+                        out_sheet_file = None
+                    self.done_queue.put(item[1])
+                else :
+                    out_sheet_file.discard()
+                    out_sheet_file = None
+            self.done_queue.put(None)
+        except _PipelineStopped :
+            pass
+        except Exception as error :
+            self.write_error = error
+            self.stop_event.set()
+        finally :
+            if out_sheet_file is not None :
+                out_sheet_file.discard()
+
+    def next_sheet (self) :
+        """
+        move on to the next sheet, whose text hasn't been read yet
+        """
+
+        self.at_end = False
+
+    def read (self, size=-1) :
+        """
+        get the next chunk of the current sheet's text from the reader stage,
+        or "" at the end of the sheet (size is ignored, since the chunks can
+        be any size), so the pipeline can stand in for an open sheet file
+        
+        For a sheet that reads itself, this just returns None.
+        """
+
+        chunk       = self._get(self.read_queue)
+        self.at_end = not chunk or isinstance(chunk, Exception)
+        if isinstance(chunk, Exception) :
+            raise chunk
+
+        return chunk
+
+    def skip_sheet (self) :
+        """
+        throw away the rest of the current sheet's text from the reader stage
+        """
+
+        while not self.at_end :
+            try :
+                self.read()
+            except _PipelineStopped :
+                raise
+            except Exception :
+                pass
+
+    def write (self, text) :
+        """
+        hand gendered text for the current output to the writer stage
+        """
+
+        self._put(self.write_queue, ("write", text))
+
+    def send (self, *item) :
+        """
+        hand an item to the writer stage (see _write_sheets)
+        """
+
+        self._put(self.write_queue, item)
+
+    def end (self) :
+        """
+        tell the writer stage there are no more outputs
+        """
+
+        if not self.ended :
+            self._put(self.write_queue, None)
+            self.ended = True
+
+    def iter_done (self, wait=False) :
+        """
+        yield the results of the outputs the writer stage has saved so far
+        (or if wait is True, of every output, waiting for them to be saved)
+        """
+
+        while True :
+            try :
+                result = self._get(self.done_queue) if wait else self.done_queue.get_nowait()
+            except queue.Empty :
+                return
+            if result is None :
+                return
+            yield result
+
+    def stop (self) :
+        """
+        stop the reader and writer stages and wait for them to finish
+        (an output the writer was in the middle of is thrown away)
+        """
+
+        self.stop_event.set()
+        self.reader.join()
+        self.writer.join()
+
+    def finish (self) :
+        """
+        let the writer stage finish saving the outputs it's been given, then
+        stop the pipeline
+        """
+
+        try :
+            self.end()
+            self.writer.join()
+        except _PipelineStopped :
+            pass
+        self.stop()
+
+def process_files_in_pipeline (file_paths, output_path,
+                               gender_defs, gender_ordering,
+                               process_file_names=False,
+                               gender_plan=None,
+                               sheet_cache=None,
+                               output_names=None) :
+    """
+    process a list of files in this process, overlapping reading each
+    sheet and saving its output with gendering the sheets (see SheetPipeline)
+    
+    This is a generator that yields a tuple in the form:
+    
+        (file_path, set of character numbers used)
+    
+    for each file once its output has been saved, in the same order as
+    file_paths; the sheets are gendered and logged the same way as
+    process_one_file does it. If a sheet can't be processed, the outputs
+    for the sheets before it are finished and then the exception is
+    raised. If the generator is closed early, processing stops right away
+    (any output that hasn't been saved yet is thrown away).
+    
+    output_names can be a dictionary in the form { file_path : output file
+    name } for any files whose output names were already worked out.
+    """
+
+    if gender_plan is None :
+        gender_plan = GenderPlan(gender_defs, gender_ordering)
+    if output_names is None :
+        output_names = { }
+
+    pipeline = SheetPipeline(file_paths, lambda file_path : (sheet_cache is not None) or is_zip_sheet(file_path))
+    try :
+        for file_path in file_paths :
+
+            swap_log.start_file(file_path)
+            pipeline.next_sheet()
+
+            if file_path in output_names :
+                out_sheet_path = os.path.join(output_path, output_names[file_path])
+            else :
+                out_sheet_path = get_output_sheet_path(file_path, output_path,
+                                                       gender_defs, gender_ordering,
+                                                       process_file_names=process_file_names,
+                                                       gender_plan=gender_plan)
+
+            # word processor documents are archives that need to be rewritten member by member
+            if is_zip_sheet(file_path) :
+                pipeline.read()
+                LOG.debug("Saving gendered document from %s to: %s", file_path, out_sheet_path)
+                character_numbers = gender_zip_sheet(file_path, [(out_sheet_path, gender_plan)])
+
+            # otherwise gender the text as it's read, handing it to the writer to save
+            else :
+                LOG.debug("Saving gendered character sheet from %s to: %s", file_path, out_sheet_path)
+                pipeline.send("open", out_sheet_path)
+                try :
+                    if sheet_cache is None :
+                        character_numbers = gender_sheet_stream(pipeline, pipeline, gender_plan, file_path=file_path)
+                    else :
+                        pipeline.read()
+                        character_numbers = set( )
+                        for tokens in sheet_cache.iter_tokens(file_path) :
+                            pipeline.write(gender_plan.render_tokens(tokens, characterNumbers=character_numbers))
+                except _PipelineStopped :
+                    raise
+                except :
+                    if sheet_cache is None :
+                        pipeline.skip_sheet()
+                    pipeline.send("discard")
+                    raise
+
+            swap_log.finish_file(out_sheet_path)
+
+            pipeline.send("close", (file_path, _add_file_name_character(file_path, character_numbers,
+                                                                        process_file_names)))
+
+            for result in pipeline.iter_done() :
+                yield result
+
+        pipeline.end()
+        for result in pipeline.iter_done(wait=True) :
+            yield result
+
+    except _PipelineStopped :
+        # the writer stopped the pipeline because it couldn't save an output
+        raise pipeline.write_error
+
+    except GeneratorExit :
+        pipeline.stop()
+        raise
+
+    finally :
+        pipeline.finish()
+
+def _scan_one_directory (directory_path, file_types) :
+    """
+    look at the entries in one directory, without going any deeper
+    
+    returns a tuple in the form:
+    
+        ([paths of files with the given types], [paths of subdirectories], number of other files)
+    """
+
+    found_files    = [ ]
+    subdirectories = [ ]
+    ignored_count  = 0
+
+    for entry in os.scandir(directory_path) :
+        # scandir already knows the entry types on most systems, so these
+        # usually don't need another stat; links to directories aren't
+        # followed so we can't get caught in a loop
+        if entry.is_dir(follow_symlinks=False) :
+            subdirectories.append(entry.path)
+        elif os.path.splitext(entry.name)[1] in file_types :
+            found_files.append(entry.path)
+        else :
+            ignored_count += 1
+
+    return found_files, subdirectories, ignored_count
+
+def find_sheet_files (paths, file_types=POSSIBLE_FILE_TYPES, recursive=True, scan_jobs=1) :
+    """
+    given a list of file and directory paths, find all the files
+    that have one of the given file types
+    
+    Directories are searched for files, including all their subdirectories
+    if recursive is True. If scan_jobs is more than 1, that many threads
+    will be used to scan directories at the same time, which helps for
+    large trees (especially on network drives).
+    
+    returns a tuple in the form:
+    
+        (set of file paths found, number of directories searched, number of files ignored)
+    """
+
+    found_files   = set( )
+    directories   = [ ]
+    ignored_count = 0
+
+    # sort out the files we were given directly from the directories
+    for path in paths :
+        path = str(path)
+        if os.path.isdir(path) :
+            directories.append(path)
+        elif os.path.splitext(path)[1] in file_types :
+            found_files.add(path)
+        else :
+            ignored_count += 1
+
+    directory_count = 0
+    executor        = concurrent.futures.ThreadPoolExecutor(max_workers=scan_jobs) if scan_jobs > 1 else None
+    try :
+        pending = set( )
+        while directories or pending :
+
+            # start scanning any directories we've found
+            if executor is None :
+                results = [_scan_one_directory(directories.pop(), file_types)]
+            else :
+                for directory_path in directories :
+                    pending.add(executor.submit(_scan_one_directory, directory_path, file_types))
+                directories = [ ]
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                results = [future.result() for future in done]
+
+            # collect the results and queue up any deeper directories
+            for more_files, subdirectories, more_ignored in results :
+                directory_count += 1
+                found_files.update(more_files)
+                ignored_count   += more_ignored
+                if recursive :
+                    directories.extend(subdirectories)
+    finally :
+        if executor is not None :
+            executor.shutdown()
+
+    return found_files, directory_count, ignored_count
 
 def open_and_gender_sheet (file_path, 
                            gender_defs, gender_ordering,
-                           reason="") :
+                           reason="",
+                           gender_plan=None) :
     """
     Open a sheet, read in the text, and create a gendered version
-    based on the gender_defs and gender_ordering given.
+    based on the gender_defs and gender_ordering given (or the
+    gender_plan built from them, if one is given).
+    
+    (To gender a sheet that's already in memory, see gender_sheet.)
     """
 
+    if gender_plan is None :
+        gender_plan = GenderPlan(gender_defs, gender_ordering)
+
     # open the input sheet
-    print ("Opening sheet" + reason + ": " + file_path)
-    input_sheet_file = open(file_path, "r")
+    LOG.debug("Opening sheet%s: %s", reason, file_path)
 
-    # parse the rest of the input sheet to set the genders
-    input_lines   = input_sheet_file.readlines()
-    in_text_temp  = ""
-    # build this into one string
-    for in_line in input_lines :
-        in_text_temp = in_text_temp + in_line
+    # parse the sheet to specify the genders
+    gendered_text = "".join([gender_plan.render_tokens(tokens) for tokens in iter_file_tokens(file_path)])
+    
+    return gendered_text
 
+def iter_gendered_sheet (sheet, gender_plan, file_type=".txt", encoding="utf-8",
+                         printWarnings=True, characterNumbers=None) :
     """
-    # if this is a pdf, uncompress the contents
-    if file_path.endswith('pdf') :
-        import zlib
-        in_text_temp = zlib.decompress(in_text_temp)
+    gender a sheet that's already in memory or in an open file, without
+    reading or writing anything on the disk, yielding the gendered
+    version of it a piece at a time
+    
+    sheet can be a str, bytes, or a file-like object open for reading in
+    text or binary mode (which isn't closed). The gendered pieces are str
+    if the sheet is text and bytes (in the same encoding) if it's binary;
+    line endings are kept as they are.
+    
+    gender_plan can be a GenderPlan, a gender_list.GenderList (like the one
+    parse_genderlist returns), or a (gender_defs, gender_ordering) tuple.
+    
+    file_type is the extension of the kind of sheet it is (like ".rtf"),
+    which decides how it's tokenized (see iter_sheet_tokens). A .docx or
+    .odt sheet has to be binary, and since the whole archive has to be
+    finished before any of it is usable, it's yielded in one piece.
+    
+    If characterNumbers is given, the numbers of the characters the
+    sheet's gendered phrases refer to are added to it.
     """
 
-    # parse the sheet to specify the genders
-    gendered_text = parse_ungendered_sheet(in_text_temp, gender_defs, gender_ordering)
-    
-    # close the file we opened since we're done with it
-    input_sheet_file.close()
+    gender_plan = _get_gender_plan(gender_plan)
+    if characterNumbers is None :
+        characterNumbers = set( )
+
+    # figure out whether we're working with text or bytes
+    if isinstance(sheet, (bytes, bytearray, memoryview)) :
+        is_binary   = True
+        sheet_file  = io.BytesIO(sheet)
+    elif isinstance(sheet, str) :
+        is_binary   = False
+        sheet_file  = io.StringIO(sheet)
+    else :
+        is_binary   = isinstance(sheet.read(0), bytes)
+        sheet_file  = sheet
+
+    if file_type.lower() in zip_sheet.ZIP_SHEET_PARTS :
+        if not is_binary :
+            raise ValueError("A " + file_type + " sheet has to be given as bytes or a binary file.")
+        output_file = io.BytesIO()
+        characterNumbers.update(gender_zip_sheet(sheet_file, [(output_file, gender_plan)],
+                                                 printWarnings=printWarnings, file_type=file_type))
+        yield output_file.getvalue()
+        return
+
+    lexer_type = SHEET_LEXERS.get(file_type.lower())
+    lexer      = None if lexer_type is None else lexer_type()
+
+    if not is_binary :
+        for tokens in iter_sheet_tokens(sheet_file, lexer=lexer) :
+            yield gender_plan.render_tokens(tokens, printWarnings=printWarnings, characterNumbers=characterNumbers)
+        return
+
+    text_file = io.TextIOWrapper(sheet_file, encoding=encoding, newline="")
+    encoder   = codecs.getincrementalencoder(encoding)()
+    try :
+        for tokens in iter_sheet_tokens(text_file, lexer=lexer) :
+            yield encoder.encode(gender_plan.render_tokens(tokens, printWarnings=printWarnings,
+                                                           characterNumbers=characterNumbers))
+        yield encoder.encode("", final=True)
+    finally :
+        # let go of the file without closing it
+        text_file.detach()
+
+def gender_sheet (sheet, gender_plan, file_type=".txt", encoding="utf-8", printWarnings=True) :
+    """
+    gender a sheet that's already in memory or in an open file, without
+    reading or writing anything on the disk, and return the whole gendered
+    version of it (a str if the sheet is text, or bytes if it's binary)
     
-    return gendered_text
+    see iter_gendered_sheet for the arguments
+    """
+
+    pieces = list(iter_gendered_sheet(sheet, gender_plan, file_type=file_type, encoding=encoding,
+                                      printWarnings=printWarnings))
+
+    # binary sheets always yield at least one piece
+    return pieces[0][:0].join(pieces) if pieces else ""
+
+def _get_gender_plan (gender_info) :
+    """
+    get a GenderPlan from a GenderPlan, a gender_list.GenderList,
+    or a (gender_defs, gender_ordering) tuple
+    """
+
+    if isinstance(gender_info, GenderPlan) :
+        return gender_info
+
+    if isinstance(gender_info, tuple) :
+        return GenderPlan(*gender_info)
+
+    return GenderPlan(gender_info)
 
 def parse_file_name (fileName, genderDefinitions, genderOrdering) :
     """
@@ -110,7 +1634,7 @@ def parse_file_name (fileName, genderDefinitions, genderOrdering) :
     File names are expected to be in the form:
     
             ##.gendered text a.gendered text b.whatever text you like.rtf
-            (.txt files are also ok)
+            (any of the POSSIBLE_FILE_TYPES are also ok)
     
     Where the number of gendered text entries is the same as the possible
     genders listed in the first line of the sheet and they are arranged
@@ -121,50 +1645,107 @@ def parse_file_name (fileName, genderDefinitions, genderOrdering) :
     there isn't a character number at the beginning that
     corresponds to an entry in the genderDefinitions, etc.)
     then the original fileName will be returned.
+    
+    This works the rules out again for every name; to gender a lot of
+    names for the same gender list, use a FileNameTable instead.
     """
     
-    print ("Attempting to gender file name: " + fileName)
-    nameToReturn = fileName
+    # find the rule for just the character this name is for
+    charNumber = fileName.split('.')[0]
+    rules      = { }
+    if charNumber.isdigit() and int(charNumber) in genderDefinitions :
+        charNumber        = int(charNumber)
+        rules[charNumber] = (len(genderOrdering[charNumber].keys()),
+                             get_gender_index(genderDefinitions[charNumber], genderOrdering[charNumber]))
+    
+    return _gender_file_name(fileName, rules)
+
+class FileNameTable :
+    """
+    The rules for gendering file names (see parse_file_name) for one
+    gender list, worked out once so any number of names can be gendered
+    without looking anything up in the gender list again.
+    
+    rules holds a tuple for each character number in the form:
+    
+        (number of gendered sections, index of the selected gender's section)
+    
+    A GenderPlan builds one of these for its gender list (see its
+    file_names), so most of the time there's no need to make one.
+    """
+
+    def __init__ (self, genderDefinitions, genderOrdering=None) :
+        """
+        build the table from a GenderPlan, a gender_list.GenderList, or from
+        the gender definitions and gender ordering returned from
+        parse_genderlist_file
+        """
+
+        if isinstance(genderDefinitions, GenderPlan) :
+            genderDefinitions = genderDefinitions.gender_list
+        if not isinstance(genderDefinitions, gender_list.GenderList) :
+            genderDefinitions = gender_list.GenderList.from_dicts(genderDefinitions, genderOrdering)
+
+        self.rules = dict(zip(genderDefinitions.numbers,
+                              zip(genderDefinitions.option_counts, genderDefinitions.selected_indexes)))
+
+    def gender_file_name (self, fileName) :
+        """
+        get the gendered version of one file name (or the name
+        itself, if it can't be gendered)
+        """
+
+        return _gender_file_name(fileName, self.rules)
+
+    def gender_file_names (self, fileNames) :
+        """
+        gender a whole list of file names (like a directory listing) at once
+        
+        returns a dictionary in the form:
+        
+            { file name : gendered file name }
+        
+        where names that can't be gendered map to themselves.
+        """
+
+        rules = self.rules
+
+        return dict([(fileName, _gender_file_name(fileName, rules)) for fileName in fileNames])
+
+def _gender_file_name (fileName, rules) :
+    """
+    gender a file name using rules in the form of FileNameTable.rules
+    (see parse_file_name for the kind of name that can be gendered)
+    """
+    
+    LOG.debug("Attempting to gender file name: %s", fileName)
     
     # break the name into sections delineated by .
     nameSections = fileName.split('.')
     
-    # check to see if the name matches the general pattern we expect
-    
     # if the first thing in the name isn't a digit that's one of our character numbers, stop
     charNumber = nameSections[0]
-    if not(charNumber.isdigit() and int(charNumber) in genderDefinitions) :
-        print ("Unable to gender file name due to missing or invalid character number.")
-        return nameToReturn
-    charNumber = int(charNumber)
+    rule       = rules.get(int(charNumber)) if charNumber.isdigit() else None
+    if rule is None :
+        LOG.debug("Unable to gender file name due to missing or invalid character number.")
+        return fileName
+    numGenderOptions, genderIndex = rule
     
-    # now pull the ordering information for this character
-    tempOrdering = genderOrdering[charNumber]
-    
-    # if the file extention isn't txt or rtf, stop
-    fileExtension = nameSections[-1]
-    if not ((fileExtension == "txt") or (fileExtension == "rtf")) :
-        print ("Unable to gender file name due to invalid file extension.")
-        return nameToReturn
-    
-    # check how many gendered sections we're expecting
-    numGenderOptions = len(tempOrdering.keys())
+    # if the file extension isn't one we can process, stop
+    if ("." + nameSections[-1]) not in POSSIBLE_FILE_TYPES :
+        LOG.debug("Unable to gender file name due to invalid file extension.")
+        return fileName
     
     # if we don't have at least (the number expected genders + 2) sections (character number.<gendered sections>.file extension), stop
     if len(nameSections) < (numGenderOptions + 2) :
-        print ("Unable to gender file name due to formatting inconsistency, " +
-               "expected more sections delimited by periods.")
-        return nameToReturn
+        LOG.warning("Unable to gender file name %s due to formatting inconsistency, "
+                    "expected more sections delimited by periods.", fileName)
+        return fileName
     
-    # select the gender specific part of the name
-    genderIndex  = get_gender_index(genderDefinitions[charNumber], tempOrdering)
-    nameToReturn = nameSections[0] + "." + nameSections[genderIndex + 1]
+    # select the gender specific part of the name and add the rest of the file name back onto it
+    nameToReturn = ".".join([nameSections[0], nameSections[genderIndex + 1]] + nameSections[numGenderOptions + 1:])
     
-    # add the rest of the file name back onto our gendered section
-    for index in range(numGenderOptions + 1, len(nameSections)) :
-        nameToReturn = nameToReturn + '.' + nameSections[index]
-    
-    print ("Successfully gendered file name, resulting in: " + nameToReturn)
+    LOG.debug("Successfully gendered file name, resulting in: %s", nameToReturn)
     
     return nameToReturn
 
@@ -182,8 +1763,8 @@ def get_gender_index (genderDefinition, genderOrdering) :
             indexToUse = index
     
     if indexToUse < 0 :
-        print("WARNING: Unable to find selected gender for character " + genderDefinition[0]
-              + " in list of possible genders for this character.")
+        LOG.warning("WARNING: Unable to find selected gender for character %s"
+                    " in list of possible genders for this character.", genderDefinition[0])
     
     return indexToUse
 
@@ -195,12 +1776,13 @@ def parse_genderlist_file (genderData) :
             character number (int):   ["character name", pronoun_set_constant],
         }
     
-    FUTURE: When the pronoun sets are externally configurable detecting which
-    gender was selected will need to be handled differently.
+    The genders (and the ways of writing them) that are understood come
+    from the pronoun sets in use (see pronoun_sets.get_pronoun_sets).
     """
     
     genderDict  = { }
     genderOrder = { }
+    pronounSets = pronoun_sets.get_pronoun_sets()
     
     # parse the information for each line since the file should be one char per line
     for line in genderData :
@@ -219,39 +1801,40 @@ def parse_genderlist_file (genderData) :
         for index in range(len(gendersList)) :
             temp_ordering[index] = gendersList[index].strip() # strip off whitespace
             # check to see if this is a set we know about
-            temp_found = False
-            for gender_key in POSSIBLE_PRONOUN_SETS.keys() :
-                if temp_ordering[index] == gender_key :
-                    temp_found = True
-            if temp_found is False :
-                print("Unable to find defined gender (" + temp_ordering[index]
-                      + ") in list of genders understood by this program: " + str(POSSIBLE_PRONOUN_SETS.keys()))
-                print("Sheet processing may be incomplete or yield unexpected results.")
+            if temp_ordering[index] not in pronounSets.pronoun_sets :
+                LOG.warning("Unable to find defined gender (%s) in list of genders understood by this program: %s\n"
+                            "Sheet processing may be incomplete or yield unexpected results.",
+                            temp_ordering[index], sorted(pronounSets.pronoun_sets.keys()))
         # add this characters ordering info to our overall ordering info
         genderOrder[number] = temp_ordering
         
         # figure out the gender selected for this character
-        genderText  = genderText.strip().lower()
-        genderConst = None
-        genderConst = FEMALE_GENDER       if (genderText == "female") or (genderText[0] == "f") else genderConst
-        genderConst = MALE_GENDER         if (genderText == "male")   or (genderText[0] == "m") else genderConst
-        genderConst = NEUTRAL_THEY_GENDER if genderText.find("they") >= 0                       else genderConst
-        genderConst = NEUTRAL_ZE_GENDER   if genderText.find("ze")   >= 0                       else genderConst
+        genderConst = pronounSets.detect_gender(genderText)
         if genderConst is None :
-            print ("Unable to parse selected gender for character as a gender understood by this program.")
+            LOG.warning("Unable to parse selected gender for character %s as a gender understood by this program.", name)
         
         # warn if data is being overwritten
         if number in genderDict :
-            print ("WARNING: The character number " + str(number)
-                   + " is present multiple times in this list of gender data. "
-                   + "Only the last entry for this number will be used.")
+            LOG.warning("WARNING: The character number %s is present multiple times in this list of gender data. "
+                        "Only the last entry for this number will be used.", number)
         
         # set the gender information for this character in our dictionary
         genderDict[number] = [name, genderConst]
     
     return genderDict, genderOrder
 
-def parse_ungendered_sheet (inputText, genderDefinitions, genderOrdering) :
+def parse_genderlist (genderData) :
+    """
+    takes the text lines of a gender list and returns it as a
+    gender_list.GenderList (see parse_genderlist_file for the
+    dictionary form, and GenderList.as_dicts to convert back to it)
+    """
+
+    genderDefinitions, genderOrdering = parse_genderlist_file(genderData)
+
+    return gender_list.GenderList.from_dicts(genderDefinitions, genderOrdering)
+
+def parse_ungendered_sheet (inputText, genderDefinitions, genderOrdering, genderPlan=None) :
     """
     takes a character sheet in the form of a string,
     a gender definition dictionary, and a gender ordering for this character
@@ -260,99 +1843,23 @@ def parse_ungendered_sheet (inputText, genderDefinitions, genderOrdering) :
     then parses the character sheet to specify the genders of all the
     characters as defined in the dictionary.
     
+    If a GenderPlan already built from the same definitions and ordering
+    is given it will be used instead of building a new one.
+    
     Returns the gender-specific version of the character sheet
     text as an array of strings (in a form similar to the
     input).
     """
     
-    # gendered word markup looks like: [02: her/his]
-    #genderedWordPattern = r"\[(\d+):\s*([^\]]*)]"
-    genderedWordPattern = r"\[([\d\s]+):\s*([^\]]*)]"
+    if genderPlan is None :
+        genderPlan = GenderPlan(genderDefinitions, genderOrdering)
     
-    def cleanup_gender_fn (matchInfo,
-                           genderDefs=genderDefinitions,
-                           genderOrder=genderOrdering,
-                           printWarnings=True) :
-        """
-        this function will be used when calling re.sub to replace
-        each match with the appropriate gendered text
-        """
-        
-        toReturn           = ""
-        characterNumber    = matchInfo.group(1)
-        genderedOptions    = matchInfo.group(2).split('/')
-        
-        # double check that our characterNumber is a number
-        characterNumber    = "".join(characterNumber.split())
-        if characterNumber == "" :
-            print ("Unable to extract character number from text: " + matchInfo.group(1))
-            characterNumber = -1
-        else :
-            characterNumber = int(characterNumber)
-        
-        # if there's a "[" in the gendered text, something's gone wrong
-        if printWarnings and (matchInfo.group(2).find("[") >= 0) :
-            print("Unexpected [ character found inside phrase: " + matchInfo.group(0))
-            print("This may indicate a serious mark up text formatting error.")
-        
-        if characterNumber in genderDefs.keys() :
-            
-            # check if we have the number of gendered text options we expect
-            # based on the genders this character could be
-            expectedNumOptions = genderOrder[characterNumber].keys()
-            if (len(genderedOptions) != len(expectedNumOptions)) :
-                toReturn = matchInfo.group(0)
-                print("The gendered phrase (" + matchInfo.group(0) + ") does not have the expected "
-                      + "number of possible gender options for this character (" + str(len(expectedNumOptions)) + ").")
-                print("This phrase will not be parsed.")
-            else :
-            
-                # get the index we want based on the character's gender
-                tempIndex = get_gender_index (genderDefs[characterNumber], genderOrder[characterNumber])
-
-                #print("tempIndex: " + str(tempIndex))
-                #print("genderedOptions: " + str(genderedOptions))
-
-                # pull the gendered term
-                toReturn = genderedOptions[tempIndex].strip() #+ " " # TODO, why does this need an extra space?
-
-                # if we're printing warnings, check the appropriateness of the various terms
-                if printWarnings :
-
-                    for index in range(len(genderedOptions)) :
-                        term = genderedOptions[index].strip()
-                        if index in genderOrder[characterNumber].keys() :
-                            expectedGender = genderOrder[characterNumber][index].strip()
-                            check_gendered_term (term, expectedGender, matchInfo.group(0))
-            
-        else :
-            
-            toReturn = matchInfo.group(0)
-            if printWarnings :
-                print ("Warning, unable to find character number " + str(characterNumber)
-                       + " in character list. The following phrase will not be processed: " + toReturn)
+    return genderPlan.gender_text(inputText)
 
-        #print("Returning gendered text: \"" + str(toReturn) + "\"")
-
-        return toReturn
-    
-    outputText = re.sub(genderedWordPattern, cleanup_gender_fn, inputText, flags=re.DOTALL)
-    
-    return outputText
-
-def check_gendered_term (term, expectedGender, fullPhraseForPrinting=None) :
+def find_gender_mismatches (term, expectedGender) :
     """
-    check the gendered term given and print a warning
-    if it does not match the expected gender
+    return a sorted list of the genders (other than expectedGender)
+    that the term is more commonly used for, if any
     """
-    
-    for gender_key in sorted(POSSIBLE_PRONOUN_SETS.keys()) :
-        
-        if (gender_key != expectedGender) and (term in POSSIBLE_PRONOUN_SETS[gender_key]) :
-            
-            message = "WARNING: "
-            message = (message + "In the phrase \"" + fullPhraseForPrinting + "\", t") if (fullPhraseForPrinting is not None) else (message + "T")
-            message = (message +"he term \"" + term + "\" was given as a " + expectedGender + " term but is" + 
-                       " more commonly considered " + gender_key + ". You may wish to check if this is a typo.")
-            print (message)
 
+    return sorted(pronoun_sets.get_pronoun_sets().genders_for_word(term) - frozenset([expectedGender]))
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+"""
+This module watches a directory of character sheets and a gender list
+for changes, so the gendered sheets can be rebuilt as soon as they're saved.
+
+Changes are found with inotify where it's available (on Linux), and by
+checking the directories every so often everywhere else.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+import swap_util
+import sheet_cache
+import build_manifest
+from constants import *
+from swap_log import LOG
+
+# how long to wait after a change for any more changes before rebuilding,
+# so an editor saving several files (or one file in several steps) only
+# causes one rebuild
+DEFAULT_DEBOUNCE_SECONDS = 0.1
+# how often to check the directories when inotify isn't available
+DEFAULT_POLL_SECONDS     = 0.25
+
+# the inotify flags we use, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+# a file has only been saved once it's closed or moved into place
+INOTIFY_WATCH_MASK   = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+# the header of each inotify event: watch descriptor, mask, cookie, name length
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+INOTIFY_READ_SIZE    = 64 * 1024
+
+def _load_inotify () :
+    """
+    get the C library with the inotify functions in it,
+    or None if inotify isn't available here
+    """
+
+    library_name = ctypes.util.find_library("c")
+    if library_name is None :
+        return None
+
+    try :
+        libc = ctypes.CDLL(library_name, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError) :
+        return None
+
+    return libc
+
+class InotifyWatcher :
+    """
+    Watches some directories for files being saved, moved or deleted
+    using inotify (through the C library, with ctypes).
+    """
+
+    def __init__ (self, directories, libc) :
+
+        self.libc = libc
+        self.fd   = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0 :
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+
+        # watch descriptor: the directory it's watching
+        self.directories = { }
+        for directory in directories :
+            watch = libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_WATCH_MASK)
+            if watch < 0 :
+                error_number = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error_number, os.strerror(error_number), directory)
+            self.directories[watch] = directory
+
+    def wait_for_changes (self, timeout=None) :
+        """
+        wait up to timeout seconds (forever if timeout is None) for files
+        to change, and return the set of paths of the files that did (which
+        is empty if nothing changed before the timeout)
+        """
+
+        ready, _, _ = select.select([self.fd], [ ], [ ], timeout)
+        if not ready :
+            return set( )
+
+        try :
+            data = os.read(self.fd, INOTIFY_READ_SIZE)
+        except OSError as error :
+            if error.errno == errno.EAGAIN :
+                return set( )
+            raise
+
+        changed = set( )
+        offset  = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(data) :
+            watch, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name    = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+
+            # if too much happened for inotify to keep track of, anything could have changed
+            if mask & IN_Q_OVERFLOW :
+                for directory in self.directories.values() :
+                    changed.update([os.path.join(directory, file_name) for file_name in os.listdir(directory)])
+            elif name and (watch in self.directories) :
+                changed.add(os.path.join(self.directories[watch], os.fsdecode(name)))
+
+        return changed
+
+    def close (self) :
+
+        os.close(self.fd)
+
+class PollingWatcher :
+    """
+    Watches some directories for files being saved, moved or deleted by
+    checking the modification time and size of every file in them every
+    poll_seconds.
+    """
+
+    def __init__ (self, directories, poll_seconds=DEFAULT_POLL_SECONDS) :
+
+        self.directories  = list(directories)
+        self.poll_seconds = poll_seconds
+        self.snapshot     = self._take_snapshot()
+
+    def wait_for_changes (self, timeout=None) :
+        """
+        wait up to timeout seconds (forever if timeout is None) for files
+        to change, and return the set of paths of the files that did (which
+        is empty if nothing changed before the timeout)
+        """
+
+        end_time = None if timeout is None else time.monotonic() + timeout
+        while True :
+
+            snapshot      = self._take_snapshot()
+            changed       = set([path for path in snapshot if self.snapshot.get(path) != snapshot[path]])
+            changed.update([path for path in self.snapshot if path not in snapshot])
+            self.snapshot = snapshot
+            if changed :
+                return changed
+
+            if end_time is None :
+                time.sleep(self.poll_seconds)
+            else :
+                time_left = end_time - time.monotonic()
+                if time_left <= 0 :
+                    return set( )
+                time.sleep(min(self.poll_seconds, time_left))
+
+    def close (self) :
+
+        pass
+
+    def _take_snapshot (self) :
+        """
+        get the modification time and size of every file in the directories
+        """
+
+        snapshot = { }
+        for directory in self.directories :
+            for entry in os.scandir(directory) :
+                try :
+                    if entry.is_file() :
+                        info = entry.stat()
+                        snapshot[entry.path] = (info.st_mtime_ns, info.st_size)
+                except OSError :
+                    # the file went away while we were looking at it
+                    pass
+
+        return snapshot
+
+def make_watcher (directories, use_polling=False, poll_seconds=DEFAULT_POLL_SECONDS) :
+    """
+    make an InotifyWatcher for the directories if inotify is available
+    (and use_polling is False), otherwise a PollingWatcher
+    """
+
+    # a directory given twice would only get one inotify watch
+    directories = sorted(set([os.path.abspath(directory) for directory in directories]))
+
+    libc = None if use_polling else _load_inotify()
+    if libc is not None :
+        try :
+            watcher = InotifyWatcher(directories, libc)
+            LOG.debug("Watching for changes with inotify in: %s", ", ".join(directories))
+            return watcher
+        except OSError as error :
+            LOG.warning("Unable to watch for changes with inotify (%s), checking for them every %s seconds instead.",
+                        error, poll_seconds)
+
+    LOG.debug("Checking for changes every %s seconds in: %s", poll_seconds, ", ".join(directories))
+
+    return PollingWatcher(directories, poll_seconds=poll_seconds)
+
+def collect_changes (watcher, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS) :
+    """
+    wait for files to change, then keep collecting changes until there
+    haven't been any for debounce_seconds, and return the set of paths
+    of all the files that changed
+    """
+
+    changed = watcher.wait_for_changes()
+    while True :
+        more_changes = watcher.wait_for_changes(timeout=debounce_seconds)
+        if not more_changes :
+            return changed
+        changed.update(more_changes)
+
+class WatchBuilder :
+    """
+    Keeps the gendered sheets in an output directory up to date with the
+    sheets in an input directory and a gender list, rebuilding as little
+    as possible when they change.
+
+    A build_manifest.BuildManifest in the output directory records what
+    each output was built from, so a changed sheet whose text is the same
+    isn't rebuilt, and when the gender list changes only the sheets that
+    refer to characters whose genders changed are rebuilt. The content
+    hashes of the sheets are kept between rebuilds, so unchanged sheets
+    are never read again.
+    """
+
+    def __init__ (self, gender_list_path, input_path, output_path, process_file_names=False, sheet_cache=None) :
+
+        self.gender_list_path   = os.path.abspath(gender_list_path)
+        self.input_path         = os.path.abspath(input_path)
+        self.output_path        = output_path
+        self.process_file_names = process_file_names
+        self.sheet_cache        = sheet_cache
+        self.manifest           = build_manifest.BuildManifest(output_path)
+        # sheet path: content hash
+        self.sheet_hashes       = { }
+
+        self.gender_defs        = None
+        self.gender_ordering    = None
+        self.gender_plan        = None
+        self.load_gender_list()
+
+    def load_gender_list (self) :
+        """
+        parse the gender list and build a new gender plan from it
+        """
+
+        LOG.info("Opening and parsing gender list: %s", self.gender_list_path)
+        gender_list_file = open(self.gender_list_path, "r")
+        try :
+            gender_defs, gender_ordering = swap_util.parse_genderlist_file(gender_list_file.readlines())
+        finally :
+            gender_list_file.close()
+
+        self.gender_defs, self.gender_ordering = gender_defs, gender_ordering
+        self.gender_plan = swap_util.GenderPlan(gender_defs, gender_ordering)
+
+    def is_sheet (self, sheet_path) :
+        """
+        check whether the file at sheet_path is a sheet that should be gendered
+        (the same sheets the swap command would gender)
+        """
+
+        file_name   = os.path.basename(sheet_path)
+        number      = file_name.split('.')[0]
+        _, fileType = os.path.splitext(file_name)
+
+        return ( (os.path.dirname(os.path.abspath(sheet_path)) == self.input_path) and
+                 number.isdigit() and (int(number) in self.gender_defs) and
+                 (fileType in POSSIBLE_FILE_TYPES) and os.path.isfile(sheet_path) )
+
+    def build_all (self) :
+        """
+        bring every sheet's output up to date and remove any outputs whose
+        sheets are gone
+
+        sheets whose contents were already hashed are assumed not to have
+        changed (changed sheets come through handle_changes), so they aren't
+        read again unless their outputs need to be rebuilt
+
+        returns the number of sheets that were rebuilt
+        """
+
+        # start a new build, so the outputs that are still current can be told from the stale ones
+        self.manifest.current_names = set( )
+
+        rebuilt_count = 0
+        failed        = False
+        for file_name in sorted(os.listdir(self.input_path)) :
+            sheet_path = os.path.join(self.input_path, file_name)
+            if self.is_sheet(sheet_path) :
+                rebuilt = self._try_build_sheet(sheet_path, changed=False)
+                failed  = failed or (rebuilt is None)
+                if rebuilt :
+                    rebuilt_count += 1
+
+        # a failed sheet's old output doesn't count as stale
+        if not failed :
+            self.manifest.remove_stale_outputs()
+        self.manifest.save()
+
+        return rebuilt_count
+
+    def build_sheet (self, sheet_path, changed=True) :
+        """
+        rebuild one sheet's output if it isn't up to date (if changed is
+        False the sheet's text is assumed to be the same as last time)
+
+        returns True if the sheet was rebuilt
+        """
+
+        if changed or (sheet_path not in self.sheet_hashes) :
+            self.sheet_hashes[sheet_path] = sheet_cache.hash_sheet_file(sheet_path)
+
+        output_name = os.path.basename(swap_util.get_output_sheet_path(sheet_path, self.output_path,
+                                                                       self.gender_defs, self.gender_ordering,
+                                                                       process_file_names=self.process_file_names,
+                                                                       gender_plan=self.gender_plan))
+
+        # a gendered file name can change along with the character's gender
+        self.manifest.remove_outputs_for_source(sheet_path, keep_name=output_name)
+
+        if self.manifest.is_up_to_date(output_name, sheet_path, self.sheet_hashes[sheet_path], self.gender_plan) :
+            return False
+
+        character_numbers = swap_util.process_one_file(sheet_path, self.output_path,
+                                                       self.gender_defs, self.gender_ordering,
+                                                       process_file_names=self.process_file_names,
+                                                       gender_plan=self.gender_plan,
+                                                       sheet_cache=self.sheet_cache,
+                                                       output_name=output_name)
+        self.manifest.record(output_name, sheet_path, self.sheet_hashes[sheet_path], character_numbers, self.gender_plan)
+
+        return True
+
+    def handle_changes (self, changed_paths) :
+        """
+        rebuild whatever needs it after the files at changed_paths have
+        been saved, moved or deleted
+
+        returns the number of sheets that were rebuilt
+        """
+
+        changed_paths = set([os.path.abspath(path) for path in changed_paths])
+
+        # a new gender list can change any sheet, but the manifest will
+        # skip the ones that don't refer to characters whose genders changed
+        if self.gender_list_path in changed_paths :
+            if not os.path.exists(self.gender_list_path) :
+                LOG.warning("The gender list is gone, waiting for it to come back: %s", self.gender_list_path)
+                return 0
+            try :
+                self.load_gender_list()
+            except Exception :
+                LOG.exception("Unable to parse the gender list, keeping the last version of it: %s",
+                              self.gender_list_path)
+                return 0
+            for sheet_path in list(self.sheet_hashes.keys()) :
+                if sheet_path in changed_paths :
+                    del self.sheet_hashes[sheet_path]
+            return self._rebuild(self.build_all)
+
+        def rebuild_changed_sheets () :
+
+            rebuilt_count = 0
+            for sheet_path in sorted(changed_paths) :
+                if self.is_sheet(sheet_path) :
+                    if self._try_build_sheet(sheet_path, changed=True) :
+                        rebuilt_count += 1
+                elif not os.path.exists(sheet_path) :
+                    self.sheet_hashes.pop(sheet_path, None)
+                    self.manifest.remove_outputs_for_source(sheet_path)
+            self.manifest.save()
+            return rebuilt_count
+
+        return self._rebuild(rebuild_changed_sheets)
+
+    def _try_build_sheet (self, sheet_path, changed=True) :
+        """
+        rebuild one sheet's output if it isn't up to date, logging any
+        problem rather than letting it stop us from watching (a sheet can
+        be caught half way through being saved)
+
+        returns True if the sheet was rebuilt, False if it was already
+        up to date, or None if it couldn't be built (see build_sheet
+        for changed)
+        """
+
+        try :
+            return self.build_sheet(sheet_path, changed=changed)
+        except Exception :
+            LOG.exception("FAILED: %s", sheet_path)
+            # make sure it's read again next time
+            self.sheet_hashes.pop(sheet_path, None)
+            return None
+
+    def _rebuild (self, rebuild_function) :
+        """
+        call rebuild_function, logging how long it took, and return
+        the number of sheets it rebuilt
+        """
+
+        start_time    = time.monotonic()
+        rebuilt_count = rebuild_function()
+        if rebuilt_count > 0 :
+            LOG.info("Rebuilt %d sheets in %.2f seconds.", rebuilt_count, time.monotonic() - start_time)
+
+        return rebuilt_count
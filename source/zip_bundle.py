@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+This module writes gendered sheets straight into zip files as they're
+rendered, so a whole casting (or a character's sheets) can be sent to
+players without saving a directory of sheets and zipping it afterwards.
+
+Each sheet is streamed into its member of the zip a chunk at a time. When a
+thread pool is given, the members are compressed a block at a time in the
+pool while the next part of the sheet is being gendered; each block is
+compressed on its own and ended on a byte boundary, so the blocks can just
+be joined together into one deflate stream.
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import zlib
+import codecs
+import locale
+import zipfile
+import collections
+
+import zip_sheet
+import atomic_output
+
+# how much of a member to collect before compressing it in the thread pool
+BUNDLE_BLOCK_SIZE        = 256 * 1024
+# how many blocks can be waiting to be compressed before
+# gendering waits for the pool to catch up
+BUNDLE_MAX_QUEUED_BLOCKS = 16
+# how hard to compress the members in the thread pool (the same
+# as zlib's default, which the zip module uses)
+BUNDLE_COMPRESS_LEVEL    = 6
+
+def deflate_block (data, level=BUNDLE_COMPRESS_LEVEL, final=False) :
+    """
+    compress one block of a member as raw deflate data; every block but the
+    last (final) one ends on a byte boundary without finishing the stream,
+    so the compressed blocks can be joined together in order
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class ZipBundle :
+    """
+    A zip file of gendered sheets, saved with atomic_output (so it's only
+    moved into place once it's complete, see close).
+
+    Add each sheet with open_member and write its text (or bytes) to the
+    member that's returned; only one member can be open at a time. If an
+    executor (a concurrent.futures thread pool) is given, the members are
+    compressed in it, and a finished member waits in a queue (so the next
+    one can be started) until it's been compressed and written to the zip
+    file. Text is encoded with the encoding the sheets would be saved with.
+    """
+
+    def __init__ (self, path, executor=None, encoding=None) :
+
+        self.path     = path
+        self.executor = executor
+        self.encoding = locale.getpreferredencoding(False) if encoding is None else encoding
+
+        self.output   = atomic_output.AtomicOutputFile(path, "wb")
+        self.zip      = zipfile.ZipFile(self.output.file, "w", compression=zipfile.ZIP_DEFLATED)
+
+        # the blocks being compressed in the pool, oldest first, and the
+        # finished members waiting to be written to the zip file, in order
+        self.in_flight = collections.deque()
+        self.queued    = collections.deque()
+
+    def open_member (self, name, source_path=None, compress=True) :
+        """
+        start a new member of the zip file named name (with the modification
+        time and permissions of the file at source_path, if it's given), and
+        return a BundleMember to write it with
+
+        compress should be False for sheets that are already compressed
+        (like .docx and .odt files), which are stored as they are.
+        """
+
+        if source_path is not None :
+            info = zipfile.ZipInfo.from_file(source_path, arcname=name)
+        else :
+            info = zipfile.ZipInfo(name)
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+
+        return BundleMember(self, info)
+
+    def close (self) :
+        """
+        finish the zip file and move it into place
+        """
+
+        self._write_queued(wait=True)
+        self.zip.close()
+        self.output.close()
+
+    def discard (self) :
+        """
+        throw away the zip file without touching the file at path
+        """
+
+        self.output.discard()
+
+    def _compress (self, data, final) :
+        """
+        start compressing a block in the pool, waiting for the oldest
+        block to be done first if too many are waiting already
+        """
+
+        while self.in_flight and self.in_flight[0].done() :
+            self.in_flight.popleft()
+        if len(self.in_flight) >= BUNDLE_MAX_QUEUED_BLOCKS :
+            self.in_flight.popleft().result()
+
+        future = self.executor.submit(deflate_block, data, BUNDLE_COMPRESS_LEVEL, final)
+        self.in_flight.append(future)
+
+        return future
+
+    def _write_queued (self, wait) :
+        """
+        write the finished members that have been compressed to the zip
+        file, in order (if wait is True, wait for all of them)
+        """
+
+        while self.queued :
+            if not (wait or self.queued[0].is_compressed()) :
+                break
+            self.queued.popleft()._write_raw()
+
+class BundleMember :
+    """
+    One member of a ZipBundle being written. It can be written to like a file
+    (with str or bytes) and has to be closed to finish the member.
+    """
+
+    def __init__ (self, bundle, info) :
+
+        self.bundle  = bundle
+        self.info    = info
+        self.encoder = codecs.getincrementalencoder(bundle.encoding)()
+
+        if bundle.executor is None :
+            # the zip module compresses the member as it's written
+            self.stream  = bundle.zip.open(info, "w")
+        else :
+            self.stream       = None
+            self.pending      = [ ]
+            self.pending_size = 0
+            self.blocks       = [ ]
+            self.crc          = 0
+            self.size         = 0
+
+    def write (self, data) :
+
+        written = len(data)
+        if isinstance(data, str) :
+            data = self.encoder.encode(data)
+        if not data :
+            return written
+
+        if self.stream is not None :
+            self.stream.write(data)
+            return written
+
+        self.crc           = zlib.crc32(data, self.crc)
+        self.size         += len(data)
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= BUNDLE_BLOCK_SIZE :
+            self._compress_pending(final=False)
+
+        return written
+
+    def flush (self) :
+
+        pass
+
+    def close (self) :
+        """
+        finish the member
+        """
+
+        self.write(self.encoder.encode("", final=True))
+
+        if self.stream is not None :
+            self.stream.close()
+            return
+
+        self._compress_pending(final=True)
+        self.bundle.queued.append(self)
+        self.bundle._write_queued(wait=False)
+
+    def is_compressed (self) :
+        """
+        check whether all of a finished member's blocks have been compressed
+        """
+
+        return all([isinstance(block, bytes) or block.done() for block in self.blocks])
+
+    def _write_raw (self) :
+        """
+        write a finished member to the zip file once its blocks are compressed
+        """
+
+        blocks = [block if isinstance(block, bytes) else block.result() for block in self.blocks]
+
+        self.info.CRC           = self.crc
+        self.info.file_size     = self.size
+        self.info.compress_size = sum([len(block) for block in blocks])
+        zip_sheet.write_zip_member_raw(self.bundle.zip, self.info, blocks)
+
+    def _compress_pending (self, final) :
+        """
+        hand the data collected so far to the thread pool to be compressed
+        (or if the member isn't being compressed, keep it as it is)
+        """
+
+        data              = b"".join(self.pending)
+        self.pending      = [ ]
+        self.pending_size = 0
+
+        if self.info.compress_type == zipfile.ZIP_STORED :
+            self.blocks.append(data)
+        else :
+            self.blocks.append(self.bundle._compress(data, final))
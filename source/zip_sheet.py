@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""
+This module handles word processor documents that are zip archives of
+xml files (.docx and .odt), so the gender swap tool can gender the
+document text without unpacking the archive or touching anything else
+in it (like pictures and styles).
+
+Copyright Eva Schiffer 2015
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+import copy
+import html
+import struct
+import zipfile
+
+# each piece of an xml document is one of these, matched in a single pass
+XML_PIECE_PATTERN = re.compile(r"""
+      <!--.*?-->                                      # a comment
+    | <!\[CDATA\[.*?\]\]>                             # a cdata section
+    | <[?!][^>]*>                                     # a declaration or processing instruction
+    | </(?P<end>[^\s>]+)\s*>                          # an end tag
+    | <(?P<start>[^\s/>]+)[^>]*?(?P<empty>/)?>        # a start tag or an empty element
+    | &[^;<&]*;                                       # an entity or character reference
+    | [^<&]+                                          # character data
+    | [<&]                                            # a stray < or &
+    """, re.VERBOSE | re.DOTALL)
+
+# the size of the fixed part of the header before each file in a zip archive
+ZIP_LOCAL_HEADER_SIZE = 30
+# how much of an archive member to copy at a time
+ZIP_COPY_BLOCK_SIZE   = 1024 * 1024
+
+class XmlLexer :
+    """
+    Splits the xml of a word processor document into
+    (raw text, visible text) pieces.
+
+    The visible text is the character data inside the elements that hold
+    the document's text (TEXT_ELEMENTS), with entities replaced by the
+    characters they stand for; tags, and text inside HIDDEN_ELEMENTS, have
+    no visible text. Empty elements that stand for text (like tabs) are
+    looked up in EMPTY_ELEMENT_TEXT when they're inside CONTENT_ELEMENTS.
+    Elements are matched by their usual namespace prefix.
+
+    The raw text of all the pieces joined together is the text that was
+    given, except for start tags listed in START_TAG_REWRITES, which are
+    replaced with their rewritten version.
+
+    If text_only is True the pieces are only going to be read, never
+    written back out, so the end of each of the PARAGRAPH_ELEMENTS has a
+    line break as its visible text.
+
+    Text can be fed in a chunk at a time; anything at the end of a chunk
+    that isn't finished (like half of a tag) is held back until the next
+    chunk or close.
+    """
+
+    TEXT_ELEMENTS      = frozenset( )
+    CONTENT_ELEMENTS   = frozenset( )
+    HIDDEN_ELEMENTS    = frozenset( )
+    PARAGRAPH_ELEMENTS = frozenset( )
+    EMPTY_ELEMENT_TEXT = { }
+    START_TAG_REWRITES = { }
+
+    def __init__ (self, text_only=False) :
+
+        self.text_only     = text_only
+        self.carry         = ""
+        self.text_depth    = 0
+        self.content_depth = 0
+        self.hidden_depth  = 0
+
+    def feed (self, text) :
+        """
+        split more of the document into pieces, returning a list of them
+        """
+
+        text = self.carry + text
+
+        # hold back anything that might not be finished yet
+        end = len(text)
+        for opening, closing in (("<", ">"), ("<!--", "-->"), ("<![CDATA[", "]]>"), ("&", ";")) :
+            start = text.rfind(opening, 0, end)
+            if (start >= 0) and (text.find(closing, start + 1) < 0) :
+                end = start
+
+        self.carry = text[end:]
+
+        return self._get_pieces(text[:end])
+
+    def close (self) :
+        """
+        finish the document, returning a list of any pieces that were held back
+        """
+
+        text       = self.carry
+        self.carry = ""
+
+        return self._get_pieces(text)
+
+    def kept_raw (self, raw) :
+        """
+        the raw text to use for a piece with no visible text when it's
+        kept as part of a gendered phrase that's been rewritten
+        """
+
+        return raw
+
+    def _get_pieces (self, text) :
+        """
+        split some text into pieces, keeping track
+        of the elements we're in along the way
+        """
+
+        pieces = [ ]
+        for matchInfo in XML_PIECE_PATTERN.finditer(text) :
+
+            raw     = matchInfo.group(0)
+            visible = ""
+
+            if matchInfo.group("end") is not None :
+                self._count_element(matchInfo.group("end"), -1)
+                if self.text_only and (matchInfo.group("end") in self.PARAGRAPH_ELEMENTS) and (self.hidden_depth <= 0) :
+                    visible = "\n"
+
+            elif matchInfo.group("start") is not None :
+                name = matchInfo.group("start")
+                if matchInfo.group("empty") is not None :
+                    if (self.content_depth > 0) and (self.hidden_depth <= 0) :
+                        visible = self.EMPTY_ELEMENT_TEXT.get(name, "")
+                else :
+                    self._count_element(name, 1)
+                    raw = self.START_TAG_REWRITES.get(raw, raw)
+
+            elif raw[0] == "<" and len(raw) > 1 :
+                # comments, declarations, etc. aren't part of the text
+                pass
+
+            elif (self.text_depth > 0) and (self.hidden_depth <= 0) :
+                visible = html.unescape(raw) if raw.startswith("&") else raw
+
+            pieces.append((raw, visible))
+
+        return pieces
+
+    def _count_element (self, name, change) :
+        """
+        note that we've gone into (change is 1) or come out of
+        (change is -1) an element with the given name
+        """
+
+        if name in self.TEXT_ELEMENTS :
+            self.text_depth    += change
+        if name in self.CONTENT_ELEMENTS :
+            self.content_depth += change
+        if name in self.HIDDEN_ELEMENTS :
+            self.hidden_depth  += change
+
+class DocxLexer (XmlLexer) :
+    """
+    Splits the xml parts of a Word (.docx) document into pieces.
+
+    All the text is in <w:t> elements inside runs (<w:r>). Word leaves off
+    xml:space="preserve" when the text in an element doesn't start or end
+    with a space, and gendering a phrase can leave a space there, so it's
+    added to every <w:t> tag (which doesn't change how the text is shown).
+    """
+
+    TEXT_ELEMENTS      = frozenset(["w:t"])
+    CONTENT_ELEMENTS   = frozenset(["w:r"])
+    PARAGRAPH_ELEMENTS = frozenset(["w:p"])
+    EMPTY_ELEMENT_TEXT = {
+                             "w:tab"            : "\t",
+                             "w:br"             : "\n",
+                             "w:cr"             : "\n",
+                             "w:noBreakHyphen"  : "\u2011",
+                         }
+    START_TAG_REWRITES = {
+                             "<w:t>" : "<w:t xml:space=\"preserve\">",
+                         }
+
+class OdtLexer (XmlLexer) :
+    """
+    Splits the xml parts of an OpenDocument (.odt) document into pieces.
+
+    The text is the character data in paragraphs and headings, other than
+    annotations and the record of tracked changes.
+    """
+
+    TEXT_ELEMENTS      = frozenset(["text:p", "text:h"])
+    CONTENT_ELEMENTS   = frozenset(["text:p", "text:h"])
+    HIDDEN_ELEMENTS    = frozenset(["office:annotation", "text:tracked-changes"])
+    PARAGRAPH_ELEMENTS = frozenset(["text:p", "text:h"])
+    EMPTY_ELEMENT_TEXT = {
+                             "text:s"          : " ",
+                             "text:tab"        : "\t",
+                             "text:line-break" : "\n",
+                         }
+
+# file type: (pattern matching the names of the archive members with
+#             document text in them, lexer class for those members)
+ZIP_SHEET_PARTS = {
+                      ".docx" : (re.compile(r"word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$"), DocxLexer),
+                      ".odt"  : (re.compile(r"(content|styles)\.xml$"),                                       OdtLexer),
+                  }
+
+def strip_zip64_extra (extra) :
+    """
+    remove any zip64 information from the extra data of an archive member
+    (the zip module adds its own when it's needed)
+    """
+
+    kept  = [ ]
+    index = 0
+    while index + 4 <= len(extra) :
+        field_id, field_size = struct.unpack("<HH", extra[index:index + 4])
+        if field_id != 0x0001 :
+            kept.append(extra[index:index + 4 + field_size])
+        index += 4 + field_size
+
+    return b"".join(kept)
+
+def get_rewritten_info (info) :
+    """
+    make a copy of the information about an archive member that can be
+    used to write a new version of it with zipfile.ZipFile.open
+    """
+
+    new_info       = copy.copy(info)
+    new_info.extra = strip_zip64_extra(info.extra)
+
+    return new_info
+
+def copy_zip_member_raw (source_zip, info, dest_zip) :
+    """
+    copy one member of the open zipfile.ZipFile source_zip, described by the
+    zipfile.ZipInfo info, into dest_zip (opened for writing) exactly as it's
+    stored, without decompressing it and compressing it again
+    """
+
+    # find the start of the stored data after the member's header
+    source_file = source_zip.fp
+    source_file.seek(info.header_offset)
+    header = source_file.read(ZIP_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source_file.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    def iter_blocks () :
+        remaining = info.compress_size
+        while remaining > 0 :
+            block = source_file.read(min(remaining, ZIP_COPY_BLOCK_SIZE))
+            if not block :
+                raise EOFError("Archive member is shorter than expected: " + info.filename)
+            yield block
+            remaining -= len(block)
+
+    write_zip_member_raw(dest_zip, get_rewritten_info(info), iter_blocks())
+
+def write_zip_member_raw (dest_zip, info, blocks) :
+    """
+    write one member into dest_zip (a zipfile.ZipFile opened for writing)
+    from blocks of data that are already compressed the way info says
+    (info's CRC, file_size and compress_size have to be filled in already)
+
+    The zip module has no way to do this itself, so this writes the member's
+    header and data directly and then records it the same way the zip
+    module does for members it writes.
+    """
+
+    # the sizes will be in the header, so there's no descriptor after the data
+    info.flag_bits &= ~0x08
+
+    dest_file = dest_zip.fp
+    if dest_zip._seekable :
+        dest_file.seek(dest_zip.start_dir)
+    info.header_offset = dest_file.tell()
+    dest_file.write(info.FileHeader((info.compress_size > zipfile.ZIP64_LIMIT) or
+                                    (info.file_size     > zipfile.ZIP64_LIMIT)))
+
+    for block in blocks :
+        dest_file.write(block)
+
+    dest_zip.start_dir  = dest_file.tell()
+    dest_zip._didModify = True
+    dest_zip.filelist.append(info)
+    dest_zip.NameToInfo[info.filename] = info